@@ -0,0 +1,120 @@
+import threading
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from dataset_tools import iter_dataset_findings, prepare_dataset_for_training
+from disagreement import collect_predictions
+from image_pyramid import ImagePyramid
+
+
+class ValidationWorker(QThread):
+    """Thread validating the dataset in the background, findings and progress are emitted as they come"""
+    findings_found = pyqtSignal(list)
+    progress_changed = pyqtSignal(int, int)
+    validation_failed = pyqtSignal(str)
+
+    def __init__(self, dataset_path: str):
+        super().__init__()
+        self.dataset_path = dataset_path
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        try:
+            for findings in iter_dataset_findings(self.dataset_path, progress_handler=self.progress_changed.emit,
+                                                  cancel_event=self.cancel_event):
+                self.findings_found.emit(findings)
+        except Exception as error:
+            self.validation_failed.emit(str(error))
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class TrainingPreparationWorker(QThread):
+    """Thread dividing and copying the dataset for training in the background, the dataset index given (a snapshot
+    for this thread) is closed at the end"""
+    progress_changed = pyqtSignal(object)
+    preparation_failed = pyqtSignal(str)
+
+    def __init__(self, dataset_path: str, training_directory: str, yaml_path: str, train_prop, dataset_index=None,
+                 duplicate_distance: int = None):
+        super().__init__()
+        self.dataset_index = dataset_index
+        self.duplicate_distance = duplicate_distance
+        self.dataset_path = dataset_path
+        self.training_directory = training_directory
+        self.yaml_path = yaml_path
+        self.train_prop = train_prop
+        self.cancel_event = threading.Event()
+        self.result = None
+
+    def run(self):
+        try:
+            self.result = prepare_dataset_for_training(self.dataset_path, self.training_directory, self.yaml_path,
+                                                       self.train_prop, progress_handler=self.progress_changed.emit,
+                                                       cancel_event=self.cancel_event,
+                                                       dataset_index=self.dataset_index,
+                                                       duplicate_distance=self.duplicate_distance)
+        except Exception as error:
+            self.preparation_failed.emit(str(error))
+        finally:
+            if self.dataset_index is not None:
+                self.dataset_index.close()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class ModelLoadingWorker(QThread):
+    """Thread importing the model backend and loading the model in the background"""
+    loading_failed = pyqtSignal(str)
+
+    def __init__(self, fine_tuner, model_path: str):
+        super().__init__()
+        self.fine_tuner = fine_tuner
+        self.model_path = model_path
+
+    def run(self):
+        try:
+            self.fine_tuner.set_model(self.model_path)
+        except Exception as error:
+            self.loading_failed.emit(str(error))
+
+
+class PredictionWorker(QThread):
+    """Thread running the loaded model over the whole dataset, for the disagreement ranking"""
+    progress_changed = pyqtSignal(int, int)
+
+    def __init__(self, fine_tuner, dataset_path: str, image_files: list[str]):
+        super().__init__()
+        self.fine_tuner = fine_tuner
+        self.dataset_path = dataset_path
+        self.image_files = image_files
+        self.cancel_event = threading.Event()
+        self.result = None
+
+    def run(self):
+        self.result = collect_predictions(self.fine_tuner, self.dataset_path, self.image_files,
+                                          progress_handler=self.progress_changed.emit,
+                                          cancel_event=self.cancel_event)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class FullResolutionWorker(QThread):
+    """Thread decoding the full resolution image through the image cache and building its pyramid, for zooming in.
+    result stays None if the image can't be decoded or has no more pixels than min_width"""
+
+    def __init__(self, image_cache, image_path: str, max_size: tuple[int, int], min_width: int):
+        super().__init__()
+        self.image_cache = image_cache
+        self.image_path = image_path
+        self.max_size = max_size
+        self.min_width = min_width
+        self.result = None
+
+    def run(self):
+        image = self.image_cache.get(self.image_path, self.max_size)
+        if image is not None and image.shape[1] > self.min_width:
+            self.result = ImagePyramid(image)
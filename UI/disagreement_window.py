@@ -0,0 +1,165 @@
+from typing import Callable
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QProgressBar, QPushButton, QTableView, \
+    QDoubleSpinBox, QAbstractItemView, QHeaderView
+
+from UI.background_workers import PredictionWorker
+
+from disagreement import Disagreement, rank_disagreements
+from label_cache import load_label_cache
+
+COLUMNS = ("Image", "Score", "Missed", "Extra", "Class", "Low IOU", "Mean IOU")
+
+
+class DisagreementTableModel(QAbstractTableModel):
+    """Table model over the ranked disagreements, only the visible rows are formatted"""
+
+    def __init__(self):
+        super().__init__()
+        self.disagreements = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.disagreements)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        disagreement = self.disagreements[index.row()]
+        value = (disagreement.image, disagreement.score, disagreement.missed, disagreement.extra,
+                 disagreement.class_mismatches, disagreement.low_iou, disagreement.mean_iou)[index.column()]
+        return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+    def headerData(self, section: int, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def set_disagreements(self, disagreements: list[Disagreement]):
+        self.beginResetModel()
+        self.disagreements = disagreements
+        self.endResetModel()
+
+
+class DisagreementWindow(QWidget):
+    """Window ranking the images by how much their labels disagree with the detections of the loaded model. The
+    model is run over the dataset when the window opens, changing the thresholds or refreshing after the labels were
+    edited only ranks the saved detections again. Double-clicking an image shows it in the main window"""
+
+    def __init__(self, dataset_path: str, fine_tuner, image_files: list[str],
+                 image_labels: Callable[[], dict[str, str | None]], open_image: Callable[[str], None]):
+        super().__init__()
+        self.dataset_path = dataset_path
+        self.fine_tuner = fine_tuner
+        self.image_files = image_files
+        self.image_labels = image_labels
+        self.open_image = open_image
+        self.predictions = None
+        self.worker = None
+
+        self.setWindowTitle("Label disagreements")
+        self.layout_setup()
+
+        self.run_model()
+        self.show()
+
+    def layout_setup(self):
+        """Set up the layout of the UI"""
+        box_layout = QVBoxLayout()
+
+        self.status_label = QLabel("")
+        self.progress_bar = QProgressBar()
+
+        thresholds_layout = QHBoxLayout()
+        self.score_threshold_spin_box = self.threshold_spin_box(0.5)
+        self.match_iou_spin_box = self.threshold_spin_box(0.5)
+        self.good_iou_spin_box = self.threshold_spin_box(0.75)
+        for name, spin_box in (("Score", self.score_threshold_spin_box), ("Match IOU", self.match_iou_spin_box),
+                               ("Good IOU", self.good_iou_spin_box)):
+            thresholds_layout.addWidget(QLabel(name))
+            thresholds_layout.addWidget(spin_box)
+
+        self.table_model = DisagreementTableModel()
+        self.table_view = QTableView()
+        self.table_view.setModel(self.table_model)
+        self.table_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table_view.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table_view.doubleClicked.connect(
+            lambda index: self.open_image(self.table_model.disagreements[index.row()].image))
+
+        buttons_layout = QHBoxLayout()
+        self.refresh_button = QPushButton("Refresh")
+        self.refresh_button.clicked.connect(self.rank)
+        self.run_model_button = QPushButton("Run model")
+        self.run_model_button.clicked.connect(self.run_model)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel)
+        self.cancel_button.setEnabled(False)
+        buttons_layout.addWidget(self.refresh_button)
+        buttons_layout.addWidget(self.run_model_button)
+        buttons_layout.addWidget(self.cancel_button)
+
+        box_layout.addWidget(self.status_label)
+        box_layout.addWidget(self.progress_bar)
+        box_layout.addLayout(thresholds_layout)
+        box_layout.addWidget(self.table_view)
+        box_layout.addLayout(buttons_layout)
+        self.setLayout(box_layout)
+        self.resize(700, 600)
+
+    def threshold_spin_box(self, value: float) -> QDoubleSpinBox:
+        spin_box = QDoubleSpinBox()
+        spin_box.setRange(0.05, 1.0)
+        spin_box.setSingleStep(0.05)
+        spin_box.setValue(value)
+        spin_box.valueChanged.connect(self.rank)
+        return spin_box
+
+    def run_model(self):
+        """Runs the model over the images in the background, only new and modified images are run again"""
+        self.status_label.setText("Running the model...")
+        self.refresh_button.setEnabled(False)
+        self.run_model_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.worker = PredictionWorker(self.fine_tuner, self.dataset_path, self.image_files)
+        self.worker.progress_changed.connect(self.update_progress)
+        self.worker.finished.connect(self.model_finished)
+        self.worker.start()
+
+    def update_progress(self, done: int, total: int):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    def model_finished(self):
+        self.predictions = self.worker.result
+        self.worker = None
+        self.refresh_button.setEnabled(True)
+        self.run_model_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.rank()
+
+    def rank(self):
+        """Ranks the saved detections against the current labels with the chosen thresholds"""
+        if self.predictions is None or self.worker is not None:
+            return
+        disagreements = rank_disagreements(self.predictions, load_label_cache(self.dataset_path), self.image_labels(),
+                                           self.score_threshold_spin_box.value(), self.match_iou_spin_box.value(),
+                                           self.good_iou_spin_box.value())
+        self.table_model.set_disagreements(disagreements)
+        disagreeing = sum(disagreement.score > 0 for disagreement in disagreements)
+        self.status_label.setText(f"{disagreeing} of {len(disagreements)} images disagree with the model")
+
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def closeEvent(self, event):
+        """Stopping the model before closing"""
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        event.accept()
@@ -1,60 +1,101 @@
 import cv2
-from numpy import ndarray
+from numpy import ndarray, array, full, int32, stack, uint8, unique
 
 from PyQt6.QtCore import Qt, QEvent
 from PyQt6.QtWidgets import QLabel, QWidget
-from PyQt6.QtGui import QMouseEvent
-from matplotlib.backend_bases import MouseButton
+from PyQt6.QtGui import QMouseEvent, QPixmap, QImage
 
-from tools import q_pixmap_from_cv_img
+from tools import fit_image_size
+from image_cache import ImageCache
+from image_pyramid import ImagePyramid
+from latency_tracker import timed
+from UI.background_workers import FullResolutionWorker
 
-from label_tools import Label, label_from_coords, coords_from_label
+from label_tools import Label, LabelStore, label_from_coords, coords_from_label, coords_from_store
+
+# Bounds the memory taken by the zoomed image to about 200 MB, larger images are shrunk to fit
+FULL_RESOLUTION_MAX_SIZE = (8192, 8192)
+
+
+@timed("pixmap_conversion")
+def q_pixmap_from_cv_img(cv_img: ndarray) -> QPixmap:
+    """Convert numpy.ndarray to QPixmap
+    :arg cv_img: cv2 image (numpy.ndarray) in BGR format
+    :returns: PyQt6 QPixmap"""
+    height, width, channel = cv_img.shape
+    bytes_per_line = 3 * width
+    q_image = QImage(cv_img.data, width, height, bytes_per_line, QImage.Format.Format_BGR888)
+    return QPixmap.fromImage(q_image)
+
+
+def placeholder_image(size: tuple[int, int], text: str) -> ndarray:
+    """Grey image of the given size (width, height) with the text in the middle, shown instead of an image that can't
+    be read
+    :returns: cv2 image (numpy.ndarray) in BGR format"""
+    width, height = max(size[0], 1), max(size[1], 1)
+    image = full((height, width, 3), 200, dtype=uint8)
+    (text_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
+    cv2.putText(image, text, ((width - text_width) // 2, (height + text_height) // 2), cv2.FONT_HERSHEY_SIMPLEX, 1,
+                (0, 0, 200), 2)
+    return image
 
 
 class InteractiveImage(QLabel):
     """QLabel containing the image, used to easily determine the mouse click position in relation to the image,
-    allows for zooming"""
+    allows for zooming and panning (drag with the right mouse button)"""
 
-    def __init__(self, rect_drawn_handler, zoom_handler):
+    def __init__(self, rect_drawn_handler, zoom_handler, image_cache: ImageCache):
         super().__init__()
         self.ori_image = None
         self.image = None
         self.temp_image = None
+        self.pyramid = None
+        self.image_cache = image_cache
+        self.full_resolution_path = None
+        self.full_resolution_requested = False
+        self.full_resolution_worker = None
+        self.labels = None
+        self.class_colours = None
         self.rect_drawn_handler = rect_drawn_handler
         self.zoom_handler = zoom_handler
         self.drawing_mode = False
         self.interactive_mode = False
         self.start_point = None
+        self.pan_start = None
         self.image_size = [0, 0]  # [width, height]
+        self.view_offset = [0, 0]  # [x, y] of the visible part, in zoomed image pixels
         self.zoom_factor = 1
 
         self.setAlignment(Qt.AlignmentFlag.AlignTop)
 
     def preprocess_image(self, image: ndarray):
         """Resize the image to fit inside the label"""
-        new_image_height, new_image_width = list(image.shape[:2])
-
-        if new_image_height > self.size().height():
-            new_image_width = int(new_image_width / (new_image_height / self.size().height()))
-            new_image_height = self.size().height()
+        image_height, image_width = image.shape[:2]
+        new_image_width, new_image_height = fit_image_size(image_width, image_height,
+                                                           self.size().width(), self.size().height())
+        self.image_size = new_image_width, new_image_height
 
-        if new_image_width > self.size().width():
-            new_image_height = int(new_image_height / (new_image_width / self.size().width()))
-            new_image_width = self.size().width()
+        # Images coming from the image cache are already fitted
+        if (new_image_width, new_image_height) == (image_width, image_height):
+            return image
+        return cv2.resize(src=image, dsize=(new_image_width, new_image_height))
 
-        image_resized = cv2.resize(src=image, dsize=(new_image_width, new_image_height))
-        self.image_size = new_image_width, new_image_height
-        return image_resized
+    def image_point(self, widget_point) -> list[int]:
+        """Translates a point of the widget into the point of the unzoomed image"""
+        return [int((widget_point[0] + self.view_offset[0]) / self.zoom_factor),
+                int((widget_point[1] + self.view_offset[1]) / self.zoom_factor)]
 
     def mousePressEvent(self, mouse_event: QMouseEvent):
         """Overriding the default mousePressEvent, collecting the mouse press position and turning on the drawing
-        mode"""
+        mode, the right button starts panning"""
         if mouse_event.button() is Qt.MouseButton.LeftButton and self.interactive_mode:
             self.start_point = mouse_event.pos().x(), mouse_event.pos().y()
             self.drawing_mode = True
+        elif mouse_event.button() is Qt.MouseButton.RightButton and self.interactive_mode:
+            self.pan_start = (mouse_event.pos().x(), mouse_event.pos().y(), *self.view_offset)
 
     def mouseMoveEvent(self, mouse_event: QMouseEvent):
-        """Overriding the default mouseMoveEvent, showing the rectangle drawn so far"""
+        """Overriding the default mouseMoveEvent, showing the rectangle drawn so far or moving the view"""
         if self.drawing_mode:
             mouse_position = mouse_event.pos().x(), mouse_event.pos().y()
 
@@ -64,31 +105,36 @@ class InteractiveImage(QLabel):
             # Paint a temporary rectangle
             cv2.rectangle(self.temp_image, self.start_point, mouse_position, (0, 0, 255))
             self.setPixmap(q_pixmap_from_cv_img(self.temp_image))
+        elif self.pan_start is not None:
+            start_x, start_y, offset_x, offset_y = self.pan_start
+            self.view_offset = [offset_x - (mouse_event.pos().x() - start_x),
+                                offset_y - (mouse_event.pos().y() - start_y)]
+            self.render_view()
 
     def mouseReleaseEvent(self, mouse_event: QMouseEvent):
         """Overriding the default mouseReleaseEvent, collecting the drawn rectangular coordinates and turning off the
         drawing mode"""
         if self.drawing_mode and (mouse_event.button() is Qt.MouseButton.LeftButton):
             end_point = [mouse_event.pos().x(), mouse_event.pos().y()]
+            visible_height, visible_width = self.image.shape[:2]
 
             # If rectangle was released out of the image boundaries
             if end_point[0] < 0:
                 end_point[0] = 0
 
-            if end_point[0] > self.image_size[0] * self.zoom_factor:
-                end_point[0] = self.image_size[0] * self.zoom_factor
+            if end_point[0] > visible_width:
+                end_point[0] = visible_width
                 print('X too large')
 
             if end_point[1] < 0:
                 end_point[1] = 0
 
-            if end_point[1] > self.image_size[1] * self.zoom_factor:
-                end_point[1] = self.image_size[1] * self.zoom_factor
+            if end_point[1] > visible_height:
+                end_point[1] = visible_height
                 print('Y too large')
 
-            s_point_translate = [int(self.start_point[0] / self.zoom_factor),
-                                 int(self.start_point[1] / self.zoom_factor)]
-            e_point_translate = [int(end_point[0] / self.zoom_factor), int(end_point[1] / self.zoom_factor)]
+            s_point_translate = self.image_point(self.start_point)
+            e_point_translate = self.image_point(end_point)
 
             self.rect_drawn_handler(label_from_coords(s_point_translate, e_point_translate, self.image_size))
             # Clearing the temporary rectangle
@@ -96,9 +142,11 @@ class InteractiveImage(QLabel):
             self.setPixmap(q_pixmap_from_cv_img(self.temp_image))
             self.start_point = None
             self.drawing_mode = False
+        elif mouse_event.button() is Qt.MouseButton.RightButton:
+            self.pan_start = None
 
     def wheelEvent(self, event):
-        """Reacts to the scroll-wheel event, zooms in or out depending on the direction"""
+        """Reacts to the scroll-wheel event, zooms in or out around the cursor depending on the direction"""
         if self.interactive_mode:
             zoom = self.zoom_factor
             if event.angleDelta().y() > 0:
@@ -107,28 +155,84 @@ class InteractiveImage(QLabel):
                 if self.zoom_factor > 0.2:
                     zoom -= 0.1
 
-            # a0.position()
-            self.zoom_changed(zoom)
+            self.zoom_changed(zoom, (event.position().x(), event.position().y()))
             self.zoom_handler(self.zoom_factor)
 
-    def zoom_changed(self, zoom: float):
-        """Resizes the image based on the zoom factor"""
+    @timed("zoom")
+    def zoom_changed(self, zoom: float, anchor: tuple = (0, 0)):
+        """Changes the zoom factor, keeping the anchor point of the widget over the same point of the image"""
+        self.view_offset = [(anchor[0] + self.view_offset[0]) * zoom / self.zoom_factor - anchor[0],
+                            (anchor[1] + self.view_offset[1]) * zoom / self.zoom_factor - anchor[1]]
         self.zoom_factor = zoom
-        img = self.ori_image.copy()
-        h, w = img.shape[:2]
-        self.image = cv2.resize(src=img, dsize=(int(w * zoom), int(h * zoom)))
-        self.update_image()
+        self.render_view()
 
     def clear_labels(self):
-        """Recover the original image without annotations"""
-        self.image = self.ori_image.copy()
-        self.update_image()
+        """Recover the image without annotations"""
+        self.labels = None
+        self.render_view()
 
-    def change_image(self, image: ndarray):
-        """Load a new image into the label"""
+    def change_image(self, image: ndarray, full_resolution_path: str = None):
+        """Load a new image into the label, the full resolution image is read from full_resolution_path only when
+        zooming in needs more detail than the fitted image has"""
         self.ori_image = self.preprocess_image(image)
-        self.image = self.ori_image.copy()
-        self.temp_image = self.ori_image.copy()
+        self.pyramid = ImagePyramid(self.ori_image)
+        self.full_resolution_path = full_resolution_path
+        self.full_resolution_requested = False
+        self.labels = None
+        self.render_view()
+
+    def request_full_resolution(self):
+        """Starts decoding the full resolution image in the background, the fitted image is shown until it arrives.
+        Only one image is decoded at a time, a request made meanwhile is started when the running one finishes"""
+        self.full_resolution_requested = True
+        if self.full_resolution_worker is None:
+            self.full_resolution_worker = FullResolutionWorker(self.image_cache, self.full_resolution_path,
+                                                               FULL_RESOLUTION_MAX_SIZE, self.ori_image.shape[1])
+            self.full_resolution_worker.finished.connect(self.full_resolution_loaded)
+            self.full_resolution_worker.start()
+
+    def full_resolution_loaded(self):
+        """Replaces the pyramid of the fitted image with the pyramid of the full resolution image, unless the image
+        was changed in the meantime"""
+        worker, self.full_resolution_worker = self.full_resolution_worker, None
+        if worker.image_path != self.full_resolution_path:
+            if self.full_resolution_requested:
+                self.request_full_resolution()
+        elif worker.result is not None:
+            self.pyramid = worker.result
+            self.render_view()
+
+    def wait_for_full_resolution(self):
+        """Waits until the full resolution image being decoded is finished"""
+        if self.full_resolution_worker is not None:
+            self.full_resolution_worker.wait()
+
+    @timed("render_view")
+    def render_view(self):
+        """Renders the visible part of the zoomed image with the labels into self.image"""
+        if self.ori_image is None:
+            return
+
+        zoomed_width = max(int(self.image_size[0] * self.zoom_factor), 1)
+        zoomed_height = max(int(self.image_size[1] * self.zoom_factor), 1)
+        # More pixels are shown than the fitted image has
+        if (zoomed_width > self.ori_image.shape[1] and self.full_resolution_path is not None and
+                not self.full_resolution_requested):
+            self.request_full_resolution()
+
+        visible_width = min(zoomed_width, self.size().width())
+        visible_height = min(zoomed_height, self.size().height())
+
+        self.view_offset = [min(max(self.view_offset[0], 0), zoomed_width - visible_width),
+                            min(max(self.view_offset[1], 0), zoomed_height - visible_height)]
+        region = (self.view_offset[0] / zoomed_width, self.view_offset[1] / zoomed_height,
+                  (self.view_offset[0] + visible_width) / zoomed_width,
+                  (self.view_offset[1] + visible_height) / zoomed_height)
+
+        self.image = self.pyramid.render(region, (visible_width, visible_height))
+        if self.labels is not None:
+            self.draw_labels(self.labels, self.class_colours)
+        self.temp_image = self.image.copy()
         self.update_image()
 
     def update_image(self):
@@ -139,9 +243,40 @@ class InteractiveImage(QLabel):
         """Paint an annotation based on the label"""
         lu_corner, rb_corner = coords_from_label(label, self.image_size)
 
-        lu_corner = (int(lu_corner[0] * self.zoom_factor), int(lu_corner[1] * self.zoom_factor))
-        rb_corner = (int(rb_corner[0] * self.zoom_factor), int(rb_corner[1] * self.zoom_factor))
+        lu_corner = (int(lu_corner[0] * self.zoom_factor - self.view_offset[0]),
+                     int(lu_corner[1] * self.zoom_factor - self.view_offset[1]))
+        rb_corner = (int(rb_corner[0] * self.zoom_factor - self.view_offset[0]),
+                     int(rb_corner[1] * self.zoom_factor - self.view_offset[1]))
 
         cv2.rectangle(self.image, lu_corner, rb_corner, col)
         cv2.putText(self.image, label.class_name, lu_corner, 1, 1, col, 1)
         self.update_image()
+
+    def paint_labels(self, labels: LabelStore, class_colours: ndarray):
+        """Paint annotations of all the labels in a single pass, class_colours is a table of BGR colours indexed by
+        class number. The labels are kept and painted again after zooming or panning"""
+        self.labels = labels
+        self.class_colours = class_colours
+        self.render_view()
+
+    def draw_labels(self, labels: LabelStore, class_colours: ndarray):
+        """Draws the labels on self.image without updating the widget"""
+        if len(labels) != 0 and len(class_colours) != 0:
+            corners = (coords_from_store(labels, self.image_size) * self.zoom_factor -
+                       array(self.view_offset * 2)).astype(int32)
+            # Unknown class numbers get the colour of the class 0
+            class_ids = labels.class_ids.copy()
+            class_ids[(class_ids < 0) | (class_ids >= len(class_colours))] = 0
+
+            for class_id in unique(class_ids).tolist():
+                class_corners = corners[class_ids == class_id]
+                rectangles = stack((class_corners[:, [0, 1]], class_corners[:, [2, 1]],
+                                    class_corners[:, [2, 3]], class_corners[:, [0, 3]]), axis=1)
+                col = class_colours[class_id].tolist()
+                cv2.polylines(self.image, list(rectangles), True, col)
+
+            for (x_min, y_min, _, _), label_class_id, class_id in zip(corners.tolist(), labels.class_ids.tolist(),
+                                                                       class_ids.tolist()):
+                class_name = labels.class_names.get(str(label_class_id), "")
+                if class_name != "":
+                    cv2.putText(self.image, class_name, (x_min, y_min), 1, 1, class_colours[class_id].tolist(), 1)
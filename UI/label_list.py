@@ -0,0 +1,104 @@
+import numpy as np
+
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex
+from PyQt6.QtGui import QColor
+from PyQt6.QtWidgets import QStyledItemDelegate, QListView, QAbstractItemView
+
+from label_tools import LabelStore
+
+
+def class_ordinals(class_ids: np.ndarray) -> np.ndarray:
+    """Numbers the labels within their classes, in the order of the store
+    :returns: array with the 1-based ordinal of every label among the labels of its class"""
+    order = np.argsort(class_ids, kind="stable")
+    sorted_ids = class_ids[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(sorted_ids)])
+
+    ordinals = np.empty(len(class_ids), dtype=np.int64)
+    ordinals[order] = np.arange(len(class_ids)) - np.repeat(group_starts, group_sizes) + 1
+    return ordinals
+
+
+class LabelListModel(QAbstractListModel):
+    """List model over the labels of a LabelStore, rows are labelled with the class name and the number of the label
+    within its class"""
+    ColourRole = Qt.ItemDataRole.UserRole + 1
+
+    def __init__(self):
+        super().__init__()
+        self.labels = LabelStore()
+        self.class_colours = np.zeros((1, 3), dtype=np.uint8)
+        self.ordinals = np.zeros(0, dtype=np.int64)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.labels)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.labels):
+            return None
+        class_id = int(self.labels.class_ids[index.row()])
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"{self.labels.class_names.get(str(class_id), '')} {self.ordinals[index.row()]}"
+        if role == self.ColourRole:
+            if not 0 <= class_id < len(self.class_colours):
+                class_id = 0
+            blue, green, red = self.class_colours[class_id].tolist()
+            return QColor(red, green, blue)
+        return None
+
+    def set_labels(self, labels: LabelStore, class_colours: np.ndarray):
+        """Shows the labels of another image"""
+        self.beginResetModel()
+        self.labels = labels
+        self.class_colours = class_colours
+        self.ordinals = class_ordinals(labels.class_ids)
+        self.endResetModel()
+
+    def append_labels(self, labels):
+        """Appends copies of the labels (LabelStore or list of labels) to the store, only the new rows are added to
+        the view"""
+        if not isinstance(labels, LabelStore):
+            labels = LabelStore.from_labels(labels)
+        if len(labels) == 0:
+            return
+        first_row = len(self.labels)
+        self.beginInsertRows(QModelIndex(), first_row, first_row + len(labels) - 1)
+        self.labels.extend(labels)
+        self.ordinals = class_ordinals(self.labels.class_ids)
+        self.endInsertRows()
+
+    def remove_label(self, row: int):
+        """Removes the label from the store, the following labels of its class are renumbered"""
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.labels.delete(row)
+        old_ordinals = np.delete(self.ordinals, row)
+        self.ordinals = class_ordinals(self.labels.class_ids)
+        self.endRemoveRows()
+
+        renumbered = np.flatnonzero(old_ordinals != self.ordinals)
+        if len(renumbered) != 0:
+            self.dataChanged.emit(self.index(int(renumbered[0])), self.index(int(renumbered[-1])),
+                                  [Qt.ItemDataRole.DisplayRole])
+
+
+class LabelColourDelegate(QStyledItemDelegate):
+    """Item delegate painting the background of the row with the colour of the class"""
+
+    def paint(self, painter, option, index):
+        painter.fillRect(option.rect, index.data(LabelListModel.ColourRole))
+        super().paint(painter, option, index)
+
+
+class LabelListView(QListView):
+    """List view showing the labels, only the visible rows are rendered"""
+
+    def __init__(self, model: LabelListModel, label_clicked_handler):
+        super().__init__()
+        self.setModel(model)
+        self.setItemDelegate(LabelColourDelegate(self))
+        self.setUniformItemSizes(True)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.clicked.connect(lambda index: label_clicked_handler(index.row()))
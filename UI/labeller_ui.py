@@ -1,23 +1,31 @@
 import asyncio
 import os
 
-import cv2
-
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QGuiApplication, QIcon
-from PyQt6.QtWidgets import QDialog, QHBoxLayout, QVBoxLayout, QPushButton, QLabel, QScrollArea, QWidget, QFileDialog, \
-    QCheckBox, QSizePolicy, QMessageBox, QSpinBox
+from PyQt6.QtWidgets import QDialog, QHBoxLayout, QVBoxLayout, QPushButton, QLabel, QWidget, QFileDialog, \
+    QCheckBox, QSizePolicy, QMessageBox, QSpinBox, QProgressDialog
 
 from UI.yaml_editor import YAMLEditor
-from UI.small_custom_widgets import LabelListButton, StringSpinBox, ProportionSpinBox, SwitchButton, ZoomTool, Notify
-from UI.interactive_image import InteractiveImage
-
-from tools import max_string, rgb_to_bgr, rgb_from_scale
-from dataset_tools import (dataset_checkout, get_images_and_labels, get_available_classes_and_yaml,
-                           prepare_dataset_for_training)
-
-from label_tools import Label, label_from_yolo_v5, yolo_v5_from_label
+from UI.small_custom_widgets import StringSpinBox, ProportionSpinBox, SwitchButton, ZoomTool, Notify
+from UI.interactive_image import InteractiveImage, placeholder_image
+from UI.label_list import LabelListModel, LabelListView
+from UI.validation_window import ValidationWindow
+from UI.disagreement_window import DisagreementWindow
+from UI.thumbnail_grid import ThumbnailWindow
+from UI.latency_overlay import LatencyOverlay
+from UI.background_workers import TrainingPreparationWorker, ModelLoadingWorker
+
+from tools import class_colour_table
+from dataset_tools import get_available_classes_and_yaml, read_yaml_classes
+from dataset_index import DatasetIndex
+from dataset_scanner import label_name_for_image
+
+from label_tools import Label, LabelStore, store_from_yolo_v5, yolo_v5_from_store
 from fine_tuner import FineTuner
+from image_cache import ImageCache
+from save_queue import SaveQueue
+from latency_tracker import latency_tracker, timed
 
 
 class LabellerUI(QDialog):
@@ -25,25 +33,42 @@ class LabellerUI(QDialog):
         """Main window of the YOLO Manager"""
         super().__init__()
         self.available_classes = dict()
+        self.class_colours = class_colour_table([])
         self.selected_class = 0
-        self.active_labels = []
-        self.visible_class_count = dict()
+        self.active_labels = LabelStore()
         self.tmp_dir = 'tmp'
         self.dataset_path = ''
         self.yaml_path = ''
         self.image_files = []
         self.label_files = []
+        self.dataset_index = None
         self.image_index = 0
         self.clipboard = None
         self.labels_exists = False
         self.dataset_loaded_flag = False
+        self.dataset_scanned_flag = False
+        self.dataset_scan = None
         self.fine_tune_mode = False
         self.yaml_editor = None
+        self.validation_window = None
+        self.disagreement_window = None
+        self.thumbnail_window = None
         self.fine_tuner = FineTuner()
+        self.model_loading_worker = None
+        self.image_cache = ImageCache(max_megabytes=512)
+        self.prefetch_distance = 3
+        self.save_queue = SaveQueue()
+
+        self.scan_timer = QTimer(self)
+        self.scan_timer.timeout.connect(self.scan_dataset_step)
+        self.save_timer = QTimer(self)
+        self.save_timer.timeout.connect(self.update_save_status)
 
         self.setWindowTitle("YOLO Manager")
         self.setWindowIcon(QIcon(os.path.join("resources", "YOLO-Manager_LOGO.ico")))
         self.layout_setup()
+        # The overlay exists only when the latency tracking was turned on, F12 shows it
+        self.latency_overlay = LatencyOverlay(self, latency_tracker) if latency_tracker.enabled else None
         self.show()
 
     def layout_setup(self):
@@ -73,6 +98,7 @@ class LabellerUI(QDialog):
         self.dataset_proportions = ProportionSpinBox()
         self.prepare_for_training_button = QPushButton("Prepare for training")
         self.prepare_for_training_button.clicked.connect(self.prepare_for_training)
+        self.keep_duplicates_checkbox = QCheckBox("Keep duplicates together")
 
         self.class_spin_box = StringSpinBox(["0"])
         self.class_spin_box.setStyleSheet("background-color: rgb(228, 219, 255);")
@@ -86,6 +112,7 @@ class LabellerUI(QDialog):
         self.select_model_button = QPushButton("Select model")
         self.fine_tune_button = QPushButton("Fine tune")
         self.fine_tune_all_button = QPushButton("Fine tune all")
+        self.rank_disagreements_button = QPushButton("Rank disagreements")
         # self.fine_tune_all_button.setEnabled(False)
         self.fine_tune_switch = SwitchButton("Mode", self.toggle_fine_tune, ["Average", "Overwrite"])
 
@@ -96,6 +123,7 @@ class LabellerUI(QDialog):
 
         vertical_layout_left.addWidget(self.training_proportions_label)
         vertical_layout_left.addLayout(self.dataset_proportions)
+        vertical_layout_left.addWidget(self.keep_duplicates_checkbox)
         vertical_layout_left.addWidget(self.prepare_for_training_button)
         vertical_layout_left.addWidget(QLabel(""))
 
@@ -115,6 +143,8 @@ class LabellerUI(QDialog):
         self.fine_tune_button.clicked.connect(self.fine_tune_current)
         vertical_layout_left.addWidget(self.fine_tune_all_button)
         self.fine_tune_all_button.clicked.connect(self.fine_tune_all)
+        vertical_layout_left.addWidget(self.rank_disagreements_button)
+        self.rank_disagreements_button.clicked.connect(self.rank_disagreements)
 
         vertical_layout_left.addLayout(self.fine_tune_switch)
 
@@ -122,7 +152,7 @@ class LabellerUI(QDialog):
         vertical_widget_middle = QWidget()
         vertical_widget_middle.setStyleSheet('background-color: rgb(228, 219, 255);')
         vertical_layout_middle = QVBoxLayout()
-        self.image_label = InteractiveImage(self.new_label, self.zoom)
+        self.image_label = InteractiveImage(self.new_label, self.zoom, self.image_cache)
         self.image_label.setFixedSize(int(screen_size.width() / 2), int(screen_size.height() / 2))
         vertical_layout_middle.addWidget(self.image_label)
 
@@ -153,6 +183,7 @@ class LabellerUI(QDialog):
         self.save_button = QPushButton("Save")
         self.next_button = QPushButton("Next")
         self.prev_button = QPushButton("Previous")
+        self.thumbnails_button = QPushButton("Thumbnails")
 
         self.zoom_tool = ZoomTool(self.zoom)
 
@@ -163,27 +194,25 @@ class LabellerUI(QDialog):
         self.save_button.clicked.connect(self.save_labels)
         self.next_button.clicked.connect(self.next_image_and_labels)
         self.prev_button.clicked.connect(self.previous_image_and_labels)
+        self.thumbnails_button.clicked.connect(self.browse_thumbnails)
         self.copy_button.clicked.connect(self.copy_labels)
         self.paste_button.clicked.connect(self.paste_labels)
 
         vertical_layout_right.addWidget(self.image_name_label)
         vertical_layout_right.addLayout(image_index_label_cont)
+        self.save_status_label = QLabel("")
         vertical_layout_right.addWidget(self.save_button)
+        vertical_layout_right.addWidget(self.save_status_label)
         vertical_layout_right.addWidget(self.next_button)
         vertical_layout_right.addWidget(self.prev_button)
+        vertical_layout_right.addWidget(self.thumbnails_button)
         vertical_layout_right.addWidget(QLabel(""))
         vertical_layout_right.addWidget(QLabel('Active Labels'))
 
-        self.label_list_widget = QWidget()
-        self.label_list_container = QVBoxLayout()
-        self.label_list_container.setAlignment(Qt.AlignmentFlag.AlignTop)
-        self.label_list_widget.setLayout(self.label_list_container)
-
-        label_list_scroll = QScrollArea()
-        label_list_scroll.setWidgetResizable(True)
-        label_list_scroll.setWidget(self.label_list_widget)
+        self.label_list_model = LabelListModel()
+        self.label_list_view = LabelListView(self.label_list_model, self.label_clicked)
 
-        vertical_layout_right.addWidget(label_list_scroll)
+        vertical_layout_right.addWidget(self.label_list_view)
         vertical_layout_right.addWidget(QLabel(""))
 
         vertical_layout_right.addWidget(self.copy_button)
@@ -220,6 +249,24 @@ class LabellerUI(QDialog):
         elif answer == QMessageBox.StandardButton.Ok:
             if isinstance(self.yaml_editor, YAMLEditor):
                 self.yaml_editor.close()
+            if isinstance(self.validation_window, ValidationWindow):
+                self.validation_window.close()
+            if isinstance(self.disagreement_window, DisagreementWindow):
+                self.disagreement_window.close()
+            if isinstance(self.thumbnail_window, ThumbnailWindow):
+                self.thumbnail_window.close()
+            if self.model_loading_worker is not None:
+                self.model_loading_worker.wait()
+            self.image_label.wait_for_full_resolution()
+            self.save_queue.shutdown()
+            self.update_save_status()
+            failed = self.save_queue.failed_snapshot()
+            if failed:
+                QMessageBox.warning(self, 'Saving failed', 'These label files could not be saved:\n' +
+                                    '\n'.join(f'{path}: {error}' for path, error in failed.items()))
+            self.image_cache.shutdown()
+            if self.dataset_index is not None:
+                self.dataset_index.close()
             event.accept()
 
     def keyPressEvent(self, event):
@@ -240,6 +287,9 @@ class LabellerUI(QDialog):
                 self.zoom(-1, False)
             case Qt.Key.Key_Escape:
                 self.close()
+            case Qt.Key.Key_F12:
+                if self.latency_overlay is not None:
+                    self.latency_overlay.toggle()
 
     def toggle_editing(self):
         self.lock_editing_checkbox.setEnabled(self.labels_on_checkbox.isChecked())
@@ -257,23 +307,56 @@ class LabellerUI(QDialog):
             Notify(self, "To read the dataset, choose its directory")
 
     def read_dataset(self):
-        """Reads the dataset into the UI from self.dataset_path"""
+        """Reads the dataset into the UI from self.dataset_path, the first images are shown while the dataset
+        directory is still being scanned"""
         self.setEnabled(True)
+        self.flush_saves()
         self.yaml_editor = None
         self.clipboard = None
+        self.image_cache.clear()
 
         if len(self.image_files) != 0:
             print('WARN USER ABOUT CHANGING AND SAVING THE OLD DATASET')
 
         self.available_classes = dict()
-
-        self.dataset_loaded_flag = True
-        self.image_label.interactive_mode = True
-        self.zoom_tool.active = True
+        self.dataset_loaded_flag = False
+        self.dataset_scanned_flag = False
+        # Labels can't be edited before all the label files are known
+        self.image_label.interactive_mode = False
         self.read_dataset_button.setStyleSheet("")
 
-        self.image_files, self.label_files = get_images_and_labels(self.dataset_path)
-        self.yaml_path, self.available_classes = get_available_classes_and_yaml(self.dataset_path)
+        if self.dataset_index is not None:
+            self.dataset_index.close()
+        self.dataset_index = DatasetIndex(self.dataset_path)
+        self.image_files, self.label_files = self.dataset_index.image_files, self.dataset_index.label_files
+
+        self.dataset_scan = self.dataset_index.iter_update()
+        self.scan_timer.start(0)
+
+    def scan_dataset_step(self):
+        """Scans the next part of the dataset directory, called by the scan timer until the scan is complete"""
+        try:
+            next(self.dataset_scan)
+        except StopIteration:
+            self.scan_timer.stop()
+            self.dataset_scan = None
+            self.dataset_scanned()
+            return
+
+        if not self.dataset_loaded_flag and len(self.image_files) > self.image_index:
+            self.dataset_loaded_flag = True
+            self.zoom_tool.active = True
+            self.image_name_label.setText(self.image_files[self.image_index])
+            self.image_index_spinbox.setEnabled(True)
+            self.update_image_range()
+            self.update_ui()
+        elif self.dataset_loaded_flag:
+            self.update_image_range()
+
+    def dataset_scanned(self):
+        """Reads the classes and enables the editing once the whole dataset directory is scanned"""
+        self.dataset_scanned_flag = True
+        self.yaml_path, self.available_classes = get_available_classes_and_yaml(self.dataset_path, self.dataset_index)
 
         if self.yaml_path is not None:
             self.read_yaml()
@@ -282,48 +365,86 @@ class LabellerUI(QDialog):
         for key in range(len(self.available_classes.keys())):
             class_names_in_order.append(self.available_classes[f"{key}"])
 
+        self.class_colours = class_colour_table(list(self.available_classes.keys()))
+
         self.class_spin_box.set_strings(class_names_in_order)
         self.class_spin_box.setValue(0)
 
+        if len(self.image_files) == 0:
+            Notify(self, "No images found in the dataset")
+            return
+        if self.image_index >= len(self.image_files):
+            self.image_index = 0
+
+        self.dataset_loaded_flag = True
+        self.image_label.interactive_mode = True
+        self.zoom_tool.active = True
         self.image_name_label.setText(self.image_files[self.image_index])
+        self.image_index_spinbox.setEnabled(True)
+        self.update_image_range()
+        # Labels of the displayed image might have been found after it was shown
+        self.update_ui()
 
+    def update_image_range(self):
+        """Adjusts the image index spinbox to the number of images found so far"""
+        self.image_index_spinbox.blockSignals(True)
         self.image_index_spinbox.setRange(0, len(self.image_files) - 1)
-        self.image_index_spinbox.setEnabled(True)
+        self.image_index_spinbox.setValue(self.image_index)
+        self.image_index_spinbox.blockSignals(False)
         self.image_quantity_label.setText(f"/ {len(self.image_files) - 1}")
 
-        self.update_ui()
-
     def validate_dataset(self):
         """Validates the dataset and gives feedback to the user"""
-        if self.dataset_loaded_flag:
-            verify_flag, invalid_files = dataset_checkout(self.dataset_path)
-
-            if verify_flag:
-                Notify(self, 'Dataset valid')
-            else:
-                Notify(self, f'Dataset invalid, fix :\n{invalid_files}')
+        if self.dataset_scanned_flag:
+            self.flush_saves()
+            self.validation_window = ValidationWindow(self.dataset_path)
 
     def prepare_for_training(self):
         """Asks the user to point to the destination folder and copies the divided dataset into given folder"""
-        if self.dataset_loaded_flag:
+        if self.dataset_scanned_flag:
             # Ask user to point to the output directory
             training_directory = QFileDialog.getExistingDirectory(self, "Select Training Dataset Directory")
+            if training_directory == '':
+                return
+            self.flush_saves()
             train_prop, val_prop = self.dataset_proportions.get_proportions()
-            prepare_dataset_for_training(self.dataset_path, training_directory, self.yaml_path, train_prop)
+
+            progress_dialog = QProgressDialog("Copying the dataset...", "Cancel", 0, 0, self)
+            progress_dialog.setWindowTitle("Preparing for training")
+            duplicate_distance = 4 if self.keep_duplicates_checkbox.isChecked() else None
+            # The worker gets its own copy of the index, the labelling goes on updating this one
+            worker = TrainingPreparationWorker(self.dataset_path, training_directory, self.yaml_path, train_prop,
+                                               self.dataset_index.snapshot(), duplicate_distance)
+
+            def show_progress(progress):
+                progress_dialog.setMaximum(progress.files_total)
+                progress_dialog.setValue(progress.files_done)
+                progress_dialog.setLabelText(f"{progress.files_done} / {progress.files_total} files, "
+                                             f"{progress.files_per_second:.0f} files/s, "
+                                             f"{progress.bytes_per_second / 1024 / 1024:.1f} MB/s")
+
+            # Shown once the progress dialog is closed
+            errors = []
+            worker.progress_changed.connect(show_progress)
+            worker.preparation_failed.connect(errors.append)
+            progress_dialog.canceled.connect(worker.cancel)
+            worker.finished.connect(progress_dialog.reset)
+            worker.start()
+            progress_dialog.exec()
+            worker.wait()
+            if errors:
+                Notify(self, f'The dataset could not be prepared for training: {errors[0]}')
 
     def read_yaml(self):
         """Reading available classes from yaml file"""
-        with open(f"{self.dataset_path}/{self.yaml_path}", 'r') as yaml_file:
-            yaml_contents = yaml_file.readlines()
-            yaml_contents = yaml_contents[yaml_contents.index("names:\n") + 1:]
-            for yaml_line in yaml_contents:
-                number_and_class = yaml_line.strip().replace("\n", "")
-                object_number, object_class = number_and_class.split(": ")
-                self.available_classes.update({object_number: object_class})
+        self.available_classes.update(read_yaml_classes(f"{self.dataset_path}/{self.yaml_path}"))
 
     def modify_classes(self):
         """Opening yaml editor and suspending the main window"""
-        if self.yaml_path != '':
+        if not self.dataset_scanned_flag:
+            Notify(self, 'The dataset is still being read')
+        elif self.yaml_path is not None and self.yaml_path != '':
+            self.flush_saves()
             self.yaml_editor = YAMLEditor(self.dataset_path, self.yaml_path, self.label_files, self.read_dataset)
             self.setEnabled(False)
         else:
@@ -362,18 +483,47 @@ class LabellerUI(QDialog):
         else:
             return False
 
+    @timed("save_labels")
     def save_labels(self):
-        """Saving active labels to labels file, if active labels is empty, deletes labels file"""
+        """Queues saving the active labels to the labels file, if active labels is empty, the labels file is deleted.
+        The file is written in the background by the save queue"""
         if self.dataset_loaded_flag:
             image_name = self.image_files[self.image_index]
-            labels_path = os.path.join(self.dataset_path, f"{image_name[:image_name.index('.')]}.txt")
+            labels_name = self.dataset_index.label_for_image(image_name) or label_name_for_image(image_name)
+            labels_path = os.path.join(self.dataset_path, labels_name)
             if self.labels_exists:
                 if len(self.active_labels) == 0:
-                    os.remove(labels_path)
+                    self.save_queue.submit(labels_path, None)
                 else:
-                    with open(labels_path, 'w') as labels_writer:
-                        labels_writer.writelines([yolo_v5_from_label(label) for label in self.active_labels])
+                    self.save_queue.submit(labels_path, ''.join(yolo_v5_from_store(self.active_labels)))
+                self.update_save_status()
+                self.save_timer.start(100)
+
+    def update_save_status(self):
+        """Updates the dataset index with the written label files and shows the pending and failed saves"""
+        for labels_path in self.save_queue.take_finished():
+            if self.dataset_index is not None:
+                self.dataset_index.update_file(os.path.relpath(labels_path, self.dataset_path))
+
+        pending_count = self.save_queue.pending_count()
+        failed = self.save_queue.failed_snapshot()
+        if pending_count == 0:
+            self.save_timer.stop()
+        status = [f'Saving {pending_count} files...'] if pending_count != 0 else []
+        if failed:
+            status.append(f'{len(failed)} files not saved')
+            self.save_status_label.setToolTip('\n'.join(f'{path}: {error}' for path, error in failed.items()))
+        else:
+            self.save_status_label.setToolTip('')
+        self.save_status_label.setText('\n'.join(status))
+        self.save_status_label.setStyleSheet('color: rgb(200, 0, 0);' if failed else '')
 
+    def flush_saves(self):
+        """Waits for the queued saves, before the label files are read by anything else"""
+        self.save_queue.flush()
+        self.update_save_status()
+
+    @timed("update_ui")
     def update_ui(self):
         """Reads the image with labels and loads them into the UI"""
         if self.dataset_loaded_flag:
@@ -384,12 +534,11 @@ class LabellerUI(QDialog):
 
     def copy_labels(self):
         if self.dataset_loaded_flag:
-            self.clipboard = self.active_labels
+            self.clipboard = self.active_labels.copy()
 
     def paste_labels(self):
         if self.dataset_loaded_flag and (self.clipboard is not None):
-            self.active_labels += self.clipboard
-            self.update_labels_list()
+            self.label_list_model.append_labels(self.clipboard)
             self.paint_labels()
 
     def new_label(self, label: Label):
@@ -398,38 +547,55 @@ class LabellerUI(QDialog):
             if self.lock_editing_checkbox.isChecked():
                 label.class_number = str(self.class_spin_box.value())
                 label.class_name = self.available_classes[str(self.class_spin_box.value())]
-                self.active_labels.append(label)
-                self.update_labels_list()
+                self.label_list_model.append_labels([label])
                 self.paint_labels()
 
+    @timed("paint_labels")
     def paint_labels(self):
         """Painting the active labels on the displayed image"""
         if self.labels_on_checkbox.isChecked():
-            for label in self.active_labels:
-                max_class_number = max_string(list(self.available_classes.keys()))
-                rgb_col = rgb_from_scale(int(label.class_number), max_class_number)
-
-                self.image_label.paint_rect_from_label(label, rgb_to_bgr(rgb_col))
+            self.image_label.paint_labels(self.active_labels, self.class_colours)
 
+    @timed("read_image")
     def read_image(self):
-        """Reads image from a path"""
-        self.image_label.change_image(cv2.imread(os.path.join(self.dataset_path, self.image_files[self.image_index])))
+        """Reads image from the image cache and prefetches the neighbouring images"""
+        display_size = (self.image_label.size().width(), self.image_label.size().height())
+        image_path = os.path.join(self.dataset_path, self.image_files[self.image_index])
+        image = self.image_cache.get(image_path, display_size)
+        if image is not None:
+            self.image_label.change_image(image, image_path)
+        else:
+            print(f'Could not read the image {image_path}')
+            self.image_label.change_image(placeholder_image(display_size, "The image can't be read"))
+
+        neighbour_indices = []
+        for distance in range(1, self.prefetch_distance + 1):
+            neighbour_indices += [self.image_index + distance, self.image_index - distance]
+        self.image_cache.prefetch([os.path.join(self.dataset_path, self.image_files[index])
+                                   for index in neighbour_indices if 0 <= index < len(self.image_files)],
+                                  display_size)
 
+    @timed("read_labels")
     def read_labels(self):
         """Reading the labels, based on displayed image"""
         image_name = self.image_files[self.image_index]
-        labels_name = f"{image_name[:image_name.index('.')]}.txt"
-
-        if labels_name in self.label_files:
-            with open(os.path.join(self.dataset_path, labels_name), 'r') as labels_file:
-                labels = [label_from_yolo_v5(label, self.available_classes[label.split(" ")[0]]) for label in
-                          labels_file.readlines()]
-                self.active_labels = labels
+        labels_name = self.dataset_index.label_for_image(image_name)
+
+        if labels_name is not None:
+            labels_path = os.path.join(self.dataset_path, labels_name)
+            # A queued save is newer than the file on the disk
+            pending, contents = self.save_queue.lookup(labels_path)
+            if not pending:
+                with open(labels_path, 'r') as labels_file:
+                    contents = labels_file.read()
+            if contents is not None:
+                self.active_labels = store_from_yolo_v5(contents, self.available_classes)
                 self.labels_exists = True
+            else:
+                self.labels_exists = False
         else:
             self.labels_exists = False
 
-        self.visible_class_count = dict()
 
     def select_model(self):
         """Lets the user select the dataset"""
@@ -440,10 +606,29 @@ class LabellerUI(QDialog):
             "Model Files (*.pt)",
         )
         if model_path is not '':
-            self.fine_tuner.set_model(model_path)
+            self.load_model(model_path)
         else:
             Notify(self, 'Select the model to use it')
 
+    def load_model(self, model_path: str):
+        """Loads the model in the background, the labelling can go on in the meantime"""
+        progress_dialog = QProgressDialog("Loading the model...", None, 0, 0, self)
+        progress_dialog.setWindowTitle("Select model")
+        self.select_model_button.setEnabled(False)
+        self.model_loading_worker = ModelLoadingWorker(self.fine_tuner, model_path)
+
+        def model_loaded():
+            progress_dialog.reset()
+            self.select_model_button.setEnabled(True)
+            self.model_loading_worker = None
+
+        self.model_loading_worker.loading_failed.connect(
+            lambda error: Notify(self, f'The model could not be loaded: {error}'))
+        self.model_loading_worker.finished.connect(model_loaded)
+        self.model_loading_worker.start()
+        progress_dialog.show()
+
+    @timed("fine_tune")
     def fine_tune_current(self):
         """Fine-tunes the labels on the current image"""
         if self.fine_tuner.model is not None and self.lock_editing_checkbox.isChecked():
@@ -469,44 +654,51 @@ class LabellerUI(QDialog):
             print('Iter')
             print(self.image_index)
 
-    def update_visible_class_count(self, class_number: str, increment: bool = True) -> int:
-        """Incrementing or decrementing the number of visible objects assigned to each class
-        :return: the number of objects of this class"""
-
-        if class_number in list(self.visible_class_count.keys()):
-            if increment:
-                self.visible_class_count.update({class_number: self.visible_class_count[class_number] + 1})
-            else:
-                self.visible_class_count.update({class_number: self.visible_class_count[class_number] - 1})
+    def rank_disagreements(self):
+        """Opens the window ranking the images by the disagreement of their labels with the loaded model"""
+        if not self.dataset_scanned_flag:
+            Notify(self, 'The dataset is still being read')
+        elif self.fine_tuner.model is None:
+            Notify(self, 'Select the model to rank the images')
         else:
-            self.visible_class_count.update({class_number: 1})
-
-        return self.visible_class_count[class_number]
-
+            self.flush_saves()
+            if isinstance(self.disagreement_window, DisagreementWindow):
+                self.disagreement_window.close()
+            self.disagreement_window = DisagreementWindow(self.dataset_path, self.fine_tuner, list(self.image_files),
+                                                          self.image_labels, self.show_image)
+
+    def browse_thumbnails(self):
+        """Opens the thumbnail grid of the dataset images"""
+        if not self.dataset_scanned_flag:
+            Notify(self, 'The dataset is still being read')
+            return
+        if isinstance(self.thumbnail_window, ThumbnailWindow):
+            self.thumbnail_window.close()
+        self.thumbnail_window = ThumbnailWindow(self.dataset_path, list(self.image_files), self.show_image)
+        self.thumbnail_window.select_image(self.image_files[self.image_index])
+
+    def image_labels(self) -> dict[str, str | None]:
+        """Waits for the queued saves, so the labels on the disk are current
+        :returns: {image: label file or None} of every image"""
+        self.flush_saves()
+        return {image: self.dataset_index.label_for_image(image) for image in self.image_files}
+
+    def show_image(self, image_file: str):
+        """Switches to the image, saving the current one if requested"""
+        if image_file in self.image_files:
+            self.image_index_spinbox.setValue(self.image_files.index(image_file))
+            self.activateWindow()
+
+    @timed("update_labels_list")
     def update_labels_list(self):
         """Updating the label list displayed on the right side of the UI"""
-        for child in self.label_list_widget.children():
-            if type(child) is not QVBoxLayout:
-                child.deleteLater()
+        self.label_list_model.set_labels(self.active_labels, self.class_colours)
 
-        for label in self.active_labels:
-            class_count = self.update_visible_class_count(label.class_number)
-
-            text = f"{label.class_name} {class_count}"
-
-            class_number = max_string(list(self.available_classes.keys()))
-            rgb_col = rgb_from_scale(int(label.class_number), class_number)
-            self.label_list_container.addWidget(
-                LabelListButton(text, label, rgb_col, self.label_list_widget, self.label_clicked))
-
-    def label_clicked(self, widget, label):
+    def label_clicked(self, label_index: int):
         """Deleting the clicked label"""
         if self.lock_editing_checkbox.isChecked():
-            widget.close()
-            if label in self.active_labels:
-                self.update_visible_class_count(label.class_number, increment=False)
-                self.active_labels.remove(label)
-                self.image_label.clear_labels()
+            if label_index < len(self.active_labels):
+                self.label_list_model.remove_label(label_index)
                 self.paint_labels()
 
     def zoom(self, zoom: float, incr=True):
@@ -523,5 +715,3 @@ class LabellerUI(QDialog):
                         self.zoom_tool.increment()
                     else:
                         self.zoom_tool.decrement()
-
-            self.paint_labels()
@@ -0,0 +1,38 @@
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QFont
+from PyQt6.QtWidgets import QLabel, QWidget
+
+from latency_tracker import LatencyTracker
+
+
+class LatencyOverlay(QLabel):
+    """Small semi-transparent table of the stage latencies, drawn over the top left corner of the parent and
+    refreshed twice a second while it is visible"""
+
+    def __init__(self, parent: QWidget, tracker: LatencyTracker):
+        super().__init__(parent)
+        self.tracker = tracker
+        self.setFont(QFont("monospace", 8))
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 170); color: rgb(0, 255, 0); padding: 4px;")
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def toggle(self):
+        if self.isVisible():
+            self.refresh_timer.stop()
+            self.hide()
+        else:
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.refresh_timer.start(500)
+
+    def refresh(self):
+        lines = [f"{'stage':<20}{'n':>6}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"]
+        for name, stats in sorted(self.tracker.summary().items()):
+            lines.append(f"{name:<20}{stats['count']:>6}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}"
+                         f"{stats['max_ms']:>9.2f}")
+        self.setText("\n".join(lines))
+        self.adjustSize()
@@ -1,24 +1,9 @@
+from typing import Callable
+
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import QPushButton, QSpinBox, QHBoxLayout, QLabel, QToolBar, QVBoxLayout, QMessageBox
 
-from label_tools import Label
-
-
-class LabelListButton(QPushButton):
-    """QPushButton with easily customizable background colour"""
-
-    def __init__(self, text: str, label: Label, background_col, parent, onClickFunc):
-        super().__init__(text, parent)
-        self.text = text
-        self.label = label
-        self.setStyleSheet(f"background-color:rgb({','.join([str(col) for col in background_col])})")
-        self.onClickFunc = onClickFunc
-        self.clicked.connect(self.on_click)
-
-    def on_click(self):
-        self.onClickFunc(self, self.label)
-
 
 class StringSpinBox(QSpinBox):
     # TODO docstring and comments
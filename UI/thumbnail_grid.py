@@ -0,0 +1,161 @@
+import os
+from collections import OrderedDict
+from typing import Callable
+
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QObject, QPoint, QSize, QTimer, pyqtSignal
+from PyQt6.QtGui import QColor, QPixmap
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QListView, QAbstractItemView
+
+from UI.interactive_image import q_pixmap_from_cv_img
+
+from thumbnail_cache import ThumbnailCache
+
+
+class ThumbnailSignals(QObject):
+    """Carries the loaded thumbnails from the thumbnail cache threads to the GUI thread"""
+    thumbnail_loaded = pyqtSignal(str, bool)
+
+
+class ThumbnailListModel(QAbstractListModel):
+    """List model over the images of the dataset, a thumbnail is requested only when the view asks for its row, which
+    happens only for the visible rows. The pixmaps of the last max_pixmaps thumbnails are kept"""
+
+    def __init__(self, thumbnail_cache: ThumbnailCache, image_files: list[str], max_pixmaps: int = 2048):
+        super().__init__()
+        self.thumbnail_cache = thumbnail_cache
+        self.image_files = image_files
+        self.image_rows = {image_file: row for row, image_file in enumerate(image_files)}
+        self.max_pixmaps = max_pixmaps
+        self.pixmaps = OrderedDict()
+        self.failed = set()
+
+        size = thumbnail_cache.size
+        self.placeholder = QPixmap(size, size)
+        self.placeholder.fill(QColor(200, 200, 200))
+        self.broken = QPixmap(size, size)
+        self.broken.fill(QColor(200, 80, 80))
+
+        self.signals = ThumbnailSignals()
+        self.signals.thumbnail_loaded.connect(self.thumbnail_loaded)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.image_files)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.image_files):
+            return None
+        image_file = self.image_files[index.row()]
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            return os.path.basename(image_file)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return image_file
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self.pixmap(image_file)
+        return None
+
+    def pixmap(self, image_file: str) -> QPixmap:
+        """:returns: the thumbnail, a placeholder while it is being loaded"""
+        pixmap = self.pixmaps.get(image_file)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(image_file)
+            return pixmap
+        if image_file in self.failed:
+            return self.broken
+
+        thumbnail = self.thumbnail_cache.cached(image_file)
+        if thumbnail is None:
+            self.thumbnail_cache.request([image_file], lambda loaded_file, loaded_thumbnail:
+                                         self.signals.thumbnail_loaded.emit(loaded_file, loaded_thumbnail is not None))
+            return self.placeholder
+
+        pixmap = self.pixmaps[image_file] = q_pixmap_from_cv_img(thumbnail)
+        while len(self.pixmaps) > self.max_pixmaps:
+            self.pixmaps.popitem(last=False)
+        return pixmap
+
+    def thumbnail_loaded(self, image_file: str, loaded: bool):
+        """Repaints the tile of the loaded thumbnail"""
+        if not loaded:
+            self.failed.add(image_file)
+        row = self.image_rows.get(image_file)
+        if row is not None:
+            self.dataChanged.emit(self.index(row), self.index(row), [Qt.ItemDataRole.DecorationRole])
+
+
+class ThumbnailGridView(QListView):
+    """Grid of equally sized tiles, only the visible tiles are laid out and painted"""
+
+    def __init__(self, model: ThumbnailListModel):
+        super().__init__()
+        size = model.thumbnail_cache.size
+        self.setViewMode(QListView.ViewMode.IconMode)
+        self.setMovement(QListView.Movement.Static)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setUniformItemSizes(True)
+        self.setIconSize(QSize(size, size))
+        self.setGridSize(QSize(size + 16, size + 32))
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setModel(model)
+
+    def visible_rows(self, margin: int = 0) -> range:
+        """:returns: rows of the visible tiles, extended by margin rows on both sides"""
+        grid_size = self.gridSize()
+        viewport = self.viewport().rect()
+        columns = max(viewport.width() // grid_size.width(), 1)
+        first = self.indexAt(QPoint(grid_size.width() // 2, grid_size.height() // 2))
+        first_row = first.row() if first.isValid() else 0
+        visible_count = (viewport.height() // grid_size.height() + 2) * columns
+        return range(max(first_row - margin, 0), min(first_row + visible_count + margin, self.model().rowCount()))
+
+
+class ThumbnailWindow(QWidget):
+    """Window browsing the dataset as a grid of thumbnails, double-clicking a thumbnail shows the image in the main
+    window. Thumbnails scrolled out of view before they were loaded are dropped from the queue"""
+
+    def __init__(self, dataset_path: str, image_files: list[str], open_image: Callable[[str], None]):
+        super().__init__()
+        self.open_image = open_image
+        self.thumbnail_cache = ThumbnailCache(dataset_path)
+        self.thumbnail_model = ThumbnailListModel(self.thumbnail_cache, image_files)
+
+        self.setWindowTitle("Thumbnails")
+        self.layout_setup()
+        self.status_label.setText(f"{len(image_files)} images")
+
+        self.retain_timer = QTimer(self)
+        self.retain_timer.setSingleShot(True)
+        self.retain_timer.timeout.connect(self.retain_visible)
+        self.grid_view.verticalScrollBar().valueChanged.connect(lambda: self.retain_timer.start(50))
+        self.show()
+
+    def layout_setup(self):
+        """Set up the layout of the UI"""
+        box_layout = QVBoxLayout()
+        self.status_label = QLabel("")
+        self.grid_view = ThumbnailGridView(self.thumbnail_model)
+        self.grid_view.doubleClicked.connect(
+            lambda index: self.open_image(self.thumbnail_model.image_files[index.row()]))
+
+        box_layout.addWidget(self.status_label)
+        box_layout.addWidget(self.grid_view)
+        self.setLayout(box_layout)
+        self.resize(900, 700)
+
+    def retain_visible(self):
+        """Drops the queued thumbnails which were scrolled out of view"""
+        image_files = self.thumbnail_model.image_files
+        self.thumbnail_cache.retain({image_files[row] for row in self.grid_view.visible_rows(margin=64)})
+
+    def select_image(self, image_file: str):
+        """Scrolls to the image shown in the main window"""
+        row = self.thumbnail_model.image_rows.get(image_file)
+        if row is not None:
+            index = self.thumbnail_model.index(row)
+            self.grid_view.setCurrentIndex(index)
+            self.grid_view.scrollTo(index)
+
+    def closeEvent(self, event):
+        self.thumbnail_cache.shutdown()
+        event.accept()
@@ -0,0 +1,76 @@
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QProgressBar, QListWidget, QPushButton
+
+from UI.background_workers import ValidationWorker
+from UI.small_custom_widgets import Notify
+
+
+class ValidationWindow(QWidget):
+    """Window showing the dataset validation results live"""
+
+    def __init__(self, dataset_path: str):
+        super().__init__()
+        self.finding_count = 0
+        self.error = None
+
+        self.setWindowTitle("Dataset validation")
+        self.layout_setup()
+
+        self.worker = ValidationWorker(dataset_path)
+        self.worker.findings_found.connect(self.add_findings)
+        self.worker.progress_changed.connect(self.update_progress)
+        self.worker.validation_failed.connect(self.validation_failed)
+        self.worker.finished.connect(self.validation_finished)
+        self.worker.start()
+        self.show()
+
+    def layout_setup(self):
+        """Set up the layout of the UI"""
+        box_layout = QVBoxLayout()
+
+        self.status_label = QLabel("Validating...")
+        self.progress_bar = QProgressBar()
+        self.findings_list = QListWidget()
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel)
+
+        box_layout.addWidget(self.status_label)
+        box_layout.addWidget(self.progress_bar)
+        box_layout.addWidget(self.findings_list)
+        box_layout.addWidget(self.cancel_button)
+        self.setLayout(box_layout)
+
+    def add_findings(self, findings: list):
+        """Appends the findings to the list"""
+        self.finding_count += len(findings)
+        self.findings_list.addItems([f"{finding.file}:{finding.line_number} {finding.kind}" if finding.line_number
+                                     else f"{finding.file} {finding.kind}" for finding in findings])
+
+    def update_progress(self, done: int, total: int):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    def validation_failed(self, error: str):
+        self.error = error
+        Notify(self, f'The validation failed: {error}')
+
+    def validation_finished(self):
+        self.cancel_button.setEnabled(False)
+        if self.error is not None:
+            self.progress_bar.setRange(0, 1)
+            self.progress_bar.reset()
+            self.status_label.setText(f"Validation failed, {self.finding_count} problems found before: {self.error}")
+        elif self.worker.cancel_event.is_set():
+            self.status_label.setText(f"Validation cancelled, {self.finding_count} problems found so far")
+        elif self.finding_count == 0:
+            self.status_label.setText("Dataset valid")
+        else:
+            self.status_label.setText(f"Dataset invalid, {self.finding_count} problems found")
+
+    def cancel(self):
+        self.worker.cancel()
+
+    def closeEvent(self, event):
+        """Stopping the validation before closing"""
+        self.worker.cancel()
+        self.worker.wait()
+        event.accept()
@@ -2,10 +2,12 @@ import os
 
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import QHBoxLayout, QVBoxLayout, QPushButton, QWidget, QTableWidget, QTableWidgetItem, \
-    QHeaderView, QAbstractScrollArea
+    QHeaderView, QAbstractScrollArea, QMessageBox
 from PyQt6.QtCore import Qt
 
-from tools import notfound
+from dataset_tools import remap_yaml_contents
+from class_remapper import RemapReport, remap_dataset, read_remap_journal, resume_remap, rollback_remap
+from UI.small_custom_widgets import Notify
 
 
 class YAMLEditor(QWidget):
@@ -25,6 +27,7 @@ class YAMLEditor(QWidget):
         self.setWindowTitle("YAML Editor")
         self.setWindowIcon(QIcon(os.path.join("resources", "YAML-Editor_LOGO.ico")))
         self.layout_setup()
+        self.finish_interrupted_remap()
         self.read_yaml()
         self.show()
 
@@ -96,45 +99,56 @@ class YAMLEditor(QWidget):
             self.class_numbers_dict.update({self.yolo_table.item(row, 0).text(): self.yolo_table.item(row, 2).text()})
             self.class_names_dict.update({self.yolo_table.item(row, 1).text(): self.yolo_table.item(row, 3).text()})
 
-    def overwrite_yaml(self):
-        """Overwrite existing YAML file with the UI contents"""
+    def new_yaml_contents(self) -> str:
+        """Creates the contents of the YAML file from the UI contents
+        :returns: new YAML file contents"""
         with open(f"{self.database_path}/{self.yaml_path}", 'r') as yaml_reader:
             yaml_contents = yaml_reader.readlines()
-
-        yaml_contents = yaml_contents[yaml_contents.index("names:\n") + 1:]
-        new_yaml_contents = []
-        for line in yaml_contents:
-            line_as_list = line.strip().replace("\n", "").split(": ")
-            space_num = notfound(line, " ")
-
-            if line_as_list[0] in self.class_numbers_dict.keys():
-                line_as_list[0] = self.class_numbers_dict[line_as_list[0]]
-
-            if line_as_list[1] in self.class_names_dict.keys():
-                line_as_list[1] = self.class_names_dict[line_as_list[1]]
-
-            new_yaml_contents.append(space_num * " " + ": ".join(line_as_list) + "\n")
-
-        with open(f"{self.database_path}/{self.yaml_path}", 'w') as yaml_writer:
-            yaml_writer.writelines(self.yaml_header)
-            yaml_writer.writelines(new_yaml_contents)
-
-    def overwrite_dataset(self):
-        """Overwrite labels in the dataset"""
-        for label_file in self.labels_path:
-            with open(f"{self.database_path}/{label_file}", 'r') as label_reader:
-                label_file_contents = label_reader.readlines()
-
-            new_label_file_contents = []
-            for line in label_file_contents:
-                line_as_list = line.split(" ")
-                line_as_list[0] = self.class_numbers_dict[line_as_list[0]]
-                new_label_file_contents.append(" ".join(line_as_list))
-
-            with open(f"{self.database_path}/{label_file}", 'w') as label_writer:
-                label_writer.writelines(new_label_file_contents)
+        return remap_yaml_contents(yaml_contents, self.class_numbers_dict, self.class_names_dict)
+
+    def finish_interrupted_remap(self):
+        """Resumes or rolls back the remap of the labels that was interrupted, e.g. by a crash"""
+        if read_remap_journal(self.database_path) is None:
+            return
+        answer = QMessageBox.question(self, 'Interrupted overwrite',
+                                      'The previous overwrite of the labels was interrupted.\n'
+                                      'Finish it (Yes) or restore the original labels (No)?',
+                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if answer == QMessageBox.StandardButton.Yes:
+            resume_remap(self.database_path)
+        else:
+            rollback_remap(self.database_path)
+
+    def confirm_remap(self, report: RemapReport) -> bool:
+        """Shows how many labels of every class are going to change
+        :returns: True if the user accepted the changes"""
+        summary = [f"{old_number} -> {self.class_numbers_dict[str(old_number)]}: {count} labels"
+                   for old_number, count in sorted(report.class_counts.items())
+                   if self.class_numbers_dict.get(str(old_number), str(old_number)) != str(old_number)]
+        summary += [f"{class_number} (not in the table, kept): {count} labels"
+                    for class_number, count in sorted(report.unmapped_counts.items())]
+        answer = QMessageBox.question(self, 'Confirmation',
+                                      f'{report.changed_files} of {report.files} label files will change\n\n'
+                                      + "\n".join(summary),
+                                      QMessageBox.StandardButton.Ok | QMessageBox.StandardButton.Cancel)
+        return answer == QMessageBox.StandardButton.Ok
+
+    def overwrite_dataset(self) -> bool:
+        """Overwrite labels in the dataset and the YAML file, after a dry run confirmed by the user
+        :returns: True if the dataset was overwritten"""
+        try:
+            report = remap_dataset(self.database_path, self.labels_path, self.class_numbers_dict, dry_run=True)
+        except ValueError:
+            Notify(self, 'Class numbers have to be numbers')
+            return False
+        if not self.confirm_remap(report):
+            return False
+
+        remap_dataset(self.database_path, self.labels_path, self.class_numbers_dict,
+                      replaced_files={self.yaml_path: self.new_yaml_contents()})
+        return True
 
     def overwrite(self):
         self.read_new_classes()
-        self.overwrite_dataset()
-        self.overwrite_yaml()
+        if self.overwrite_dataset():
+            self.close()
@@ -0,0 +1,56 @@
+"""Compares the throughput of per-image and batched detection of FineTuner.
+
+Usage: python -m benchmarks.bench_fine_tuner MODEL_PATH IMAGE_DIRECTORY [--images 64] [--batch-sizes 8 16 32]
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+
+from dataset_tools import get_images_and_labels
+from fine_tuner import FineTuner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-image vs batched FineTuner detection throughput")
+    parser.add_argument("model_path")
+    parser.add_argument("image_directory")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 16, 32])
+    args = parser.parse_args()
+
+    image_files, _ = get_images_and_labels(args.image_directory)
+    images = [cv2.imread(os.path.join(args.image_directory, file)) for file in image_files[:args.images]]
+
+    fine_tuner = FineTuner()
+    fine_tuner.set_model(args.model_path)
+    model_names = fine_tuner.model.names
+    if isinstance(model_names, list):
+        model_names = dict(enumerate(model_names))
+    class_dict = {str(class_id): name for class_id, name in model_names.items()}
+    # Warm-up, the first call pays for the model initialisation
+    fine_tuner.detect(images[0], class_dict)
+
+    results = []
+    start = time.perf_counter()
+    for image in images:
+        fine_tuner.detect(image, class_dict)
+    elapsed = time.perf_counter() - start
+    results.append({"name": "detect", "batch_size": 1, "images": len(images), "seconds": elapsed,
+                    "images_per_second": len(images) / elapsed})
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        for _ in fine_tuner.detect_batch(images, class_dict, batch_size=batch_size):
+            pass
+        elapsed = time.perf_counter() - start
+        results.append({"name": "detect_batch", "batch_size": batch_size, "images": len(images),
+                        "seconds": elapsed, "images_per_second": len(images) / elapsed})
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
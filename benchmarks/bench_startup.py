@@ -0,0 +1,65 @@
+"""Measures the import time of the GUI and the command line with python -X importtime and guards against
+regressions: the run fails if a module that should be imported lazily (yolov5, torch) shows up at startup or if the
+import takes longer than --max-seconds.
+
+Usage: python -m benchmarks.bench_startup [--max-seconds 2.0] [--top 10]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Module imported at startup: modules that must not be imported by it
+ENTRY_POINTS = {
+    "UI.labeller_ui": ["yolov5", "torch"],
+    "yolo_manager": ["yolov5", "torch", "PyQt6", "cv2"],
+}
+
+
+def import_times(module: str) -> list[tuple[str, int, int]]:
+    """Imports the module in a fresh interpreter
+    :returns: list of (imported module, self time in us, cumulative time in us)"""
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=repository,
+                               env=environment, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr}")
+
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_time, cumulative_time, name = line[len("import time:"):].split("|")
+        times.append((name.rstrip(), int(self_time), int(cumulative_time)))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup import time of the entry points")
+    parser.add_argument("--max-seconds", type=float, default=2.0, help="fail if an import takes longer")
+    parser.add_argument("--top", type=int, default=10, help="number of the slowest imports reported")
+    args = parser.parse_args()
+
+    results = []
+    failed = False
+    for entry_point, forbidden_modules in ENTRY_POINTS.items():
+        times = import_times(entry_point)
+        # Top level imports are the ones that aren't indented
+        total = sum(cumulative for name, _, cumulative in times if not name.startswith("  ")) / 1e6
+        imported = {name.strip() for name, _, _ in times}
+        forbidden = sorted(module for module in forbidden_modules if module in imported)
+        slowest = sorted(times, key=lambda time: time[1], reverse=True)[:args.top]
+
+        failed = failed or total > args.max_seconds or len(forbidden) != 0
+        results.append({"name": entry_point, "seconds": total, "forbidden_imports": forbidden,
+                        "slowest": [{"module": name.strip(), "self_seconds": self_time / 1e6}
+                                    for name, self_time, _ in slowest]})
+
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Benchmarks the dataset tools, the label conversions and the image widget on a synthetic dataset. Results are
+printed as JSON; with --compare, the results of a previous run are read and the speed ratio of every benchmark is
+added, so runs before and after a change can be compared.
+
+Usage: python -m benchmarks.bench_suite [--images 2000] [--boxes 1 10] [--repeat 5] [--output results.json]
+                                        [--compare previous.json] [--only NAME ...]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_dataset import generate_dataset
+from dataset_index import DatasetIndex
+from disagreement import ModelPredictions, rank_disagreements
+from dataset_scanner import scan_image_stats
+from duplicate_finder import find_duplicates
+from image_header import probe_image_sizes
+from label_cache import load_label_cache
+from dataset_tools import dataset_checkout, get_available_classes_and_yaml, prepare_dataset_for_training
+from label_tools import LabelStore, label_from_yolo_v5, yolo_v5_from_label, get_iou, iou_matrix, store_from_yolo_v5
+
+
+def measure(function, repeat: int, setup=None) -> dict:
+    """Runs the function repeat times, setup is run before every run and isn't measured
+    :returns: median and minimum time in seconds"""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"seconds": statistics.median(times), "min_seconds": min(times), "repeat": repeat}
+
+
+def random_lines(count: int, rng: np.random.Generator) -> list[str]:
+    boxes = rng.uniform(0.05, 0.95, (count, 4))
+    return [f"{class_id} {x:.6f} {y:.6f} {w / 4:.6f} {h / 4:.6f}\n"
+            for class_id, (x, y, w, h) in zip(rng.integers(0, 3, count).tolist(), boxes.tolist())]
+
+
+def noisy_predictions(dataset_path: str) -> tuple[ModelPredictions, dict]:
+    """Predictions made of the labels of the dataset with shifted boxes, changed classes and dropped labels
+    :returns: (predictions, {image: label file or None})"""
+    dataset_index = DatasetIndex(dataset_path)
+    try:
+        dataset_index.update()
+        image_labels = {image: dataset_index.label_for_image(image) for image in dataset_index.image_files}
+    finally:
+        dataset_index.close()
+
+    rng = np.random.default_rng(0)
+    label_cache = load_label_cache(dataset_path)
+    boxes, class_ids, counts = [], [], []
+    for image, label_file in image_labels.items():
+        labels = label_cache.labels(label_file) if label_file is not None else None
+        kept = rng.random(len(labels)) > 0.1 if labels is not None else np.zeros(0, dtype=bool)
+        image_boxes = labels.boxes[kept] if labels is not None else np.zeros((0, 4), dtype=np.float32)
+        image_class_ids = labels.class_ids[kept] if labels is not None else np.zeros(0, dtype=np.int32)
+        boxes.append(image_boxes + rng.normal(0, 0.01, image_boxes.shape).astype(np.float32))
+        class_ids.append(np.where(rng.random(len(image_class_ids)) > 0.1, image_class_ids, 0).astype(np.int32))
+        counts.append(len(image_class_ids))
+
+    arrays = {"boxes": np.concatenate(boxes), "class_ids": np.concatenate(class_ids),
+              "scores": rng.random(sum(counts)).astype(np.float32), "offsets": np.r_[0, np.cumsum(counts)],
+              "sizes": np.zeros(len(counts), dtype=np.int64), "mtimes": np.zeros(len(counts), dtype=np.int64),
+              "valid": np.ones(len(counts), dtype=bool)}
+    return ModelPredictions("noisy", 0.0, list(image_labels), arrays), image_labels
+
+
+def dataset_benchmarks(dataset_path: str, work_directory: str, repeat: int) -> dict:
+    training_directory = os.path.join(work_directory, "training")
+    predictions, image_labels = noisy_predictions(dataset_path)
+    label_cache = load_label_cache(dataset_path)
+    image_files = list(scan_image_stats(dataset_path))
+    return {
+        "dataset_checkout": measure(lambda: dataset_checkout(dataset_path, use_cache=False), repeat),
+        "dataset_checkout_cached": measure(lambda: dataset_checkout(dataset_path), repeat,
+                                           setup=lambda: dataset_checkout(dataset_path)),
+        "find_duplicates": measure(lambda: find_duplicates(dataset_path, use_cache=False), repeat),
+        "probe_image_sizes": measure(lambda: probe_image_sizes(dataset_path, image_files), repeat),
+        "rank_disagreements": measure(lambda: rank_disagreements(predictions, label_cache, image_labels), repeat),
+        "get_available_classes_and_yaml": measure(lambda: get_available_classes_and_yaml(dataset_path), repeat),
+        "prepare_dataset_for_training": measure(
+            lambda: prepare_dataset_for_training(dataset_path, training_directory, "data.yaml", 0.8),
+            repeat, setup=lambda: shutil.rmtree(training_directory, ignore_errors=True)),
+        "prepare_dataset_for_training_copy": measure(
+            lambda: prepare_dataset_for_training(dataset_path, training_directory, "data.yaml", 0.8,
+                                                 link_files=False),
+            repeat, setup=lambda: shutil.rmtree(training_directory, ignore_errors=True)),
+    }
+
+
+def label_benchmarks(repeat: int) -> dict:
+    rng = np.random.default_rng(0)
+    lines = random_lines(10000, rng)
+    labels = [label_from_yolo_v5(line, "a") for line in lines]
+    iou_labels = labels[:300]
+    iou_store = LabelStore.from_labels(iou_labels)
+    iou_rows = LabelStore.from_labels(iou_labels[:100])
+    return {
+        "label_from_yolo_v5": measure(lambda: [label_from_yolo_v5(line) for line in lines], repeat),
+        "yolo_v5_from_label": measure(lambda: [yolo_v5_from_label(label) for label in labels], repeat),
+        "store_from_yolo_v5": measure(lambda: store_from_yolo_v5(lines), repeat),
+        "get_iou": measure(lambda: [get_iou(label, other) for label in iou_labels[:100] for other in iou_labels],
+                           repeat),
+        "iou_matrix": measure(lambda: iou_matrix(iou_rows, iou_store), repeat),
+    }
+
+
+def interactive_image_benchmarks(repeat: int) -> dict:
+    """Runs InteractiveImage under the offscreen Qt platform"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    import cv2
+    from UI.interactive_image import InteractiveImage
+    from image_cache import read_display_image
+    from tools import class_colour_table
+
+    application = QApplication.instance() or QApplication(sys.argv)
+    image_label = InteractiveImage(lambda *args: None, lambda *args: None)
+    image_label.resize(1280, 720)
+    image = np.random.default_rng(0).integers(0, 256, (2160, 3840, 3), dtype=np.uint8)
+    labels = store_from_yolo_v5(random_lines(500, np.random.default_rng(1)), {"0": "a", "1": "b", "2": "c"})
+    colours = class_colour_table(["0", "1", "2"])
+
+    def zoom_in_and_out():
+        image_label.zoom_changed(4, (640, 360))
+        image_label.zoom_changed(1, (640, 360))
+
+    results = {
+        "interactive_image_resize": measure(lambda: image_label.change_image(image), repeat),
+        "interactive_image_paint_500_labels": measure(lambda: image_label.paint_labels(labels, colours), repeat),
+        "interactive_image_zoom": measure(zoom_in_and_out, repeat),
+    }
+    with tempfile.TemporaryDirectory(prefix="yolo_manager_bench_") as image_directory:
+        image_path = os.path.join(image_directory, "large.jpg")
+        cv2.imwrite(image_path, cv2.resize(image, (6000, 4000)))
+        results["read_display_image_6000x4000"] = measure(lambda: read_display_image(image_path, (1280, 720)),
+                                                          repeat)
+    application.processEvents()
+    return results
+
+
+def yaml_editor_benchmarks(dataset_path: str, repeat: int) -> dict:
+    """Overwrites the dataset with the classes 0 and 1 swapped, every run swaps them back"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    from UI.yaml_editor import YAMLEditor
+    from dataset_tools import get_images_and_labels
+
+    application = QApplication.instance() or QApplication(sys.argv)
+    _, label_files = get_images_and_labels(dataset_path)
+    yaml_editor = YAMLEditor(dataset_path, "data.yaml", label_files, lambda: None)
+    yaml_editor.confirm_remap = lambda report: True
+    yaml_editor.class_numbers_dict = {"0": "1", "1": "0"}
+
+    results = {"yaml_editor_overwrite_dataset": measure(yaml_editor.overwrite_dataset, repeat)}
+    yaml_editor.hide()
+    application.processEvents()
+    return results
+
+
+def compare(results: dict, previous_results: dict) -> dict:
+    """Adds the speed-up against the previous results, above 1 is faster"""
+    for name, result in results["benchmarks"].items():
+        previous = previous_results["benchmarks"].get(name)
+        if previous is not None and result["seconds"] > 0:
+            result["previous_seconds"] = previous["seconds"]
+            result["speedup"] = previous["seconds"] / result["seconds"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite of YOLO Manager")
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--boxes", type=int, nargs=2, default=[1, 10], metavar=("MIN", "MAX"))
+    parser.add_argument("--corrupt", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="file the JSON results are written to")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--only", nargs="+", choices=["dataset", "labels", "interactive_image", "yaml_editor"],
+                        help="run only the chosen groups")
+    args = parser.parse_args()
+    groups = args.only or ["dataset", "labels", "interactive_image", "yaml_editor"]
+
+    work_directory = tempfile.mkdtemp(prefix="yolo_manager_bench_")
+    try:
+        dataset_path = generate_dataset(os.path.join(work_directory, "dataset"), args.images,
+                                        boxes=tuple(args.boxes), corrupt=args.corrupt)
+        benchmarks = dict()
+        if "dataset" in groups:
+            benchmarks.update(dataset_benchmarks(dataset_path, work_directory, args.repeat))
+        if "labels" in groups:
+            benchmarks.update(label_benchmarks(args.repeat))
+        if "interactive_image" in groups:
+            benchmarks.update(interactive_image_benchmarks(args.repeat))
+        if "yaml_editor" in groups:
+            benchmarks.update(yaml_editor_benchmarks(dataset_path, args.repeat))
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    results = {"parameters": {"images": args.images, "boxes": args.boxes, "corrupt": args.corrupt,
+                              "cpu_count": os.cpu_count(), "python": sys.version.split()[0]},
+               "benchmarks": benchmarks}
+    if args.compare:
+        with open(args.compare, "r") as previous_reader:
+            results = compare(results, json.load(previous_reader))
+
+    results_json = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as results_writer:
+            results_writer.write(results_json)
+    print(results_json)
+
+
+if __name__ == "__main__":
+    main()
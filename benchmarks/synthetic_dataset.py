@@ -0,0 +1,104 @@
+"""Writes synthetic YOLO datasets for the benchmarks.
+
+Usage: python -m benchmarks.synthetic_dataset DIRECTORY [--images 1000] [--image-size 640 480] [--boxes 1 10]
+                                               [--classes 3] [--corrupt 0.01] [--nested] [--seed 0]
+"""
+import argparse
+import os
+import random
+
+import cv2
+import numpy as np
+
+# Images are encoded once and written many times, their contents don't matter to the benchmarks
+IMAGE_VARIANTS = 8
+
+
+def encode_images(image_size: tuple[int, int], rng: random.Random) -> list[bytes]:
+    """:returns: JPEG encoded images with a few filled rectangles"""
+    width, height = image_size
+    encoded_images = []
+    for _ in range(IMAGE_VARIANTS):
+        image = np.full((height, width, 3), rng.randrange(256), dtype=np.uint8)
+        for _ in range(5):
+            x_min, y_min = rng.randrange(width), rng.randrange(height)
+            colour = [rng.randrange(256) for _ in range(3)]
+            cv2.rectangle(image, (x_min, y_min), (x_min + width // 5, y_min + height // 5), colour, -1)
+        encoded_images.append(cv2.imencode(".jpg", image)[1].tobytes())
+    return encoded_images
+
+
+def label_lines(boxes: int, classes: int, rng: random.Random) -> list[str]:
+    """:returns: yolo_v5 lines of random boxes inside the image"""
+    lines = []
+    for _ in range(boxes):
+        width, height = rng.uniform(0.02, 0.5), rng.uniform(0.02, 0.5)
+        x_center, y_center = rng.uniform(width / 2, 1 - width / 2), rng.uniform(height / 2, 1 - height / 2)
+        lines.append(f"{rng.randrange(classes)} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
+    return lines
+
+
+def corrupt_line(rng: random.Random) -> str:
+    """:returns: line with a wrong number of values or with a value that isn't a number"""
+    return rng.choice(["0 0.5 0.5 0.1\n", "0 0.5 zero 0.1 0.1\n"])
+
+
+def yaml_contents(classes: int) -> str:
+    names = "".join(f"  {class_number}: class_{class_number}\n" for class_number in range(classes))
+    return f"train: images/train  # train images\nval: images/val  # val images\n\nnames:\n{names}"
+
+
+def generate_dataset(directory: str, images: int = 1000, image_size: tuple[int, int] = (640, 480),
+                     boxes: tuple[int, int] = (1, 10), classes: int = 3, corrupt: float = 0.0,
+                     nested: bool = False, seed: int = 0) -> str:
+    """Writes a dataset of images with random boxes (between boxes[0] and boxes[1] per image) and a yaml file.
+    A corrupt fraction of the label files gets one invalid line. With nested, the images/{train,val} and
+    labels/{train,val} layout is used instead of a flat directory
+    :returns: directory of the dataset"""
+    rng = random.Random(seed)
+    encoded_images = encode_images(image_size, rng)
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "data.yaml"), "w") as yaml_writer:
+        yaml_writer.write(yaml_contents(classes))
+
+    for image_number in range(images):
+        if nested:
+            split = "train" if image_number % 5 else "val"
+            image_directory = os.path.join(directory, "images", split)
+            label_directory = os.path.join(directory, "labels", split)
+        else:
+            image_directory = label_directory = directory
+        if image_number < 2:
+            os.makedirs(image_directory, exist_ok=True)
+            os.makedirs(label_directory, exist_ok=True)
+
+        with open(os.path.join(image_directory, f"image_{image_number:07d}.jpg"), "wb") as image_writer:
+            image_writer.write(encoded_images[image_number % IMAGE_VARIANTS])
+
+        lines = label_lines(rng.randint(*boxes), classes, rng)
+        if rng.random() < corrupt:
+            lines.insert(rng.randrange(len(lines) + 1), corrupt_line(rng))
+        with open(os.path.join(label_directory, f"image_{image_number:07d}.txt"), "w") as label_writer:
+            label_writer.writelines(lines)
+    return directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic YOLO dataset")
+    parser.add_argument("directory")
+    parser.add_argument("--images", type=int, default=1000)
+    parser.add_argument("--image-size", type=int, nargs=2, default=[640, 480], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--boxes", type=int, nargs=2, default=[1, 10], metavar=("MIN", "MAX"))
+    parser.add_argument("--classes", type=int, default=3)
+    parser.add_argument("--corrupt", type=float, default=0.0, help="fraction of label files with an invalid line")
+    parser.add_argument("--nested", action="store_true", help="use the images/ and labels/ subdirectories")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate_dataset(args.directory, args.images, tuple(args.image_size), tuple(args.boxes), args.classes,
+                     args.corrupt, args.nested, args.seed)
+
+
+if __name__ == "__main__":
+    main()
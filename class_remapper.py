@@ -0,0 +1,285 @@
+import json
+import os
+import shutil
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from label_cache import load_label_cache
+
+REMAP_DIRECTORY = ".yolo_manager_remap"
+JOURNAL_NAME = "journal.json"
+BACKUP_DIRECTORY = "backup"
+JOURNAL_VERSION = 1
+
+
+class RemapReport(NamedTuple):
+    """Outcome of remapping (or a dry run of remapping) the label files. class_counts holds the number of label
+    lines of every old class id, unmapped_counts the lines whose class id is missing from the table and therefore
+    left unchanged"""
+    files: int
+    changed_files: int
+    class_counts: dict[int, int]
+    unmapped_counts: dict[int, int]
+
+
+def class_ids_table(class_numbers: dict[str, str]) -> dict[int, str]:
+    """Converts the {old: new} class number dict into {old class id: new class number}
+    :returns: table used by the remapping, raises ValueError if a class number isn't a number"""
+    return {int(float(old_number)): str(int(float(new_number))) for old_number, new_number in class_numbers.items()}
+
+
+def remap_lines(lines: list[str], class_ids: dict[int, str], class_counts: Counter,
+                unmapped_counts: Counter) -> tuple[list[str], bool]:
+    """Replaces the class number at the start of every yolo_v5 line, the coordinates are kept as they are written.
+    Lines that can't be parsed are kept unchanged
+    :returns: (remapped lines, True if any line changed)"""
+    changed = False
+    remapped_lines = []
+    for line in lines:
+        parts = line.split(None, 1)
+        try:
+            class_id = int(float(parts[0]))
+        except (IndexError, ValueError):
+            remapped_lines.append(line)
+            continue
+
+        new_number = class_ids.get(class_id)
+        if new_number is None:
+            unmapped_counts[class_id] += 1
+            remapped_lines.append(line)
+            continue
+
+        class_counts[class_id] += 1
+        remapped_line = f"{new_number} {parts[1]}" if len(parts) > 1 else f"{new_number}\n"
+        changed = changed or remapped_line != line
+        remapped_lines.append(remapped_line)
+    return remapped_lines, changed
+
+
+def backup_path(dataset_path: str, file: str) -> str:
+    return os.path.join(dataset_path, REMAP_DIRECTORY, BACKUP_DIRECTORY, file)
+
+
+def backup_file(path: str, backup: str):
+    """Keeps the original contents of the file in the backup, unless the backup was already made"""
+    try:
+        # The link keeps the original contents alive after the file is replaced, without copying them
+        os.link(path, backup)
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(backup), exist_ok=True)
+        backup_file(path, backup)
+    except OSError:
+        if not os.path.exists(backup):
+            shutil.copy2(path, f"{backup}.tmp")
+            os.replace(f"{backup}.tmp", backup)
+
+
+def replace_file(dataset_path: str, file: str, contents: list[str] | str):
+    """Atomically replaces the file, keeping its original contents in the backup directory. The backup is made
+    before the file is replaced, so every replaced file has its backup"""
+    path = os.path.join(dataset_path, file)
+    with open(f"{path}.remap.tmp", "w") as temp_writer:
+        temp_writer.writelines(contents)
+    backup_file(path, backup_path(dataset_path, file))
+    os.replace(f"{path}.remap.tmp", path)
+
+
+def remap_label_files(dataset_path: str, files: list[str], class_ids: dict[int, str],
+                      dry_run: bool = False) -> tuple[Counter, Counter, int]:
+    """Remaps the class ids of the label files. A file that already has a backup is remapped from the backup,
+    which makes remapping a file again (e.g. when resuming) give the same result
+    :returns: (class counts, unmapped class counts, number of changed files)"""
+    class_counts = Counter()
+    unmapped_counts = Counter()
+    changed_files = 0
+    for file in files:
+        source = backup_path(dataset_path, file)
+        from_backup = not dry_run and os.path.exists(source)
+        if not from_backup:
+            source = os.path.join(dataset_path, file)
+
+        with open(source, "r") as label_reader:
+            lines = label_reader.readlines()
+        remapped_lines, changed = remap_lines(lines, class_ids, class_counts, unmapped_counts)
+
+        if changed:
+            changed_files += 1
+        if not dry_run and (changed or from_backup):
+            replace_file(dataset_path, file, remapped_lines)
+    return class_counts, unmapped_counts, changed_files
+
+
+def read_remap_journal(dataset_path: str) -> dict | None:
+    """:returns: journal of the unfinished remap of the dataset, None if there is none"""
+    try:
+        with open(os.path.join(dataset_path, REMAP_DIRECTORY, JOURNAL_NAME), "r") as journal_reader:
+            journal = json.load(journal_reader)
+    except (OSError, ValueError):
+        return None
+    return journal if journal.get("version") == JOURNAL_VERSION else None
+
+
+def write_remap_journal(dataset_path: str, journal: dict):
+    """Atomically writes the journal and makes sure it reached the disk before any file is touched"""
+    remap_directory = os.path.join(dataset_path, REMAP_DIRECTORY)
+    os.makedirs(remap_directory, exist_ok=True)
+    journal_path = os.path.join(remap_directory, JOURNAL_NAME)
+    with open(f"{journal_path}.tmp", "w") as journal_writer:
+        json.dump(journal, journal_writer, separators=(",", ":"))
+        journal_writer.flush()
+        os.fsync(journal_writer.fileno())
+    os.replace(f"{journal_path}.tmp", journal_path)
+
+
+def finish_remap(dataset_path: str):
+    """Drops the journal and the backups. The journal goes first: a journal without backups would make resuming
+    remap the already remapped files again"""
+    os.remove(os.path.join(dataset_path, REMAP_DIRECTORY, JOURNAL_NAME))
+    shutil.rmtree(os.path.join(dataset_path, REMAP_DIRECTORY), ignore_errors=True)
+
+
+def run_remap(dataset_path: str, label_files: list[str], class_ids: dict[int, str], dry_run: bool, workers: int,
+              shard_size: int, progress_handler: Callable[[int, int], None]) -> RemapReport:
+    """Spreads the label files over a process pool
+    :returns: report of the remap"""
+    class_counts = Counter()
+    unmapped_counts = Counter()
+    changed_files = 0
+    done = 0
+
+    def shard_remapped(shard_files: int, shard_result: tuple[Counter, Counter, int]):
+        nonlocal changed_files, done
+        class_counts.update(shard_result[0])
+        unmapped_counts.update(shard_result[1])
+        changed_files += shard_result[2]
+        done += shard_files
+        if progress_handler is not None:
+            progress_handler(done, len(label_files))
+
+    shards = [label_files[start:start + shard_size] for start in range(0, len(label_files), shard_size)]
+    if len(shards) <= 1:
+        # Not worth starting the worker processes
+        for shard in shards:
+            shard_remapped(len(shard), remap_label_files(dataset_path, shard, class_ids, dry_run))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(remap_label_files, dataset_path, shard, class_ids, dry_run): len(shard)
+                       for shard in shards}
+            for future in as_completed(futures):
+                shard_remapped(futures[future], future.result())
+
+    return RemapReport(len(label_files), changed_files, dict(class_counts), dict(unmapped_counts))
+
+
+def count_values(values: np.ndarray) -> Counter:
+    unique_values, counts = np.unique(values, return_counts=True)
+    return Counter(dict(zip(unique_values.tolist(), counts.tolist())))
+
+
+def dry_run_remap(dataset_path: str, label_files: list[str], class_ids: dict[int, str], workers: int,
+                  shard_size: int, progress_handler: Callable[[int, int], None]) -> RemapReport:
+    """Counts the labels the remap would change from the label cache, without opening the label files. Files the
+    cache couldn't parse are counted from their text, the same way the remap reads them
+    :returns: report of the remap"""
+    label_cache = load_label_cache(dataset_path)
+    selected = np.zeros(len(label_cache), dtype=bool)
+    uncached_files = []
+    for file in label_files:
+        file_index = label_cache.file_index(file)
+        if file_index is None or not label_cache.valid[file_index]:
+            uncached_files.append(file)
+        else:
+            selected[file_index] = True
+
+    label_files_of_labels = label_cache.label_files()
+    selected_labels = selected[label_files_of_labels]
+    old_ids = np.asarray(label_cache.class_ids)[selected_labels].astype(np.int64)
+    file_of_labels = label_files_of_labels[selected_labels]
+
+    mapped_old_ids = np.array(list(class_ids.keys()), dtype=np.int64)
+    mapped_new_ids = np.array([int(new_number) for new_number in class_ids.values()], dtype=np.int64)
+    mapped = np.isin(old_ids, mapped_old_ids)
+    new_ids = old_ids.copy()
+    if len(mapped_old_ids) != 0:
+        order = np.argsort(mapped_old_ids)
+        new_ids[mapped] = mapped_new_ids[order][np.searchsorted(mapped_old_ids[order], old_ids[mapped])]
+    changed_files = int(np.count_nonzero(np.bincount(file_of_labels[new_ids != old_ids],
+                                                     minlength=len(label_cache))))
+
+    class_counts = count_values(old_ids[mapped])
+    unmapped_counts = count_values(old_ids[~mapped])
+
+    if uncached_files:
+        report = run_remap(dataset_path, uncached_files, class_ids, True, workers, shard_size, None)
+        class_counts.update(report.class_counts)
+        unmapped_counts.update(report.unmapped_counts)
+        changed_files += report.changed_files
+    if progress_handler is not None:
+        progress_handler(len(label_files), len(label_files))
+    return RemapReport(len(label_files), changed_files, dict(class_counts), dict(unmapped_counts))
+
+
+def remap_dataset(dataset_path: str, label_files: list[str], class_numbers: dict[str, str], dry_run: bool = False,
+                  replaced_files: dict[str, str] = None, workers: int = None, shard_size: int = 512,
+                  progress_handler: Callable[[int, int], None] = None) -> RemapReport:
+    """Changes the class numbers in the label files according to the {old: new} class number dict, class numbers
+    missing from the dict are left unchanged. Every file is written to a temporary file and renamed over the
+    original. The run is journaled: if it is interrupted, resume_remap finishes it and rollback_remap restores the
+    original files. replaced_files {file: new contents} (e.g. the .yaml file) are replaced as part of the same run.
+    With dry_run nothing is written, only the report is made from the label cache
+    :returns: report of the remap"""
+    class_ids = class_ids_table(class_numbers)
+    if dry_run:
+        return dry_run_remap(dataset_path, label_files, class_ids, workers, shard_size, progress_handler)
+
+    if read_remap_journal(dataset_path) is not None:
+        raise RuntimeError("The dataset has an unfinished remap, it has to be resumed or rolled back first")
+    # Backups without a journal were left by a finished run that was interrupted while cleaning up
+    shutil.rmtree(os.path.join(dataset_path, REMAP_DIRECTORY), ignore_errors=True)
+
+    write_remap_journal(dataset_path, {
+        "version": JOURNAL_VERSION,
+        "class_numbers": class_numbers,
+        "label_files": label_files,
+        "replaced_files": replaced_files or dict()
+    })
+    return resume_remap(dataset_path, workers, shard_size, progress_handler)
+
+
+def resume_remap(dataset_path: str, workers: int = None, shard_size: int = 512,
+                 progress_handler: Callable[[int, int], None] = None) -> RemapReport:
+    """Finishes the remap recorded in the journal, files that were already remapped are remapped again from their
+    backups, so they aren't changed twice
+    :returns: report of the remap"""
+    journal = read_remap_journal(dataset_path)
+    if journal is None:
+        raise RuntimeError("The dataset has no unfinished remap")
+
+    report = run_remap(dataset_path, journal["label_files"], class_ids_table(journal["class_numbers"]), False,
+                       workers, shard_size, progress_handler)
+    for file, contents in journal["replaced_files"].items():
+        replace_file(dataset_path, file, contents)
+    finish_remap(dataset_path)
+    return report
+
+
+def rollback_remap(dataset_path: str):
+    """Restores the files changed by the unfinished remap from their backups"""
+    journal = read_remap_journal(dataset_path)
+    if journal is None:
+        raise RuntimeError("The dataset has no unfinished remap")
+
+    for file in journal["label_files"] + list(journal["replaced_files"].keys()):
+        path = os.path.join(dataset_path, file)
+        backup = backup_path(dataset_path, file)
+        if os.path.exists(backup):
+            os.replace(backup, path)
+        if os.path.exists(f"{path}.remap.tmp"):
+            os.remove(f"{path}.remap.tmp")
+    finish_remap(dataset_path)
@@ -0,0 +1,113 @@
+import os
+import shutil
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, NamedTuple
+
+# ioctl request cloning a whole file on copy-on-write file systems (btrfs, xfs), Linux only
+FICLONE = 0x40049409
+
+
+class CopyProgress(NamedTuple):
+    """Progress of copying a set of files"""
+    files_done: int
+    files_total: int
+    bytes_done: int
+    elapsed: float
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files_done / self.elapsed if self.elapsed > 0 else 0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_done / self.elapsed if self.elapsed > 0 else 0
+
+
+class FileTransfer:
+    """Transfers single files trying the cheapest method first: hard link, reflink and finally a regular copy.
+    A method that fails because the file system doesn't support it is not tried again"""
+
+    def __init__(self, link_files: bool = True):
+        self.link_supported = link_files
+        self.reflink_supported = link_files and sys.platform == "linux"
+
+    def transfer(self, source: str, destination: str) -> int:
+        """Transfers the file
+        :returns: size of the file in bytes"""
+        size = os.stat(source).st_size
+
+        if self.link_supported:
+            try:
+                os.link(source, destination)
+                return size
+            except FileExistsError:
+                os.remove(destination)
+                return self.transfer(source, destination)
+            except OSError:
+                self.link_supported = False
+
+        if self.reflink_supported:
+            try:
+                self.reflink(source, destination)
+                return size
+            except OSError:
+                self.reflink_supported = False
+
+        shutil.copy(source, destination)
+        return size
+
+    @staticmethod
+    def reflink(source: str, destination: str):
+        """Clones the file, sharing its data blocks until one of the copies is modified"""
+        import fcntl
+
+        with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+            try:
+                fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+            except OSError:
+                destination_file.close()
+                os.remove(destination)
+                raise
+
+
+def copy_files(file_pairs: list[tuple[str, str]], workers: int = 16, link_files: bool = True,
+               chunk_size: int = 64, progress_handler: Callable[[CopyProgress], None] = None,
+               cancel_event=None) -> CopyProgress:
+    """Copies (source, destination) file pairs concurrently. With link_files, hard links and reflinks are tried
+    before copying; linked files share their contents with the source, so they must not be modified in place.
+    progress_handler is called after every chunk of files, copying stops once cancel_event is set
+    :returns: progress at the end of copying"""
+    file_transfer = FileTransfer(link_files)
+    chunks = [file_pairs[start:start + chunk_size] for start in range(0, len(file_pairs), chunk_size)]
+
+    def copy_chunk(chunk: list[tuple[str, str]]) -> tuple[int, int]:
+        copied_files = copied_bytes = 0
+        for source, destination in chunk:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            copied_bytes += file_transfer.transfer(source, destination)
+            copied_files += 1
+        return copied_files, copied_bytes
+
+    start = time.perf_counter()
+    files_done = bytes_done = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(copy_chunk, chunk) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                copied_files, copied_bytes = future.result()
+                files_done += copied_files
+                bytes_done += copied_bytes
+                if progress_handler is not None:
+                    progress_handler(CopyProgress(files_done, len(file_pairs), bytes_done,
+                                                  time.perf_counter() - start))
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+
+    return CopyProgress(files_done, len(file_pairs), bytes_done, time.perf_counter() - start)
@@ -0,0 +1,229 @@
+import copy
+import os
+import sqlite3
+from collections import Counter
+from typing import Iterator
+
+from dataset_scanner import IMAGE, LABEL, YAML, iter_dataset_entries, label_name_for_image, label_key, file_kind
+
+INDEX_NAME = ".yolo_manager_index.sqlite"
+INDEX_VERSION = 2
+
+
+def count_label_classes(label_path: str) -> Counter:
+    """Counts the labels of every class in the label file, malformed lines are skipped
+    :returns: Counter {class id: number of labels}"""
+    class_counts = Counter()
+    with open(label_path, "r") as label_reader:
+        for line in label_reader:
+            class_number = line.split(" ", 1)[0]
+            try:
+                class_counts[int(float(class_number))] += 1
+            except ValueError:
+                continue
+    return class_counts
+
+
+class DatasetIndex:
+    """Persistent index of the dataset directory, kept in a SQLite file inside the dataset. Stores image/label
+    pairs, file sizes, mtimes, image dimensions and per-file class counts. The index is refreshed with a single
+    recursive os.scandir pass, only label files whose size or mtime changed are parsed again. File names are paths
+    relative to the dataset, lookups are served from memory in O(1)"""
+
+    def __init__(self, dataset_path: str):
+        self.dataset_path = dataset_path
+        self.image_files = []
+        self.label_files = []
+        self.yaml_files = []
+        self._files = dict()  # {name: (kind, size, mtime_ns)}
+        self._labels_by_stem = dict()
+        self._connection = None
+        # The index isn't thread-safe, it belongs to the thread which opened it, other threads get a snapshot()
+        try:
+            self._connection = sqlite3.connect(os.path.join(dataset_path, INDEX_NAME))
+            self._create_tables()
+        except sqlite3.Error:
+            # Read-only datasets are indexed in memory, the index is built again every time they are opened
+            print("Could not write the dataset index, keeping it in memory")
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = sqlite3.connect(":memory:")
+            self._create_tables()
+
+    def _create_tables(self):
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            self._connection.executescript("""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS class_counts;
+            """)
+        self._connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY, kind TEXT NOT NULL, stem TEXT NOT NULL,
+                size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, width INTEGER, height INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS class_counts (
+                name TEXT NOT NULL, class_id INTEGER NOT NULL, count INTEGER NOT NULL,
+                PRIMARY KEY (name, class_id)
+            );
+            PRAGMA user_version = {INDEX_VERSION};
+        """)
+
+    def close(self):
+        self._connection.close()
+
+    def snapshot(self) -> "DatasetIndex":
+        """Copies the index for a worker thread, the file lists are copied and the database is copied into memory, so
+        the copy doesn't change while the owning thread keeps updating the index
+        :returns: the copy, to be used and closed by a single thread"""
+        index_snapshot = copy.copy(self)
+        index_snapshot.image_files = list(self.image_files)
+        index_snapshot.label_files = list(self.label_files)
+        index_snapshot.yaml_files = list(self.yaml_files)
+        index_snapshot._files = dict(self._files)
+        index_snapshot._labels_by_stem = dict(self._labels_by_stem)
+        # Created here, used by the worker
+        index_snapshot._connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self._connection.backup(index_snapshot._connection)
+        return index_snapshot
+
+    def update(self):
+        """Synchronises the index with the dataset directory, re-reading only added and changed files"""
+        for _ in self.iter_update():
+            pass
+
+    def iter_update(self, batch_size: int = 4096) -> Iterator[list[str]]:
+        """Synchronises the index with the dataset directory while it is being scanned. The file lists are filled in
+        place as the scan goes, the images found are yielded after every batch_size scanned entries, so they can be
+        shown before the scan finishes. The database is synchronised once the scan is complete
+        :returns: generator of lists of newly found images"""
+        self._files.clear()
+        self._labels_by_stem.clear()
+        self.image_files.clear()
+        self.label_files.clear()
+        self.yaml_files.clear()
+
+        new_images = []
+        scanned_entries = 0
+        for name, kind, entry in iter_dataset_entries(self.dataset_path):
+            if kind == YAML:
+                self.yaml_files.append(name)
+                continue
+
+            stat = entry.stat()
+            self._files[name] = (kind, stat.st_size, stat.st_mtime_ns)
+            if kind == IMAGE:
+                self.image_files.append(name)
+                new_images.append(name)
+            else:
+                self.label_files.append(name)
+                self._labels_by_stem[label_key(name)] = name
+
+            scanned_entries += 1
+            if scanned_entries % batch_size == 0:
+                yield new_images
+                new_images = []
+
+        indexed = {name: (kind, size, mtime_ns) for name, kind, size, mtime_ns in
+                   self._connection.execute("SELECT name, kind, size, mtime_ns FROM files")}
+
+        removed = [(name,) for name in indexed.keys() - self._files.keys()]
+        changed = [name for name, stats in self._files.items() if indexed.get(name) != stats]
+
+        with self._connection:
+            self._connection.executemany("DELETE FROM files WHERE name = ?", removed)
+            self._connection.executemany("DELETE FROM class_counts WHERE name = ?", removed)
+        if new_images:
+            yield new_images
+
+        # Changed label files have to be parsed, so they are indexed in batches as well
+        for start in range(0, len(changed), batch_size):
+            with self._connection:
+                for name in changed[start:start + batch_size]:
+                    self._index_file(name, *self._files[name])
+            yield []
+
+    def _index_file(self, name: str, kind: str, size: int, mtime_ns: int):
+        """Writes a single file into the index, must be called inside a transaction"""
+        # Image dimensions stay valid only as long as the image doesn't change
+        self._connection.execute("INSERT OR REPLACE INTO files (name, kind, stem, size, mtime_ns) "
+                                 "VALUES (?, ?, ?, ?, ?)", (name, kind, os.path.splitext(name)[0], size, mtime_ns))
+        if kind == LABEL:
+            self._connection.execute("DELETE FROM class_counts WHERE name = ?", (name,))
+            try:
+                class_counts = count_label_classes(os.path.join(self.dataset_path, name))
+            except OSError:
+                class_counts = Counter()
+            self._connection.executemany("INSERT INTO class_counts (name, class_id, count) VALUES (?, ?, ?)",
+                                         [(name, class_id, count) for class_id, count in class_counts.items()])
+
+    def update_file(self, name: str):
+        """Refreshes a single file after it was written or removed by the application"""
+        path = os.path.join(self.dataset_path, name)
+        with self._connection:
+            if not os.path.exists(path):
+                self._connection.execute("DELETE FROM files WHERE name = ?", (name,))
+                self._connection.execute("DELETE FROM class_counts WHERE name = ?", (name,))
+                if self._files.pop(name, None) is not None and name in self.label_files:
+                    self.label_files.remove(name)
+                    self._labels_by_stem.pop(label_key(name), None)
+                return
+
+            kind = file_kind(name)
+            stat = os.stat(path)
+            self._index_file(name, kind, stat.st_size, stat.st_mtime_ns)
+
+        if name not in self._files and kind == LABEL:
+            self.label_files.append(name)
+            self._labels_by_stem[label_key(name)] = name
+        self._files[name] = (kind, stat.st_size, stat.st_mtime_ns)
+
+    def label_for_image(self, image_name: str) -> str | None:
+        """:returns: name of the label file of the image, None if the image has no labels"""
+        return self._labels_by_stem.get(label_key(label_name_for_image(image_name)))
+
+    def has_file(self, name: str) -> bool:
+        return name in self._files
+
+    def file_stats(self, name: str) -> tuple[int, int] | None:
+        """:returns: (size, mtime_ns) of the file, None if it isn't indexed"""
+        stats = self._files.get(name)
+        return None if stats is None else stats[1:]
+
+    def image_sizes(self, image_stats: dict[str, tuple[int, int]]) -> dict[str, tuple[int, int]]:
+        """:returns: {image: (width, height)} recorded for the images whose (size, mtime_ns) in image_stats didn't
+        change since, (0, 0) for images whose header couldn't be read"""
+        rows = self._connection.execute("SELECT name, size, mtime_ns, width, height FROM files "
+                                        "WHERE kind = ? AND width IS NOT NULL", (IMAGE,))
+        return {name: (width, height) for name, size, mtime_ns, width, height in rows
+                if image_stats.get(name) == (size, mtime_ns)}
+
+    def set_image_sizes(self, image_sizes: dict[str, tuple[int, int, int, int]]):
+        """Records (width, height) of the images as the decoder returns them (after the EXIF orientation) with the
+        (size, mtime_ns) of the image they were read from, {image: (size, mtime_ns, width, height)}. Images that
+        aren't indexed yet are added"""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO files (name, kind, stem, size, mtime_ns, width, height) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                "width = excluded.width, height = excluded.height",
+                [(name, IMAGE, os.path.splitext(name)[0], size, mtime_ns, width, height)
+                 for name, (size, mtime_ns, width, height) in image_sizes.items()])
+
+    def label_class_counts(self, label_name: str) -> dict[int, int]:
+        """:returns: {class id: number of labels} of a single label file"""
+        return dict(self._connection.execute("SELECT class_id, count FROM class_counts WHERE name = ?",
+                                             (label_name,)))
+
+    def iter_label_classes(self) -> Iterator[tuple[str, int]]:
+        """:returns: generator of (label file, class id) of every class present in every label file"""
+        return iter(self._connection.execute("SELECT name, class_id FROM class_counts"))
+
+    def class_counts(self) -> dict[int, int]:
+        """:returns: {class id: number of labels} of the whole dataset"""
+        return dict(self._connection.execute("SELECT class_id, SUM(count) FROM class_counts GROUP BY class_id"))
+
+    def max_class_id(self) -> int:
+        """:returns: the highest class id used in the dataset, -1 if there are no labels"""
+        max_class_id = self._connection.execute("SELECT MAX(class_id) FROM class_counts").fetchone()[0]
+        return -1 if max_class_id is None else max_class_id
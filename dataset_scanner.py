@@ -0,0 +1,78 @@
+import os
+from typing import Iterator
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+LABEL_EXTENSION = '.txt'
+YAML_EXTENSION = '.yaml'
+
+IMAGE = "image"
+LABEL = "label"
+YAML = "yaml"
+
+
+def file_kind(name: str) -> str | None:
+    """Recognises the file by its extension, case-insensitively
+    :returns: IMAGE, LABEL, YAML or None for other files"""
+    extension = os.path.splitext(name)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return IMAGE
+    if extension == LABEL_EXTENSION:
+        return LABEL
+    if extension == YAML_EXTENSION:
+        return YAML
+    return None
+
+
+def iter_dataset_entries(dataset_path: str) -> Iterator[tuple[str, str, os.DirEntry]]:
+    """Lazily walks the dataset directory and its subdirectories with os.scandir, both the flat layout and the
+    images/{train,val} + labels/{train,val} layout are supported. Hidden directories and symlinked directories are
+    skipped. Only the .yaml files of the dataset directory itself are reported
+    :returns: generator of (path relative to the dataset, kind, DirEntry)"""
+    directories = [""]
+    while directories:
+        relative_directory = directories.pop()
+        subdirectories = []
+        with os.scandir(os.path.join(dataset_path, relative_directory)) as entries:
+            for entry in entries:
+                relative_path = os.path.join(relative_directory, entry.name) if relative_directory else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith("."):
+                        subdirectories.append(relative_path)
+                    continue
+
+                kind = file_kind(entry.name)
+                if kind is None or (kind == YAML and relative_directory):
+                    continue
+                yield relative_path, kind, entry
+        # Reversed, so that the subdirectories are walked in the order of the listing
+        directories += reversed(subdirectories)
+
+
+def scan_image_stats(dataset_path: str) -> dict[str, tuple[int, int]]:
+    """:returns: {image file: (size, mtime_ns)} of every image of the dataset"""
+    image_stats = dict()
+    for file, kind, entry in iter_dataset_entries(dataset_path):
+        if kind == IMAGE:
+            stat = entry.stat()
+            image_stats[file] = (stat.st_size, stat.st_mtime_ns)
+    return image_stats
+
+
+def label_name_for_image(image_file: str) -> str:
+    """Creates the path of the label file belonging to the image: the same directory for the flat layout, the
+    matching labels directory if the image is inside an images directory
+    :returns: path of the label file relative to the dataset"""
+    directory, name = os.path.split(image_file)
+    directory_parts = directory.split(os.sep) if directory else []
+    for ind in range(len(directory_parts) - 1, -1, -1):
+        if directory_parts[ind] == "images":
+            directory_parts[ind] = "labels"
+            break
+
+    return os.path.join(*directory_parts, f"{os.path.splitext(name)[0]}{LABEL_EXTENSION}")
+
+
+def label_key(label_file: str) -> str:
+    """Key pairing label files with images regardless of the case of the extension
+    :returns: path of the label file without the extension"""
+    return label_file[:-len(LABEL_EXTENSION)]
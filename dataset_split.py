@@ -0,0 +1,100 @@
+from array import array
+
+import numpy as np
+
+from dataset_index import DatasetIndex
+from label_cache import load_label_cache
+
+
+def image_class_pairs(dataset_path: str, image_labels: list[str | None],
+                      dataset_index: DatasetIndex = None) -> tuple[np.ndarray, np.ndarray]:
+    """Finds the classes present on every image, image_labels gives the label file of every image (None for images
+    without labels). The classes come from an up-to-date dataset index if it is given, from the label cache
+    otherwise, so the label files aren't parsed again
+    :returns: (image indices, class ids) int32 arrays with one element for every class present on an image"""
+    if dataset_index is not None:
+        image_indices = array("i")
+        class_ids = array("i")
+        label_classes = dict()
+        for name, class_id in dataset_index.iter_label_classes():
+            label_classes.setdefault(name, array("i")).append(class_id)
+
+        for image_index, label_file in enumerate(image_labels):
+            for class_id in label_classes.get(label_file, ()):
+                if class_id >= 0:
+                    image_indices.append(image_index)
+                    class_ids.append(class_id)
+        return np.frombuffer(image_indices, dtype=np.int32), np.frombuffer(class_ids, dtype=np.int32)
+
+    label_cache = load_label_cache(dataset_path)
+    file_images = np.full(len(label_cache), -1, dtype=np.int64)
+    for image_index, label_file in enumerate(image_labels):
+        file_index = label_cache.file_index(label_file) if label_file is not None else None
+        if file_index is not None:
+            file_images[file_index] = image_index
+
+    label_images = file_images[label_cache.label_files()]
+    label_class_ids = np.asarray(label_cache.class_ids, dtype=np.int64)
+    kept = (label_images >= 0) & (label_class_ids >= 0)
+    if not kept.any():
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+
+    # Every class is counted once per image
+    class_count = int(label_class_ids[kept].max()) + 1
+    pairs = np.unique(label_images[kept] * class_count + label_class_ids[kept])
+    return (pairs // class_count).astype(np.int32), (pairs % class_count).astype(np.int32)
+
+
+def stratified_split(image_count: int, image_indices: np.ndarray, class_ids: np.ndarray, train_prop: float,
+                     seed: int = 0, groups: np.ndarray = None) -> np.ndarray:
+    """Divides the images into train and val keeping the proportion of every class. Multilabel images are
+    stratified by their rarest class, so rare classes are placed first; images without labels form their own
+    stratum. With 0 < train_prop < 1, every stratum with at least two images gets at least one train and one val
+    image; 0 and 1 put every image into val or train. The result depends only on the inputs and the seed. Images
+    with the same value in groups (e.g. duplicates) are kept in the same split, then the groups are stratified
+    instead of the images, by all the classes of their images
+    :returns: boolean array, True for the train images"""
+    if groups is not None:
+        group_values, image_groups = np.unique(groups, return_inverse=True)
+        class_count = int(class_ids.max()) + 1 if len(class_ids) != 0 else 1
+        pairs = np.unique(image_groups[image_indices].astype(np.int64) * class_count + class_ids)
+        group_mask = stratified_split(len(group_values), (pairs // class_count).astype(np.int32),
+                                      (pairs % class_count).astype(np.int32), train_prop, seed)
+        return group_mask[image_groups]
+
+    # Number of images containing each class
+    class_frequency = np.bincount(class_ids, minlength=1)
+    background_stratum = len(class_frequency)
+
+    # Rarest class of every image: sort the pairs by (image, frequency of the class, class) and take the first
+    strata = np.full(image_count, background_stratum, dtype=np.int32)
+    if len(class_ids) != 0:
+        order = np.lexsort((class_ids, class_frequency[class_ids], image_indices))
+        sorted_images = image_indices[order]
+        first_pairs = order[np.r_[True, sorted_images[1:] != sorted_images[:-1]]]
+        strata[image_indices[first_pairs]] = class_ids[first_pairs]
+
+    # Random order within every stratum
+    random_keys = np.random.default_rng(seed).random(image_count)
+    order = np.lexsort((random_keys, strata))
+    sorted_strata = strata[order]
+    stratum_starts = np.flatnonzero(np.r_[True, sorted_strata[1:] != sorted_strata[:-1]])
+    stratum_sizes = np.diff(np.r_[stratum_starts, image_count])
+
+    train_sizes = np.rint(stratum_sizes * train_prop).astype(np.int64)
+    if 0 < train_prop < 1:
+        train_sizes = np.where(stratum_sizes >= 2, np.clip(train_sizes, 1, stratum_sizes - 1), train_sizes)
+    ranks = np.arange(image_count) - np.repeat(stratum_starts, stratum_sizes)
+
+    train_mask = np.empty(image_count, dtype=bool)
+    train_mask[order] = ranks < np.repeat(train_sizes, stratum_sizes)
+    return train_mask
+
+
+def split_class_counts(train_mask: np.ndarray, image_indices: np.ndarray,
+                       class_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """:returns: (train, val) number of images containing every class, indexed by class id"""
+    pair_in_train = train_mask[image_indices]
+    class_count = int(class_ids.max()) + 1 if len(class_ids) != 0 else 0
+    return (np.bincount(class_ids[pair_in_train], minlength=class_count),
+            np.bincount(class_ids[~pair_in_train], minlength=class_count))
@@ -1,79 +1,304 @@
+import json
 import os.path
-import shutil
 
-from random import shuffle
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import compress
+from typing import Callable, NamedTuple
 
-from tools import directory_checkout, find_string_part_in_list
+import numpy as np
+
+from tools import directory_checkout, find_string_part_in_list, notfound
+from copy_engine import CopyProgress, copy_files
+from dataset_index import DatasetIndex
+from label_cache import load_label_cache
+from dataset_split import image_class_pairs, stratified_split
+from duplicate_finder import compute_image_hashes, duplicate_groups
+from image_header import probe_image_sizes
+from dataset_scanner import IMAGE, LABEL, YAML, iter_dataset_entries, file_kind, label_name_for_image, label_key
 
 
 def get_images_and_labels(directory: str):
-    """Looks for .png, .jpg, .jpeg and .txt files in the given directory, returns their names as a list;
-    paths are returned in relation to the given directory."""
-    all_files = os.listdir(directory)
-    image_files = [file for file in all_files if
-                   file.endswith('.png') or file.endswith('.jpg') or file.endswith('.jpeg')]
-    label_files = [file for file in all_files if file.endswith('.txt')]
+    """Looks for .png, .jpg, .jpeg and .txt files in the given directory and its subdirectories, returns their names
+    as a list; paths are returned in relation to the given directory."""
+    image_files = []
+    label_files = []
+    for file, kind, _ in iter_dataset_entries(directory):
+        if kind == IMAGE:
+            image_files.append(file)
+        elif kind == LABEL:
+            label_files.append(file)
     return image_files, label_files
 
 
-def dataset_checkout(dataset_path: str):
-    """Looks for invalid content in label files, makes sure that every label file has its image"""
-    image_files, label_files = get_images_and_labels(dataset_path)
-
-    verify_flag = True
-    invalid_files = []
-    if len(label_files) == 0:
-        return True, ["Nothing to verify"]
-    else:
-        images_without_extension = [file[:file.index(".")] for file in image_files]
-        for file in label_files:
-            with open(f"{dataset_path}/{file}", "r") as label_reader:
-                label_contents = label_reader.readlines()
-
-            for line in label_contents:
-                # verification of labels FOR YOLOv5, NOT UNIVERSAL,
-                # CHANGE IF DATASET VERIFIER WILL BE IMPLEMENTED
-                line_as_list = line.replace("\n", "").split(" ")
-                if len(line_as_list) != 5:
-                    verify_flag = False
-                    invalid_files.append(file)
-
-                for number in line_as_list:
-                    try:
-                        float(number)
-                    except ValueError:
-                        try:
-                            int(number)
-                        except ValueError:
-                            verify_flag = False
-                            invalid_files.append(file)
-
-            without_extension = file[:file.index(".")]
-            if without_extension not in images_without_extension:
-                verify_flag = False
-                invalid_files.append(file)
-
-    return verify_flag, invalid_files
-
-
-def get_available_classes_and_yaml(dataset_path: str):
-    """Searches for yaml file in the given directory and reads classes present in it"""
+class Finding(NamedTuple):
+    """Single problem found in the dataset, line_number is 0 if the problem concerns the whole file"""
+    file: str
+    line_number: int
+    kind: str
+
+
+WRONG_VALUE_COUNT = "wrong value count"
+NOT_A_NUMBER = "not a number"
+MISSING_IMAGE = "missing image"
+UNREADABLE_IMAGE = "unreadable image header"
+UNUSUAL_ASPECT_RATIO = "unusual aspect ratio"
+MIN_BOX_PIXELS = 2
+TINY_BOX = f"box smaller than {MIN_BOX_PIXELS} px"
+# Images whose aspect ratio differs from the median of the dataset more than this many times are reported
+MAX_ASPECT_RATIO_DEVIATION = 2.0
+
+VALIDATION_CACHE_NAME = ".yolo_manager_validation.json"
+VALIDATION_CACHE_VERSION = 1
+
+
+def validate_label_lines(file: str, lines: list[str]) -> list[Finding]:
+    """Looks for invalid content in the lines of a single label file
+    :returns: list of findings, at most one of each kind per line"""
+    findings = []
+    for line_number, line in enumerate(lines, start=1):
+        # verification of labels FOR YOLOv5, NOT UNIVERSAL,
+        # CHANGE IF DATASET VERIFIER WILL BE IMPLEMENTED
+        line_as_list = line.replace("\n", "").split(" ")
+        if len(line_as_list) != 5:
+            findings.append(Finding(file, line_number, WRONG_VALUE_COUNT))
+
+        for number in line_as_list:
+            try:
+                float(number)
+            except ValueError:
+                findings.append(Finding(file, line_number, NOT_A_NUMBER))
+                break
+    return findings
+
+
+def validate_label_files(dataset_path: str, label_files: list[str]) -> dict[str, list[Finding]]:
+    """Validates the contents of a shard of label files, runs inside the worker processes
+    :returns: {label file: list of its findings}"""
+    findings = dict()
+    for file in label_files:
+        with open(f"{dataset_path}/{file}", "r") as label_reader:
+            findings[file] = validate_label_lines(file, label_reader.readlines())
+    return findings
+
+
+def scan_dataset_files(dataset_path: str) -> tuple[dict[str, tuple[int, int]], dict[str, tuple[int, int]]]:
+    """Scans the dataset directory once, collecting the size and mtime of image and label files
+    :returns: ({image file: (size, mtime_ns)}, {label file: (size, mtime_ns)})"""
+    image_stats = dict()
+    label_stats = dict()
+    for file, kind, entry in iter_dataset_entries(dataset_path):
+        if kind in (IMAGE, LABEL):
+            stat = entry.stat()
+            (image_stats if kind == IMAGE else label_stats)[file] = (stat.st_size, stat.st_mtime_ns)
+    return image_stats, label_stats
+
+
+def label_line_numbers(dataset_path: str, file: str, label_indices: list[int]) -> list[int]:
+    """:returns: line numbers of the label_indices-th labels of the label file, blank lines hold no labels"""
+    with open(os.path.join(dataset_path, file), "r") as label_reader:
+        line_numbers = [line_number for line_number, line in enumerate(label_reader, start=1) if line.strip() != ""]
+    return [line_numbers[label_index] for label_index in label_indices]
+
+
+def pixel_findings(dataset_path: str, image_stats: dict[str, tuple[int, int]],
+                   label_stats: dict[str, tuple[int, int]], image_label_keys: dict[str, str] = None,
+                   workers: int = None, use_cache: bool = True) -> list[Finding]:
+    """Checks that need the image dimensions, which are read from the image headers without decoding the images:
+    images whose header can't be read, images whose aspect ratio differs from the median of the dataset more than
+    MAX_ASPECT_RATIO_DEVIATION times and boxes narrower or lower than MIN_BOX_PIXELS. The dimensions and the labels
+    come from the dataset index and the label cache, so only changed files are read. image_label_keys gives the
+    label_key of the label file of every image, if it is already known
+    :returns: list of findings"""
+    image_files = list(image_stats)
+    if image_label_keys is None:
+        image_label_keys = {file: label_key(label_name_for_image(file)) for file in image_files}
+    dataset_index = DatasetIndex(dataset_path) if use_cache else None
+    try:
+        probed_sizes = probe_image_sizes(dataset_path, image_files, image_stats, workers, dataset_index=dataset_index)
+    finally:
+        if dataset_index is not None:
+            dataset_index.close()
+    findings = [Finding(file, 0, UNREADABLE_IMAGE) for file in image_files if probed_sizes[file] is None]
+    sized_images = [file for file in image_files if probed_sizes[file] is not None]
+    if not sized_images:
+        return findings
+
+    # Labels are normalized to the image as the decoder returns it, after the EXIF orientation
+    image_sizes = np.array([probed_sizes[file] for file in sized_images], dtype=np.float64)
+    aspect_ratios = image_sizes[:, 0] / image_sizes[:, 1]
+    deviations = aspect_ratios / np.median(aspect_ratios)
+    unusual = np.maximum(deviations, 1 / deviations) > MAX_ASPECT_RATIO_DEVIATION
+    findings += [Finding(file, 0, UNUSUAL_ASPECT_RATIO) for file in compress(sized_images, unusual.tolist())]
+
+    label_cache = load_label_cache(dataset_path, label_stats, workers)
+    label_indices = {label_key(file): index for index, file in enumerate(label_cache.files)}
+    # Labels of label files without a readable image compare as False
+    label_image_sizes = np.full((len(label_cache), 2), np.nan)
+    for file, image_size in zip(sized_images, image_sizes):
+        label_index = label_indices.get(image_label_keys[file])
+        if label_index is not None:
+            label_image_sizes[label_index] = image_size
+    label_files = label_cache.label_files()
+    box_pixels = label_cache.boxes[:, 2:] * label_image_sizes[label_files]
+    tiny_boxes = np.flatnonzero((box_pixels < MIN_BOX_PIXELS).any(axis=1))
+
+    # Only the files with tiny boxes are read again, to find the lines of the boxes
+    file_tiny_boxes = defaultdict(list)
+    for box_index, file_index in zip(tiny_boxes.tolist(), label_files[tiny_boxes].tolist()):
+        file_tiny_boxes[file_index].append(box_index - int(label_cache.offsets[file_index]))
+    for file_index, box_indices in file_tiny_boxes.items():
+        file = label_cache.files[file_index]
+        try:
+            line_numbers = label_line_numbers(dataset_path, file, box_indices)
+        except (OSError, IndexError):
+            continue
+        findings += [Finding(file, line_number, TINY_BOX) for line_number in line_numbers]
+    return findings
+
+
+def read_validation_cache(dataset_path: str) -> dict[str, tuple[int, int, list[Finding]]]:
+    """Reads the validation cache of the dataset, an empty cache is returned if it is missing or broken
+    :returns: {label file: (size, mtime_ns, list of findings)}"""
+    try:
+        with open(os.path.join(dataset_path, VALIDATION_CACHE_NAME), "r") as cache_reader:
+            cache_contents = json.load(cache_reader)
+        if cache_contents.get("version") != VALIDATION_CACHE_VERSION:
+            return dict()
+        return {file: (size, mtime_ns, [Finding(file, line_number, kind) for line_number, kind in findings])
+                for file, (size, mtime_ns, findings) in cache_contents["files"].items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        return dict()
+
+
+def write_validation_cache(dataset_path: str, cache: dict[str, tuple[int, int, list[Finding]]]):
+    """Atomically replaces the validation cache of the dataset"""
+    cache_contents = {
+        "version": VALIDATION_CACHE_VERSION,
+        "files": {file: [size, mtime_ns, [[finding.line_number, finding.kind] for finding in findings]]
+                  for file, (size, mtime_ns, findings) in cache.items()}
+    }
+    cache_path = os.path.join(dataset_path, VALIDATION_CACHE_NAME)
+    try:
+        with open(f"{cache_path}.tmp", "w") as cache_writer:
+            json.dump(cache_contents, cache_writer, separators=(",", ":"))
+        os.replace(f"{cache_path}.tmp", cache_path)
+    except OSError:
+        print("Could not write the validation cache")
+
+
+def iter_dataset_findings(dataset_path: str, workers: int = None, shard_size: int = 512,
+                          progress_handler: Callable[[int, int], None] = None, cancel_event=None,
+                          use_cache: bool = True):
+    """Validates the dataset, spreading the label files over a process pool. Yields lists of findings as soon as
+    a shard of files is validated. progress_handler is called with (validated files, all files), validation stops
+    early once cancel_event (e.g. threading.Event) is set. With use_cache only label files whose size or mtime
+    changed since the last run are parsed again. Once the label files are validated, the image headers are read for
+    the checks that need the image dimensions (see pixel_findings)"""
+    image_stats, label_stats = scan_dataset_files(dataset_path)
+    image_label_keys = {file: label_key(label_name_for_image(file)) for file in image_stats}
+    label_keys = set(image_label_keys.values())
+
+    missing_images = [Finding(file, 0, MISSING_IMAGE) for file in label_stats if label_key(file) not in label_keys]
+    if missing_images:
+        yield missing_images
+
+    old_cache = read_validation_cache(dataset_path) if use_cache else dict()
+    # Removed label files are dropped from the cache by rebuilding it from the current scan
+    cache = dict()
+    label_files = []
+    for file, (size, mtime_ns) in label_stats.items():
+        cached = old_cache.get(file)
+        if cached is not None and cached[0] == size and cached[1] == mtime_ns:
+            cache[file] = cached
+        else:
+            label_files.append(file)
+
+    total = len(label_stats)
+    done = len(cache)
+    cached_findings = [finding for _, _, findings in cache.values() for finding in findings]
+    if progress_handler is not None and done:
+        progress_handler(done, total)
+    if cached_findings:
+        yield cached_findings
+
+    def shard_validated(shard_findings: dict[str, list[Finding]]) -> list[Finding]:
+        """Stores the verdicts of a validated shard in the cache"""
+        nonlocal done
+        for file, findings in shard_findings.items():
+            cache[file] = (*label_stats[file], findings)
+        done += len(shard_findings)
+        if progress_handler is not None:
+            progress_handler(done, total)
+        return [finding for findings in shard_findings.values() for finding in findings]
+
+    shards = [label_files[start:start + shard_size] for start in range(0, len(label_files), shard_size)]
+    try:
+        if len(shards) <= 1:
+            # Not worth starting the worker processes
+            for shard in shards:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                findings = shard_validated(validate_label_files(dataset_path, shard))
+                if findings:
+                    yield findings
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            try:
+                futures = [executor.submit(validate_label_files, dataset_path, shard) for shard in shards]
+                for future in as_completed(futures):
+                    if cancel_event is not None and cancel_event.is_set():
+                        return
+                    findings = shard_validated(future.result())
+                    if findings:
+                        yield findings
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        # Verdicts collected so far are valid even if the validation was cancelled
+        if use_cache and (label_files or len(old_cache) != len(cache)):
+            write_validation_cache(dataset_path, cache)
+
+    if cancel_event is not None and cancel_event.is_set():
+        return
+    findings = pixel_findings(dataset_path, image_stats, label_stats, image_label_keys, workers, use_cache)
+    if findings:
+        yield findings
+
+
+def dataset_checkout(dataset_path: str, workers: int = None, progress_handler: Callable[[int, int], None] = None,
+                     cancel_event=None, use_cache: bool = True) -> tuple[bool, list[Finding]]:
+    """Looks for invalid content in label files, makes sure that every label file has its image and checks the
+    boxes and images against the image dimensions
+    :returns: (True if the dataset is valid, list of findings sorted by file and line)"""
+    findings = []
+    for findings_chunk in iter_dataset_findings(dataset_path, workers, progress_handler=progress_handler,
+                                                cancel_event=cancel_event, use_cache=use_cache):
+        findings += findings_chunk
+
+    findings.sort()
+    return len(findings) == 0, findings
+
+
+def get_available_classes_and_yaml(dataset_path: str, dataset_index: DatasetIndex = None):
+    """Searches for yaml file in the given directory and reads classes present in it. Without a yaml file the
+    classes are found in an up-to-date dataset index or in the label cache, so the label files aren't parsed again"""
     yaml_path = None
     available_classes = dict()
-    yaml_file = [file for file in os.listdir(dataset_path) if file.endswith('.yaml')]
-    _, label_files = get_images_and_labels(dataset_path)
+    if dataset_index is not None:
+        yaml_file = dataset_index.yaml_files
+    else:
+        yaml_file = [file for file in os.listdir(dataset_path) if file_kind(file) == YAML]
 
     if len(yaml_file) > 1:
         print('More than one .yaml file found')
     elif len(yaml_file) == 0:
         print("No .yaml file found")
-        max_class_number = 0
-        for label_file in label_files:
-            with open(f"{dataset_path}/{label_file}", "r") as label_reader:
-                labels = label_reader.readlines()
-                for label in labels:
-                    if int(label.split(" ")[0]) > max_class_number:
-                        max_class_number = int(label.split(" ")[0])
+        if dataset_index is not None:
+            max_class_number = max(dataset_index.max_class_id(), 0)
+        else:
+            class_ids = load_label_cache(dataset_path).class_ids
+            max_class_number = max(int(class_ids.max()), 0) if len(class_ids) != 0 else 0
 
         for class_number in range(max_class_number):
             available_classes.update({f"{class_number}": f"{class_number}"})
@@ -85,9 +310,81 @@ def get_available_classes_and_yaml(dataset_path: str):
     return yaml_path, available_classes
 
 
-def prepare_dataset_for_training(dataset_path: str, training_directory: str, yaml_path: str, train_prop):
-    """Dividing the dataset according to the desired proportions and copying it into the selected directory"""
-    image_files, _ = get_images_and_labels(dataset_path)
+def read_yaml_classes(yaml_path: str) -> dict[str, str]:
+    """Reads the classes listed under names: in the yaml file
+    :returns: {class number: class name}"""
+    available_classes = dict()
+    with open(yaml_path, 'r') as yaml_file:
+        yaml_contents = yaml_file.readlines()
+        yaml_contents = yaml_contents[yaml_contents.index("names:\n") + 1:]
+        for yaml_line in yaml_contents:
+            number_and_class = yaml_line.strip().replace("\n", "")
+            object_number, object_class = number_and_class.split(": ")
+            available_classes.update({object_number: object_class})
+    return available_classes
+
+
+def remap_yaml_contents(yaml_contents: list[str], class_numbers: dict[str, str],
+                        class_names: dict[str, str] = None) -> str:
+    """Changes the class numbers and names listed under names: according to the {old: new} dicts, the header and
+    the indentation are kept
+    :returns: new contents of the yaml file"""
+    class_names = class_names or dict()
+    names_start = yaml_contents.index("names:\n") + 1
+    new_yaml_contents = []
+    for line in yaml_contents[names_start:]:
+        line_as_list = line.strip().replace("\n", "").split(": ")
+        space_num = notfound(line, " ")
+
+        if line_as_list[0] in class_numbers.keys():
+            line_as_list[0] = class_numbers[line_as_list[0]]
+
+        if line_as_list[1] in class_names.keys():
+            line_as_list[1] = class_names[line_as_list[1]]
+
+        new_yaml_contents.append(space_num * " " + ": ".join(line_as_list) + "\n")
+
+    return "".join(yaml_contents[:names_start] + new_yaml_contents)
+
+
+def training_file_stems(image_files: list[str]) -> list[str]:
+    """Names of the images in the split directories without the extension. Nested layouts are flattened, images whose
+    names clash get their directory as a prefix, so a/img1.jpg and b/img1.jpg become a_img1 and b_img1
+    :returns: stem of every image, raises ValueError if the names still clash"""
+    stems = [os.path.splitext(os.path.basename(image))[0] for image in image_files]
+    # Lowercase, the training directory may be on a case-insensitive file system
+    stem_counts = Counter(stem.lower() for stem in stems)
+    stems = [os.path.splitext(image)[0].replace(os.sep, "_") if stem_counts[stem.lower()] > 1 else stem
+             for image, stem in zip(image_files, stems)]
+
+    stem_counts = Counter(stem.lower() for stem in stems)
+    clashing_images = [image for image, stem in zip(image_files, stems) if stem_counts[stem.lower()] > 1]
+    if clashing_images:
+        raise ValueError(f"These images would overwrite each other in the training directory: "
+                         f"{', '.join(clashing_images)}")
+    return stems
+
+
+def prepare_dataset_for_training(dataset_path: str, training_directory: str, yaml_path: str, train_prop,
+                                 workers: int = 16, link_files: bool = True,
+                                 progress_handler: Callable[[CopyProgress], None] = None,
+                                 cancel_event=None, dataset_index: DatasetIndex = None,
+                                 seed: int = 0, duplicate_distance: int = None) -> CopyProgress:
+    """Dividing the dataset according to the desired proportions and copying it into the selected directory.
+    The split is stratified by the classes present on the images and is the same for the same seed, files are
+    copied concurrently by the copy engine. An up-to-date dataset index saves listing the directory and reading the
+    label files. With duplicate_distance, images whose perceptual hashes differ in at most that many bits are kept
+    in the same split, so near-duplicates can't leak from train into val
+    :returns: progress at the end of copying, raises ValueError if images would overwrite each other"""
+    if dataset_index is not None:
+        image_files, label_files = list(dataset_index.image_files), dataset_index.label_files
+    else:
+        image_files, label_files = get_images_and_labels(dataset_path)
+    label_files = {label_key(label_file): label_file for label_file in label_files}
+    # Sorted, so that the split doesn't depend on the order of the directory listing
+    image_files = sorted(image_files)
+    # Clashing names are refused before anything is written
+    training_stems = training_file_stems(image_files)
 
     # Get the relative paths saved in the yaml file
     with open(f"{dataset_path}/{yaml_path}", "r") as yaml_reader:
@@ -116,29 +413,23 @@ def prepare_dataset_for_training(dataset_path: str, training_directory: str, yam
     except PermissionError:
         print("FIX THE PERMISSION ERROR!")
 
-    number_of_train_images = int(train_prop * len(image_files))
-
-    shuffle(image_files)
-
-    train_images = image_files[:number_of_train_images]
-    val_images = image_files[number_of_train_images:]
-
-    for train_image in train_images:
-        shutil.copy(os.path.join(dataset_path, str(train_image)),
-                    os.path.join(train_images_full_path, str(train_image)))
-
-        labels_name = f"{train_image[:train_image.index('.')]}.txt"
-        labels_path = os.path.join(dataset_path, labels_name)
-
-        if os.path.exists(labels_path):
-            shutil.copy(labels_path, os.path.join(train_labels_full_path, labels_name))
-
-    for val_image in val_images:
-        shutil.copy(os.path.join(dataset_path, str(val_image)),
-                    os.path.join(val_images_full_path, str(val_image)))
-
-        labels_name = f"{val_image[:val_image.index('.')]}.txt"
-        labels_path = os.path.join(dataset_path, labels_name)
-
-        if os.path.exists(labels_path):
-            shutil.copy(labels_path, os.path.join(val_labels_full_path, labels_name))
+    image_labels = [label_files.get(label_key(label_name_for_image(image))) for image in image_files]
+    image_indices, class_ids = image_class_pairs(dataset_path, image_labels, dataset_index)
+    groups = None
+    if duplicate_distance is not None:
+        groups = duplicate_groups(compute_image_hashes(dataset_path, image_files), duplicate_distance)
+    train_mask = stratified_split(len(image_files), image_indices, class_ids, train_prop, seed, groups).tolist()
+
+    file_pairs = []
+    # Images of nested layouts are flattened into the split directories
+    for image, labels_name, in_train, stem in zip(image_files, image_labels, train_mask, training_stems):
+        images_full_path, labels_full_path = ((train_images_full_path, train_labels_full_path) if in_train else
+                                              (val_images_full_path, val_labels_full_path))
+        file_pairs.append((os.path.join(dataset_path, image),
+                           os.path.join(images_full_path, stem + os.path.splitext(image)[1])))
+        if labels_name is not None:
+            file_pairs.append((os.path.join(dataset_path, labels_name),
+                               os.path.join(labels_full_path, stem + os.path.splitext(labels_name)[1])))
+
+    return copy_files(file_pairs, workers, link_files, progress_handler=progress_handler,
+                      cancel_event=cancel_event)
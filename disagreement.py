@@ -0,0 +1,218 @@
+import json
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from dataset_scanner import scan_image_stats
+from fine_tuner import FineTuner, batched
+from label_cache import LabelCache
+from label_tools import LabelStore, iou_matrix, match_ious
+
+PREDICTIONS_NAME = ".yolo_manager_predictions.npz"
+PREDICTIONS_VERSION = 2
+
+
+class Disagreement(NamedTuple):
+    image: str
+    missed: int  # labels without a matching detection
+    extra: int  # detections without a matching label
+    class_mismatches: int  # matched label and detection of different classes
+    low_iou: int  # matched label and detection of the same class overlapping less than good_iou
+    mean_iou: float  # mean IOU of the matched pairs
+    score: float
+
+
+class ModelPredictions:
+    """Detections of a model on every image of the dataset, kept in a single file next to the dataset. The
+    detections are stored down to a low score, so the ranking can be computed again with other thresholds, or after
+    the labels changed, without running the model. Like in the label cache, the detections of all images are kept in
+    contiguous arrays with per-image offsets. Images are invalidated by their size and mtime, the whole predictions
+    by the size and mtime of the model file (model_stats), so retrained weights saved under the same path are run
+    again"""
+
+    def __init__(self, model_path: str, min_score: float, image_files: list[str], arrays: dict[str, np.ndarray],
+                 model_stats: tuple[int, int] | None = None):
+        self.model_path = model_path
+        self.model_stats = model_stats
+        self.min_score = min_score
+        self.image_files = image_files
+        self.boxes = arrays["boxes"]
+        self.class_ids = arrays["class_ids"]
+        self.scores = arrays["scores"]
+        self.offsets = arrays["offsets"]
+        self.sizes = arrays["sizes"]
+        self.mtimes = arrays["mtimes"]
+        self.valid = arrays["valid"]
+
+    def __len__(self):
+        return len(self.image_files)
+
+    def detections(self, index: int, score_threshold: float = 0.0) -> LabelStore:
+        """:returns: detections of the index-th image with a score of at least score_threshold"""
+        start, end = self.offsets[index], self.offsets[index + 1]
+        kept = self.scores[start:end] >= score_threshold
+        return LabelStore(self.boxes[start:end][kept], self.class_ids[start:end][kept])
+
+    @classmethod
+    def load(cls, dataset_path: str) -> "ModelPredictions | None":
+        """:returns: the saved predictions, None if there are none"""
+        try:
+            with np.load(os.path.join(dataset_path, PREDICTIONS_NAME)) as saved:
+                header = json.loads(str(saved["header"]))
+                if header.get("version") != PREDICTIONS_VERSION:
+                    return None
+                arrays = {name: saved[name] for name in ("boxes", "class_ids", "scores", "offsets", "sizes",
+                                                         "mtimes", "valid")}
+                image_files = saved["image_files"].tolist()
+        except (OSError, ValueError, KeyError):
+            return None
+        model_stats = tuple(header["model_stats"]) if header.get("model_stats") is not None else None
+        return cls(header["model_path"], header["min_score"], image_files, arrays, model_stats)
+
+    def save(self, dataset_path: str):
+        """Atomically replaces the saved predictions of the dataset"""
+        predictions_path = os.path.join(dataset_path, PREDICTIONS_NAME)
+        header = {"version": PREDICTIONS_VERSION, "model_path": self.model_path, "model_stats": self.model_stats,
+                  "min_score": self.min_score}
+        try:
+            with open(f"{predictions_path}.tmp", "wb") as predictions_writer:
+                np.savez(predictions_writer, header=np.array(json.dumps(header)),
+                         image_files=np.array(self.image_files, dtype=str), boxes=self.boxes,
+                         class_ids=self.class_ids, scores=self.scores, offsets=self.offsets, sizes=self.sizes,
+                         mtimes=self.mtimes, valid=self.valid)
+            os.replace(f"{predictions_path}.tmp", predictions_path)
+        except OSError:
+            print("Could not write the model predictions")
+
+
+def model_file_stats(model_path: str) -> tuple[int, int] | None:
+    """:returns: (size, mtime_ns) of the model file, None if it can't be read (e.g. a model downloaded by name)"""
+    try:
+        stat = os.stat(model_path)
+    except (OSError, TypeError):
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_image(image_path: str):
+    """:returns: cv2 image (numpy.ndarray) in BGR format, None if the image can't be decoded"""
+    # Imported here, so that the command line doesn't load OpenCV until the model is run
+    import cv2
+
+    return cv2.imread(image_path)
+
+
+def collect_predictions(fine_tuner: FineTuner, dataset_path: str, image_files: list[str], min_score: float = 0.05,
+                        batch_size: int = 16, progress_handler: Callable[[int, int], None] = None,
+                        cancel_event=None) -> ModelPredictions:
+    """Runs the loaded model on the images batch_size at a time, the next batch is decoded on a background thread
+    while the model runs. Saved detections of the same model are reused for images whose size and mtime didn't
+    change. The detections are saved next to the dataset, also when cancel_event is set, then the images that weren't
+    run yet are left out. Nothing is reused if the model file can't be read
+    :returns: the detections of every image"""
+    image_stats = scan_image_stats(dataset_path)
+    model_stats = model_file_stats(fine_tuner.model_path)
+    old_predictions = ModelPredictions.load(dataset_path)
+    if old_predictions is not None and (old_predictions.model_path != fine_tuner.model_path or model_stats is None or
+                                        old_predictions.model_stats != model_stats or
+                                        old_predictions.min_score > min_score):
+        old_predictions = None
+
+    # {image: (boxes, class ids, scores, valid)}
+    image_detections = dict()
+    if old_predictions is not None:
+        for index, (image, size, mtime_ns, valid) in enumerate(zip(
+                old_predictions.image_files, old_predictions.sizes.tolist(), old_predictions.mtimes.tolist(),
+                old_predictions.valid.tolist())):
+            if image_stats.get(image) == (size, mtime_ns):
+                start, end = old_predictions.offsets[index], old_predictions.offsets[index + 1]
+                image_detections[image] = (old_predictions.boxes[start:end], old_predictions.class_ids[start:end],
+                                           old_predictions.scores[start:end], valid)
+    changed_images = [image for image in image_files if image not in image_detections and image in image_stats]
+
+    done = len(image_files) - len(changed_images)
+    if progress_handler is not None:
+        progress_handler(done, len(image_files))
+
+    def read_batch(batch: list[str]) -> list:
+        return [read_image(os.path.join(dataset_path, image)) for image in batch]
+
+    batches = list(batched(changed_images, batch_size))
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_images = executor.submit(read_batch, batches[0]) if batches else None
+        for batch_index, batch in enumerate(batches):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            images = next_images.result()
+            if batch_index + 1 < len(batches):
+                next_images = executor.submit(read_batch, batches[batch_index + 1])
+
+            decoded = [image is not None for image in images]
+            detections = iter(fine_tuner.predict_with_scores([image for image in images if image is not None],
+                                                             min_score) if any(decoded) else [])
+            for image_file, is_decoded in zip(batch, decoded):
+                if is_decoded:
+                    labels, scores = next(detections)
+                    image_detections[image_file] = (labels.boxes, labels.class_ids, scores, True)
+                else:
+                    image_detections[image_file] = (np.zeros((0, 4), dtype=np.float32),
+                                                    np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32), False)
+            done += len(batch)
+            if progress_handler is not None:
+                progress_handler(done, len(image_files))
+
+    predicted_images = [image for image in image_files if image in image_detections]
+    detections = [image_detections[image] for image in predicted_images]
+    arrays = {
+        "boxes": np.concatenate([np.zeros((0, 4), dtype=np.float32)] + [boxes for boxes, _, _, _ in detections]),
+        "class_ids": np.concatenate([np.zeros(0, dtype=np.int32)] + [class_ids for _, class_ids, _, _ in detections]),
+        "scores": np.concatenate([np.zeros(0, dtype=np.float32)] + [scores for _, _, scores, _ in detections]),
+        "offsets": np.r_[0, np.cumsum([len(scores) for _, _, scores, _ in detections], dtype=np.int64)],
+        "sizes": np.array([image_stats[image][0] for image in predicted_images], dtype=np.int64),
+        "mtimes": np.array([image_stats[image][1] for image in predicted_images], dtype=np.int64),
+        "valid": np.array([valid for _, _, _, valid in detections], dtype=bool),
+    }
+    predictions = ModelPredictions(fine_tuner.model_path, min_score, predicted_images, arrays, model_stats)
+    predictions.save(dataset_path)
+    return predictions
+
+
+def image_disagreement(image: str, labels: LabelStore, detections: LabelStore, match_iou: float,
+                       good_iou: float) -> Disagreement:
+    """Matches the labels with the detections one-to-one by IOU regardless of the class and counts the differences,
+    every missed box, extra box, class mismatch and low IOU match adds 1 to the score"""
+    ious = iou_matrix(labels, detections)
+    label_indices, detection_indices = match_ious(ious, match_iou)
+    matched_ious = ious[label_indices, detection_indices]
+    same_class = labels.class_ids[label_indices] == detections.class_ids[detection_indices]
+
+    missed = len(labels) - len(label_indices)
+    extra = len(detections) - len(detection_indices)
+    class_mismatches = int(np.count_nonzero(~same_class))
+    low_iou = int(np.count_nonzero(same_class & (matched_ious < good_iou)))
+    mean_iou = float(matched_ious.mean()) if len(matched_ious) != 0 else float(missed == extra == 0)
+    return Disagreement(image, missed, extra, class_mismatches, low_iou, mean_iou,
+                        float(missed + extra + class_mismatches + low_iou))
+
+
+def rank_disagreements(predictions: ModelPredictions, label_cache: LabelCache, image_labels: dict[str, str | None],
+                       score_threshold: float = 0.5, match_iou: float = 0.5,
+                       good_iou: float = 0.75) -> list[Disagreement]:
+    """Compares the saved detections above score_threshold with the current labels of every image, image_labels
+    gives the label file of every image (None for images without labels). Images that couldn't be decoded are left
+    out
+    :returns: disagreements sorted from the worst image, images with the same score by their mean IOU"""
+    disagreements = []
+    for index, image in enumerate(predictions.image_files):
+        if not predictions.valid[index] or image not in image_labels:
+            continue
+        label_file = image_labels[image]
+        labels = label_cache.labels(label_file) if label_file is not None else None
+        disagreements.append(image_disagreement(image, labels if labels is not None else LabelStore(),
+                                                predictions.detections(index, score_threshold), match_iou,
+                                                good_iou))
+    disagreements.sort(key=lambda disagreement: (-disagreement.score, disagreement.mean_iou, disagreement.image))
+    return disagreements
@@ -0,0 +1,274 @@
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations
+from math import comb
+from typing import Callable
+
+import numpy as np
+
+from dataset_scanner import scan_image_stats
+
+HASH_CACHE_NAME = ".yolo_manager_hashes.json"
+HASH_CACHE_VERSION = 1
+HASH_BITS = 64
+NO_HASH = -1  # Hash of the images that couldn't be decoded
+
+_BYTE_BIT_COUNTS = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def perceptual_hash(image_path: str) -> int | None:
+    """64-bit DCT perceptual hash of the image, the image is decoded at a quarter of its resolution in grayscale,
+    shrunk to 32x32 and the 8x8 lowest frequencies are compared with their median
+    :returns: the hash, None if the image can't be decoded"""
+    # Imported here, so that the command line doesn't load OpenCV until the images are hashed
+    import cv2
+
+    image = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        return None
+    image = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    frequencies = cv2.dct(image)[:8, :8].flatten()
+    # The constant component only reflects the brightness, it's left out of the median
+    bits = frequencies > np.median(frequencies[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_image_files(dataset_path: str, files: list[str]) -> list[int]:
+    """:returns: perceptual hash of every file, NO_HASH for the files that can't be decoded"""
+    hashes = []
+    for file in files:
+        image_hash = perceptual_hash(os.path.join(dataset_path, file))
+        hashes.append(NO_HASH if image_hash is None else image_hash)
+    return hashes
+
+
+def read_hash_cache(dataset_path: str) -> dict[str, tuple[int, int, int]]:
+    """Reads the hash cache of the dataset, an empty cache is returned if it is missing or broken
+    :returns: {image file: (size, mtime_ns, hash)}"""
+    try:
+        with open(os.path.join(dataset_path, HASH_CACHE_NAME), "r") as cache_reader:
+            cache_contents = json.load(cache_reader)
+        if cache_contents.get("version") != HASH_CACHE_VERSION:
+            return dict()
+        return {file: (size, mtime_ns, image_hash)
+                for file, (size, mtime_ns, image_hash) in cache_contents["files"].items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        return dict()
+
+
+def write_hash_cache(dataset_path: str, cache: dict[str, tuple[int, int, int]]):
+    """Atomically replaces the hash cache of the dataset"""
+    cache_path = os.path.join(dataset_path, HASH_CACHE_NAME)
+    try:
+        with open(f"{cache_path}.tmp", "w") as cache_writer:
+            json.dump({"version": HASH_CACHE_VERSION, "files": cache}, cache_writer, separators=(",", ":"))
+        os.replace(f"{cache_path}.tmp", cache_path)
+    except OSError:
+        print("Could not write the hash cache")
+
+
+def compute_image_hashes(dataset_path: str, image_files: list[str], image_stats: dict[str, tuple[int, int]] = None,
+                         workers: int = None, shard_size: int = 256,
+                         progress_handler: Callable[[int, int], None] = None, use_cache: bool = True) -> np.ndarray:
+    """Hashes the images in a process pool, only images whose size or mtime changed since the last run are decoded
+    again. progress_handler is called with (hashed images, all images)
+    :returns: int64 array with the hash of every image (the bits of the unsigned hash), NO_HASH if it can't be
+    decoded"""
+    if image_stats is None:
+        image_stats = scan_image_stats(dataset_path)
+    old_cache = read_hash_cache(dataset_path) if use_cache else dict()
+    cache = dict()
+    changed_files = []
+    for file in image_files:
+        stats = image_stats.get(file)
+        cached = old_cache.get(file)
+        if stats is not None and cached is not None and tuple(cached[:2]) == tuple(stats):
+            cache[file] = cached
+        else:
+            changed_files.append(file)
+
+    total = len(image_files)
+    done = total - len(changed_files)
+    if progress_handler is not None and done:
+        progress_handler(done, total)
+
+    file_hashes = {file: cached[2] for file, cached in cache.items()}
+
+    def shard_hashed(shard: list[str], hashes: list[int]):
+        nonlocal done
+        for file, image_hash in zip(shard, hashes):
+            file_hashes[file] = image_hash
+            if file in image_stats:
+                cache[file] = (*image_stats[file], image_hash)
+        done += len(shard)
+        if progress_handler is not None:
+            progress_handler(done, total)
+
+    shards = [changed_files[start:start + shard_size] for start in range(0, len(changed_files), shard_size)]
+    if len(shards) <= 1:
+        # Not worth starting the worker processes
+        for shard in shards:
+            shard_hashed(shard, hash_image_files(dataset_path, shard))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(hash_image_files, dataset_path, shard): shard for shard in shards}
+            for future in as_completed(futures):
+                shard_hashed(futures[future], future.result())
+
+    if use_cache and (changed_files or len(old_cache) != len(cache)):
+        write_hash_cache(dataset_path, cache)
+    # Hashes with the highest bit set don't fit into int64, they are stored with the same bits as negative numbers,
+    # NO_HASH stays -1
+    hashes = [image_hash - (1 << HASH_BITS) if image_hash >= 1 << (HASH_BITS - 1) else image_hash
+              for image_hash in (file_hashes[file] for file in image_files)]
+    return np.array(hashes, dtype=np.int64)
+
+
+def bit_counts(values: np.ndarray) -> np.ndarray:
+    """:returns: number of set bits of every 64-bit value"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values.view(np.uint64)).astype(np.int64)
+    return _BYTE_BIT_COUNTS[values.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.int64)
+
+
+def part_flip_masks(part_bits: int, max_distance: int) -> list[int]:
+    """:returns: every mask of part_bits bits with at most max_distance bits set"""
+    masks = [0]
+    for distance in range(1, max_distance + 1):
+        masks += [sum(1 << bit for bit in bits) for bits in combinations(range(part_bits), distance)]
+    return masks
+
+
+def multi_index_part_count(hash_count: int, max_distance: int) -> int:
+    """Chooses the number of parts of the multi-index hashing by the estimated number of lookups and compared pairs:
+    more parts mean fewer lookups per part but more hashes sharing a part
+    :returns: number of parts"""
+    def estimated_work(part_count: int) -> float:
+        part_bits = HASH_BITS / part_count
+        lookups = part_count * sum(comb(int(part_bits), distance)
+                                   for distance in range(max_distance // part_count + 1))
+        return lookups * hash_count * (1 + hash_count / 2 ** part_bits)
+    return min(range(1, min(max_distance + 1, HASH_BITS) + 1), key=estimated_work)
+
+
+def similar_hash_pairs(hashes: np.ndarray, max_distance: int) -> tuple[np.ndarray, np.ndarray]:
+    """Finds every pair of distinct hashes within max_distance differing bits by multi-index hashing: the hash is
+    cut into parts, two hashes within the distance have at least one part within max_distance // number of parts.
+    Every part and its variants within that distance are looked up in a table of the same part of all hashes, so
+    only hashes close in a whole part are compared instead of every pair
+    :returns: (first, second) indices of the similar pairs, first < second, pairs may repeat"""
+    unsigned_hashes = hashes.view(np.uint64)
+    first_pairs = [np.zeros(0, dtype=np.int64)]
+    second_pairs = [np.zeros(0, dtype=np.int64)]
+    if len(hashes) < 2:
+        return first_pairs[0], second_pairs[0]
+
+    part_count = multi_index_part_count(len(hashes), max_distance)
+    part_distance = max_distance // part_count
+    part_bounds = np.linspace(0, HASH_BITS, part_count + 1).astype(np.int64).tolist()
+    for part_start, part_end in zip(part_bounds[:-1], part_bounds[1:]):
+        part_bits = part_end - part_start
+        parts = (unsigned_hashes >> np.uint64(part_start)) & np.uint64((1 << part_bits) - 1)
+        order = np.argsort(parts, kind="stable")
+        sorted_parts = parts[order]
+        if part_bits <= 24:
+            # Narrow parts index a table of the ranges of the sorted hashes directly
+            table_counts = np.bincount(parts.astype(np.int64), minlength=1 << part_bits)
+            table_starts = np.cumsum(table_counts) - table_counts
+
+        for flip_mask in part_flip_masks(part_bits, part_distance):
+            probes = parts ^ np.uint64(flip_mask)
+            if part_bits <= 24:
+                starts = table_starts[probes.astype(np.int64)]
+                counts = table_counts[probes.astype(np.int64)]
+            else:
+                starts = np.searchsorted(sorted_parts, probes, side="left")
+                counts = np.searchsorted(sorted_parts, probes, side="right") - starts
+            # Every hash is paired with all hashes of its range of the sorted table
+            first = np.repeat(np.arange(len(hashes)), counts)
+            range_offsets = np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+            second = order[np.repeat(starts, counts) + range_offsets]
+
+            kept = first < second
+            first, second = first[kept], second[kept]
+            similar = bit_counts(unsigned_hashes[first] ^ unsigned_hashes[second]) <= max_distance
+            first_pairs.append(first[similar])
+            second_pairs.append(second[similar])
+    return np.concatenate(first_pairs), np.concatenate(second_pairs)
+
+
+def connected_groups(count: int, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """:returns: group of every element, elements connected by the pairs share the group, which is the smallest
+    element of the group"""
+    groups = np.arange(count)
+    while True:
+        smaller = np.minimum(groups[first], groups[second])
+        new_groups = groups.copy()
+        np.minimum.at(new_groups, first, smaller)
+        np.minimum.at(new_groups, second, smaller)
+        # Pointer jumping, every element points to the root of its group
+        while True:
+            jumped = new_groups[new_groups]
+            if np.array_equal(jumped, new_groups):
+                break
+            new_groups = jumped
+        if np.array_equal(new_groups, groups):
+            return groups
+        groups = new_groups
+
+
+def duplicate_groups(hashes: np.ndarray, max_distance: int = 4) -> np.ndarray:
+    """Groups the images whose hashes are within max_distance differing bits, directly or through other images.
+    Images without a hash are never duplicates
+    :returns: group of every image, images with the same group are duplicates"""
+    groups = np.arange(len(hashes))
+    hashed = np.flatnonzero(hashes != NO_HASH)
+    if len(hashed) == 0:
+        return groups
+
+    # Identical hashes are compared only once
+    unique_hashes, hash_images = np.unique(hashes[hashed], return_inverse=True)
+    hash_groups = connected_groups(len(unique_hashes), *similar_hash_pairs(unique_hashes, max_distance))
+    # The group of every image is the first image with a hash of the group
+    first_images = np.full(len(unique_hashes), len(hashes), dtype=np.int64)
+    np.minimum.at(first_images, hash_groups[hash_images], hashed)
+    groups[hashed] = first_images[hash_groups[hash_images]]
+    return groups
+
+
+def duplicate_clusters(image_files: list[str], groups: np.ndarray) -> list[list[str]]:
+    """:returns: the images of every group with more than one image, largest clusters first"""
+    clusters = dict()
+    for image_file, group in zip(image_files, groups.tolist()):
+        clusters.setdefault(group, []).append(image_file)
+    return sorted((cluster for cluster in clusters.values() if len(cluster) > 1), key=len, reverse=True)
+
+
+def image_split(image_file: str) -> str | None:
+    """:returns: split directory of the image in the images/{train,val} layout, None for the flat layout"""
+    directory_parts = os.path.dirname(image_file).split(os.sep)
+    for ind in range(len(directory_parts) - 2, -1, -1):
+        if directory_parts[ind] == "images":
+            return directory_parts[ind + 1]
+    return None
+
+
+def leaking_clusters(clusters: list[list[str]]) -> list[list[str]]:
+    """:returns: clusters of duplicates that are in more than one split directory of the dataset"""
+    return [cluster for cluster in clusters
+            if len({image_split(image_file) for image_file in cluster} - {None}) > 1]
+
+
+def find_duplicates(dataset_path: str, image_files: list[str] = None, max_distance: int = 4, workers: int = None,
+                    progress_handler: Callable[[int, int], None] = None,
+                    use_cache: bool = True) -> list[list[str]]:
+    """Finds near-duplicate images of the dataset
+    :returns: clusters of duplicates, largest first"""
+    image_stats = scan_image_stats(dataset_path)
+    if image_files is None:
+        image_files = sorted(image_stats)
+    hashes = compute_image_hashes(dataset_path, image_files, image_stats, workers,
+                                  progress_handler=progress_handler, use_cache=use_cache)
+    return duplicate_clusters(image_files, duplicate_groups(hashes, max_distance))
@@ -1,55 +1,95 @@
-import yolov5
+from itertools import islice
+from typing import Iterable, Iterator
 
-from label_tools import Label, label_from_coords, get_iou, average_label
+import numpy as np
+
+from label_tools import LabelStore, store_from_coords, match_labels
+
+
+def batched(iterable: Iterable, batch_size: int) -> Iterator[list]:
+    """Splits the iterable into lists of batch_size elements, the last one may be shorter"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
 
 
 class FineTuner:
     def __init__(self):
         """Class containing methods for fine-tuning YOLOv5 models."""
         self.model = None
+        self.model_path = None
 
     def set_model(self, model_path):
-        """Setting model from path to be used in other methods"""
+        """Setting model from path to be used in other methods. yolov5 (and torch) is imported only here, since the
+        import takes seconds"""
+        import yolov5
+
         self.model = yolov5.load(model_path)
+        self.model_path = model_path
+
+    def predict(self, images: list, score_threshold: float, class_dict: dict = None) -> list[LabelStore]:
+        """Runs the model on a list of images at once, detections are filtered by score on the prediction tensors
+        :returns: detected labels of every image"""
+        return [labels for labels, _ in self.predict_with_scores(images, score_threshold, class_dict)]
+
+    def predict_with_scores(self, images: list, score_threshold: float,
+                            class_dict: dict = None) -> list[tuple[LabelStore, np.ndarray]]:
+        """Runs the model on a list of images at once, detections are filtered by score on the prediction tensors
+        :returns: (detected labels, float32 scores of the labels) of every image"""
+        predictions = self.model(images).pred
+        detections = []
+        for image, prediction in zip(images, predictions):
+            h, w = image.shape[:2]
+            prediction = prediction[prediction[:, 4] > score_threshold].cpu().numpy()
+            detections.append((store_from_coords(prediction[:, :4], [w, h], prediction[:, 5].astype(int),
+                                                 class_dict), prediction[:, 4].astype(np.float32)))
+        return detections
+
+    @staticmethod
+    def average_labels(default_labels: LabelStore, detected_labels: LabelStore, iou_threshold: float) -> LabelStore:
+        """Averages every known label with at most one detected label of the same class"""
+        default_indices, detected_indices = match_labels(default_labels, detected_labels, iou_threshold)
+        default_labels.boxes[default_indices] = (default_labels.boxes[default_indices] +
+                                                 detected_labels.boxes[detected_indices]) / 2
+        return default_labels
 
     def average_detections(self,
                            image,
-                           default_labels: list[Label],
+                           default_labels: LabelStore,
                            score_threshold: float = 0.9,
-                           iou_threshold: float = 0.9):
-        """Averaging detections of model and already known labels"""
-        if default_labels is []:
+                           iou_threshold: float = 0.9) -> LabelStore:
+        """Averaging detections of model and already known labels, every known label is averaged with at most one
+        detection of the same class"""
+        if len(default_labels) == 0:
             return default_labels
 
-        h, w, _ = image.shape
-        detections_tensor = self.model(image).pred[0]
-        for detection in detections_tensor.tolist():
-            label = label_from_coords(detection[:2], detection[2:4], [w, h])
-            score = detection[4]
-            class_id = detection[5]
+        detected_labels = self.predict([image], score_threshold)[0]
+        return self.average_labels(default_labels, detected_labels, iou_threshold)
 
-            if score > score_threshold:
-                for ind, default_label in enumerate(default_labels):
-                    if ((get_iou(label, default_label) > iou_threshold) and
-                            (int(class_id) == int(default_label.class_number))):
-                        default_labels[ind] = average_label(default_label, label)
-
-        return default_labels
+    def average_detections_batch(self,
+                                 images_and_labels: Iterable[tuple],
+                                 score_threshold: float = 0.9,
+                                 iou_threshold: float = 0.9,
+                                 batch_size: int = 16) -> Iterator[LabelStore]:
+        """Averaging detections of model and already known labels for many (image, labels) pairs, images are run
+        through the model batch_size at a time
+        :returns: generator of averaged labels, in the order of the pairs"""
+        for batch in batched(images_and_labels, batch_size):
+            images = [image for image, default_labels in batch if len(default_labels) != 0]
+            detected_labels = iter(self.predict(images, score_threshold) if images else [])
+            for image, default_labels in batch:
+                if len(default_labels) == 0:
+                    yield default_labels
+                else:
+                    yield self.average_labels(default_labels, next(detected_labels), iou_threshold)
 
-    def detect(self, image, class_dict, score_threshold: float = 0.9):
+    def detect(self, image, class_dict, score_threshold: float = 0.9) -> LabelStore:
         """Run detection on image and return detected labels"""
-        detections = []
-        h, w, _ = image.shape
-        detections_tensor = self.model(image).pred[0]
-        for detection in detections_tensor.tolist():
-            label = label_from_coords(detection[:2], detection[2:4], [w, h])
-            score = detection[4]
-            class_id = int(detection[5])
-
-            label.class_number = str(class_id)
-            label.class_name = class_dict[str(class_id)]
+        return self.predict([image], score_threshold, class_dict)[0]
 
-            if score > score_threshold:
-                detections.append(label)
-
-        return detections
+    def detect_batch(self, images: Iterable, class_dict, score_threshold: float = 0.9,
+                     batch_size: int = 16) -> Iterator[LabelStore]:
+        """Run detection on many images, batch_size images at a time
+        :returns: generator of detected labels, in the order of the images"""
+        for batch in batched(images, batch_size):
+            yield from self.predict(batch, score_threshold, class_dict)
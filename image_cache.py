@@ -0,0 +1,136 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import cv2
+from numpy import ndarray
+
+from image_header import JPEG, read_image_header
+from tools import fit_image_size
+
+REDUCED_COLOR_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                       (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def reduced_read_flag(image_path: str, max_size: tuple[int, int]) -> int:
+    """Chooses the largest reduction of the JPEG decoder (which scales the image while decoding, skipping most of the
+    work) that still leaves at least the pixels of the image fitted inside max_size (width, height). The dimensions
+    are read from the file header, images that aren't JPEG are decoded at full resolution
+    :returns: cv2.imread flag"""
+    header = read_image_header(image_path)
+    if header is None or header.kind != JPEG:
+        return cv2.IMREAD_COLOR
+    # The decoder applies the EXIF orientation
+    image_width, image_height = header.oriented_size()
+    fitted_width, fitted_height = fit_image_size(image_width, image_height, *max_size)
+    for factor, flag in REDUCED_COLOR_FLAGS:
+        if image_width // factor >= fitted_width and image_height // factor >= fitted_height:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def read_display_image(image_path: str, max_size: tuple[int, int]) -> ndarray | None:
+    """Reads the image at the smallest resolution the JPEG decoder allows without going below the display size and
+    shrinks it to fit inside max_size (width, height). Labels are normalized, so they don't depend on the resolution
+    :returns: cv2 image (numpy.ndarray) in BGR format, None if the image can't be decoded"""
+    image = cv2.imread(image_path, reduced_read_flag(image_path, max_size))
+    if image is None:
+        return None
+    image_height, image_width = image.shape[:2]
+    new_size = fit_image_size(image_width, image_height, *max_size)
+    if new_size == (image_width, image_height):
+        return image
+    return cv2.resize(src=image, dsize=new_size)
+
+
+class ImageCache:
+    """Bounded LRU cache of decoded, display-resized images. Neighbouring images can be decoded ahead of time on a
+    background thread pool, so that switching images is a cache hit"""
+
+    def __init__(self, max_megabytes: float = 512, workers: int = 2):
+        self.max_bytes = int(max_megabytes * 1024 * 1024)
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._pending = dict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-cache")
+
+    def get(self, image_path: str, max_size: tuple[int, int]) -> ndarray:
+        """Returns the display image, decoding it on the calling thread if it was neither cached nor prefetched.
+        Waiting for an image that is being prefetched counts as a hit. Images that can't be decoded aren't cached, the
+        result is None for them. The returned image is shared with the cache and must not be modified"""
+        key = (image_path, tuple(max_size))
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+            future = self._pending.get(key)
+            if future is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if future is not None:
+            return future.result()
+
+        image = read_display_image(image_path, max_size)
+        if image is not None:
+            self._store(key, image)
+        return image
+
+    def prefetch(self, image_paths: list[str], max_size: tuple[int, int]):
+        """Decodes the images on the background threads, if they aren't cached yet"""
+        for image_path in image_paths:
+            key = (image_path, tuple(max_size))
+            with self._lock:
+                if key in self._images or key in self._pending:
+                    continue
+                future = self._executor.submit(read_display_image, image_path, tuple(max_size))
+                self._pending[key] = future
+            future.add_done_callback(lambda done_future, done_key=key: self._prefetched(done_key, done_future))
+
+    def clear(self):
+        """Drops all cached images and resets the counters"""
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._images.clear()
+            self.used_bytes = 0
+            self.hits = 0
+            self.misses = 0
+        # Cancelling runs the done callbacks, which take the lock
+        for future in pending:
+            future.cancel()
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """:returns: hit/miss counters and memory usage of the cache"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "images": len(self._images),
+                    "used_megabytes": self.used_bytes / (1024 * 1024)}
+
+    def _prefetched(self, key: tuple, future: Future):
+        with self._lock:
+            if self._pending.get(key) is not future:
+                # The cache was cleared in the meantime
+                return
+            del self._pending[key]
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            self._store(key, future.result())
+
+    def _store(self, key: tuple, image: ndarray):
+        with self._lock:
+            if key in self._images or image.nbytes > self.max_bytes:
+                return
+            self._images[key] = image
+            self.used_bytes += image.nbytes
+            while self.used_bytes > self.max_bytes:
+                _, evicted_image = self._images.popitem(last=False)
+                self.used_bytes -= evicted_image.nbytes
@@ -0,0 +1,158 @@
+import os
+import struct
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, NamedTuple
+
+from dataset_index import DatasetIndex
+from dataset_scanner import scan_image_stats
+
+JPEG = "jpeg"
+PNG = "png"
+
+JPEG_SIGNATURE = b"\xff\xd8"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Start of frame markers hold the dimensions, 0xC4 (Huffman tables), 0xC8 (reserved) and 0xCC (arithmetic coding)
+# share the range but aren't frames
+JPEG_FRAME_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = frozenset(range(0xD0, 0xD9)) | {0x01}
+JPEG_APP1_MARKER = 0xE1
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+class ImageHeader(NamedTuple):
+    """Dimensions of the image as stored in the file, the EXIF orientation 5 to 8 turns the image by 90 degrees"""
+    kind: str
+    width: int
+    height: int
+    orientation: int = 1
+
+    def oriented_size(self) -> tuple[int, int]:
+        """:returns: (width, height) of the image after applying the EXIF orientation, as the decoder returns it"""
+        if self.orientation >= 5:
+            return self.height, self.width
+        return self.width, self.height
+
+
+def exif_orientation(exif: bytes) -> int:
+    """Looks for the orientation tag in the first directory of the EXIF block (the contents of the APP1 segment)
+    :returns: the orientation 1 to 8, 1 if it is missing or the block is broken"""
+    if not exif.startswith(b"Exif\x00\x00"):
+        return 1
+    tiff = exif[6:]
+    byte_order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if byte_order is None:
+        return 1
+    try:
+        directory_offset = struct.unpack_from(f"{byte_order}I", tiff, 4)[0]
+        entry_count = struct.unpack_from(f"{byte_order}H", tiff, directory_offset)[0]
+        for entry_offset in range(directory_offset + 2, directory_offset + 2 + 12 * entry_count, 12):
+            tag, = struct.unpack_from(f"{byte_order}H", tiff, entry_offset)
+            if tag == EXIF_ORIENTATION_TAG:
+                orientation, = struct.unpack_from(f"{byte_order}H", tiff, entry_offset + 8)
+                return orientation if 1 <= orientation <= 8 else 1
+    except struct.error:
+        pass
+    return 1
+
+
+def parse_jpeg_header(image_reader: BinaryIO) -> ImageHeader | None:
+    """Walks the segments of the JPEG file up to the frame header, only the EXIF block is read, the other segments are
+    skipped. The reader has to be positioned right after the signature
+    :returns: the header, None if the file is broken"""
+    orientation = 1
+    while True:
+        marker = image_reader.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        marker_type = marker[1]
+        # Any number of 0xFF fill bytes can precede the marker type
+        while marker_type == 0xFF:
+            fill = image_reader.read(1)
+            if not fill:
+                return None
+            marker_type = fill[0]
+        if marker_type in JPEG_STANDALONE_MARKERS:
+            continue
+
+        segment_header = image_reader.read(2)
+        if len(segment_header) < 2:
+            return None
+        segment_length = struct.unpack(">H", segment_header)[0]
+        if marker_type in JPEG_FRAME_MARKERS:
+            frame_header = image_reader.read(5)
+            if len(frame_header) < 5:
+                return None
+            height, width = struct.unpack(">xHH", frame_header)
+            return ImageHeader(JPEG, width, height, orientation) if width and height else None
+        if marker_type == JPEG_APP1_MARKER and orientation == 1:
+            orientation = exif_orientation(image_reader.read(segment_length - 2))
+        else:
+            image_reader.seek(segment_length - 2, 1)
+
+
+def parse_png_header(image_reader: BinaryIO) -> ImageHeader | None:
+    """Reads the IHDR chunk, which always comes first. The reader has to be positioned right after the signature
+    :returns: the header, None if the file is broken"""
+    chunk = image_reader.read(16)
+    if len(chunk) < 16 or chunk[4:8] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", chunk[8:])
+    return ImageHeader(PNG, width, height) if width and height else None
+
+
+def read_image_header(image_path: str) -> ImageHeader | None:
+    """Reads the dimensions and the EXIF orientation of a JPEG or PNG image without decoding it, the format is
+    recognised by the signature, not by the extension
+    :returns: the header, None if the file can't be read or is neither JPEG nor PNG"""
+    try:
+        with open(image_path, "rb") as image_reader:
+            signature = image_reader.read(len(PNG_SIGNATURE))
+            if signature.startswith(JPEG_SIGNATURE):
+                image_reader.seek(len(JPEG_SIGNATURE))
+                return parse_jpeg_header(image_reader)
+            if signature == PNG_SIGNATURE:
+                return parse_png_header(image_reader)
+    except OSError:
+        pass
+    return None
+
+
+def read_image_headers(dataset_path: str, files: list[str]) -> list[ImageHeader | None]:
+    """:returns: header of every file, None for the files that can't be read"""
+    return [read_image_header(os.path.join(dataset_path, file)) for file in files]
+
+
+def probe_image_sizes(dataset_path: str, image_files: list[str], image_stats: dict[str, tuple[int, int]] = None,
+                      workers: int = None, shard_size: int = 1024,
+                      dataset_index: DatasetIndex = None) -> dict[str, tuple[int, int] | None]:
+    """Reads the headers of the images on a thread pool (reading a header is mostly waiting for the disk). With the
+    dataset index, the sizes recorded for images whose size and mtime didn't change are reused and the sizes read are
+    recorded in it
+    :returns: {image file: (width, height) after the EXIF orientation, None if the header can't be read}"""
+    if image_stats is None:
+        image_stats = scan_image_stats(dataset_path)
+
+    recorded_sizes = dataset_index.image_sizes(image_stats) if dataset_index is not None else dict()
+    image_sizes = {file: recorded_sizes[file] if recorded_sizes[file] != (0, 0) else None
+                   for file in image_files if file in recorded_sizes}
+    changed_files = [file for file in image_files if file not in image_sizes]
+
+    shards = [changed_files[start:start + shard_size] for start in range(0, len(changed_files), shard_size)]
+    if len(shards) <= 1:
+        # Not worth starting the threads
+        shard_headers = [read_image_headers(dataset_path, shard) for shard in shards]
+    else:
+        with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4),
+                                thread_name_prefix="image-header") as executor:
+            shard_headers = list(executor.map(read_image_headers, [dataset_path] * len(shards), shards))
+    for shard, headers in zip(shards, shard_headers):
+        for file, header in zip(shard, headers):
+            image_sizes[file] = header.oriented_size() if header is not None else None
+
+    if dataset_index is not None and changed_files:
+        # Unreadable headers are recorded as (0, 0), so they aren't read again either
+        dataset_index.set_image_sizes({file: (*image_stats[file], *(image_sizes[file] or (0, 0)))
+                                       for file in changed_files if file in image_stats})
+    return image_sizes
@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+
+
+class ImagePyramid:
+    """Multi-resolution pyramid of an image, every level is half the size of the previous one. Regions of the image
+    are rendered from the smallest level that still has enough detail, so only the visible part is ever resized"""
+
+    def __init__(self, image: np.ndarray, min_size: int = 256):
+        self.levels = [image]
+        while max(self.levels[-1].shape[:2]) > 2 * min_size:
+            self.levels.append(cv2.pyrDown(self.levels[-1]))
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """:returns: (width, height) of the full resolution image"""
+        return self.levels[0].shape[1], self.levels[0].shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.levels)
+
+    def render(self, region: tuple[float, float, float, float], output_size: tuple[int, int]) -> np.ndarray:
+        """Renders the region of the image, given as normalized (x_min, y_min, x_max, y_max), into an image of
+        output_size (width, height)
+        :returns: cv2 image (numpy.ndarray) in BGR format"""
+        x_min, y_min, x_max, y_max = region
+        output_width, output_height = output_size
+
+        # The smallest level which doesn't have to be enlarged
+        level = self.levels[0]
+        for candidate in self.levels[1:]:
+            if (candidate.shape[1] * (x_max - x_min) < output_width or
+                    candidate.shape[0] * (y_max - y_min) < output_height):
+                break
+            level = candidate
+
+        level_height, level_width = level.shape[:2]
+        scale_x = output_width / ((x_max - x_min) * level_width)
+        scale_y = output_height / ((y_max - y_min) * level_height)
+        transform = np.array([[scale_x, 0, -x_min * level_width * scale_x],
+                              [0, scale_y, -y_min * level_height * scale_y]], dtype=np.float64)
+
+        # Only the output pixels are computed, the cost doesn't depend on the size of the level
+        return cv2.warpAffine(level, transform, (output_width, output_height), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_REPLICATE)
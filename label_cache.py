@@ -0,0 +1,203 @@
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dataset_scanner import LABEL, iter_dataset_entries
+from label_tools import LabelStore, store_from_yolo_v5
+
+LABEL_CACHE_DIRECTORY = ".yolo_manager_label_cache"
+LABEL_CACHE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+CACHE_ARRAYS = ("boxes", "class_ids", "offsets", "sizes", "mtimes", "valid")
+
+
+def scan_label_stats(dataset_path: str) -> dict[str, tuple[int, int]]:
+    """:returns: {label file: (size, mtime_ns)} of every label file of the dataset"""
+    label_stats = dict()
+    for file, kind, entry in iter_dataset_entries(dataset_path):
+        if kind == LABEL:
+            stat = entry.stat()
+            label_stats[file] = (stat.st_size, stat.st_mtime_ns)
+    return label_stats
+
+
+def parse_label_files(dataset_path: str, files: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Parses the label files into contiguous arrays, files that can't be parsed are marked invalid and have no
+    labels
+    :returns: (boxes, class ids, number of labels of every file, valid flag of every file)"""
+    boxes = []
+    class_ids = []
+    counts = np.zeros(len(files), dtype=np.int64)
+    valid = np.ones(len(files), dtype=bool)
+    for file_index, file in enumerate(files):
+        try:
+            with open(os.path.join(dataset_path, file), "r") as label_reader:
+                labels = store_from_yolo_v5(label_reader.read())
+        except (OSError, ValueError):
+            valid[file_index] = False
+            continue
+        boxes.append(labels.boxes)
+        class_ids.append(labels.class_ids)
+        counts[file_index] = len(labels)
+
+    return (np.concatenate(boxes) if boxes else np.zeros((0, 4), dtype=np.float32),
+            np.concatenate(class_ids) if class_ids else np.zeros(0, dtype=np.int32), counts, valid)
+
+
+class LabelCache:
+    """All labels of the dataset compiled into a few binary arrays kept next to the dataset: one contiguous float32
+    (N, 4) box array, int32 class ids and per-file offsets into them. The arrays are memory-mapped, so bulk
+    operations read them without parsing or opening the label files. Files are invalidated by their size and mtime,
+    files that couldn't be parsed are marked invalid"""
+
+    def __init__(self, dataset_path: str, files: list[str], arrays: dict[str, np.ndarray]):
+        self.dataset_path = dataset_path
+        self.files = files
+        self.boxes = arrays["boxes"]
+        self.class_ids = arrays["class_ids"]
+        self.offsets = arrays["offsets"]
+        self.sizes = arrays["sizes"]
+        self.mtimes = arrays["mtimes"]
+        self.valid = arrays["valid"]
+        self._file_indices = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def file_index(self, file: str) -> int | None:
+        """:returns: position of the label file in the cache, None if it isn't cached"""
+        if self._file_indices is None:
+            self._file_indices = {file: index for index, file in enumerate(self.files)}
+        return self._file_indices.get(file)
+
+    def labels(self, file: str, class_names: dict = None) -> LabelStore | None:
+        """:returns: copy of the labels of the file, None if the file isn't cached or couldn't be parsed"""
+        index = self.file_index(file)
+        if index is None or not self.valid[index]:
+            return None
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return LabelStore(np.array(self.boxes[start:end]), np.array(self.class_ids[start:end]), class_names)
+
+    def label_files(self) -> np.ndarray:
+        """:returns: int64 array with the position of the label file of every cached label"""
+        return np.repeat(np.arange(len(self.files)), np.diff(self.offsets))
+
+    def is_current(self, label_stats: dict[str, tuple[int, int]]) -> bool:
+        """:returns: True if the cache holds exactly the given label files with the same sizes and mtimes"""
+        if len(label_stats) != len(self.files):
+            return False
+        sizes = self.sizes.tolist()
+        mtimes = self.mtimes.tolist()
+        return all(label_stats.get(file) == (size, mtime_ns)
+                   for file, size, mtime_ns in zip(self.files, sizes, mtimes))
+
+    @classmethod
+    def load(cls, dataset_path: str) -> "LabelCache | None":
+        """Memory-maps the cache of the dataset
+        :returns: the cache, None if there is no usable cache"""
+        cache_directory = os.path.join(dataset_path, LABEL_CACHE_DIRECTORY)
+        try:
+            with open(os.path.join(cache_directory, MANIFEST_NAME), "r") as manifest_reader:
+                manifest = json.load(manifest_reader)
+            if manifest.get("version") != LABEL_CACHE_VERSION:
+                return None
+            arrays = {name: np.load(os.path.join(cache_directory, f"{name}.{manifest['generation']}.npy"),
+                                    mmap_mode="r")
+                      for name in CACHE_ARRAYS}
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(dataset_path, manifest["files"], arrays)
+
+    @classmethod
+    def save(cls, dataset_path: str, files: list[str], arrays: dict[str, np.ndarray]) -> "LabelCache":
+        """Writes a new generation of the cache, the manifest is replaced last, so readers see either the old or the
+        new cache as a whole
+        :returns: the memory-mapped saved cache"""
+        cache_directory = os.path.join(dataset_path, LABEL_CACHE_DIRECTORY)
+        os.makedirs(cache_directory, exist_ok=True)
+        manifest_path = os.path.join(cache_directory, MANIFEST_NAME)
+        try:
+            with open(manifest_path, "r") as manifest_reader:
+                generation = json.load(manifest_reader)["generation"] + 1
+        except (OSError, ValueError, KeyError, TypeError):
+            generation = 0
+
+        for name in CACHE_ARRAYS:
+            np.save(os.path.join(cache_directory, f"{name}.{generation}.npy"), arrays[name])
+        with open(f"{manifest_path}.tmp", "w") as manifest_writer:
+            json.dump({"version": LABEL_CACHE_VERSION, "generation": generation, "files": files}, manifest_writer)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+        # Older generations aren't referenced any more
+        for file in os.listdir(cache_directory):
+            if file.endswith(".npy") and not file.endswith(f".{generation}.npy"):
+                try:
+                    os.remove(os.path.join(cache_directory, file))
+                except OSError:
+                    pass
+        return cls.load(dataset_path)
+
+
+def load_label_cache(dataset_path: str, label_stats: dict[str, tuple[int, int]] = None, workers: int = None,
+                     shard_size: int = 2048) -> LabelCache:
+    """Gives the up-to-date label cache of the dataset. Only label files that were added or whose size or mtime
+    changed are parsed, in a process pool if there are many of them; the labels of the other files are copied from
+    the previous cache as whole array slices
+    :returns: the memory-mapped cache"""
+    if label_stats is None:
+        label_stats = scan_label_stats(dataset_path)
+    old_cache = LabelCache.load(dataset_path)
+    if old_cache is not None and old_cache.is_current(label_stats):
+        return old_cache
+
+    reused_files = []
+    reused = np.zeros(0, dtype=bool)
+    if old_cache is not None:
+        reused = np.array([label_stats.get(file) == (size, mtime_ns) for file, size, mtime_ns
+                           in zip(old_cache.files, old_cache.sizes.tolist(), old_cache.mtimes.tolist())], dtype=bool)
+        reused_files = [file for file, is_reused in zip(old_cache.files, reused.tolist()) if is_reused]
+    reused_set = set(reused_files)
+    changed_files = [file for file in label_stats if file not in reused_set]
+
+    shards = [changed_files[start:start + shard_size] for start in range(0, len(changed_files), shard_size)]
+    if len(shards) <= 1:
+        # Not worth starting the worker processes
+        parsed = [parse_label_files(dataset_path, shard) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = list(executor.map(parse_label_files, [dataset_path] * len(shards), shards))
+
+    boxes = [np.zeros((0, 4), dtype=np.float32)]
+    class_ids = [np.zeros(0, dtype=np.int32)]
+    counts = [np.zeros(0, dtype=np.int64)]
+    valid = [np.zeros(0, dtype=bool)]
+    if old_cache is not None and reused_files:
+        reused_labels = np.repeat(reused, np.diff(old_cache.offsets))
+        boxes.append(old_cache.boxes[reused_labels])
+        class_ids.append(old_cache.class_ids[reused_labels])
+        counts.append(np.diff(old_cache.offsets)[reused])
+        valid.append(old_cache.valid[reused])
+    for shard_boxes, shard_class_ids, shard_counts, shard_valid in parsed:
+        boxes.append(shard_boxes)
+        class_ids.append(shard_class_ids)
+        counts.append(shard_counts)
+        valid.append(shard_valid)
+
+    files = reused_files + changed_files
+    counts = np.concatenate(counts)
+    arrays = {
+        "boxes": np.concatenate(boxes).astype(np.float32, copy=False),
+        "class_ids": np.concatenate(class_ids).astype(np.int32, copy=False),
+        "offsets": np.r_[0, np.cumsum(counts)].astype(np.int64),
+        "sizes": np.array([label_stats[file][0] for file in files], dtype=np.int64),
+        "mtimes": np.array([label_stats[file][1] for file in files], dtype=np.int64),
+        "valid": np.concatenate(valid),
+    }
+    try:
+        return LabelCache.save(dataset_path, files, arrays)
+    except OSError:
+        print("Could not write the label cache")
+        return LabelCache(dataset_path, files, arrays)
@@ -1,26 +1,192 @@
 import copy
+from typing import Iterable
+
+import numpy as np
 
 
 class Label:
-    """Class for storing labels and loading them from different formats"""
+    """Class for storing labels and loading them from different formats.
+    Label is a thin view over a single row of a LabelStore, standalone labels own a single-row store"""
+
+    __slots__ = ("_store", "_index")
 
     def __init__(self, class_name: str, class_number: str, x_center: float, y_center: float, width: float,
                  height: float):
-        self.class_name = class_name
-        self.class_number = class_number
-        self.x_center = x_center
-        self.y_center = y_center
-        self.width = width
-        self.height = height
+        class_names = {str(class_number): class_name} if class_name != "" and class_number != "" else {}
+        self._store = LabelStore(np.array([[x_center, y_center, width, height]], dtype=np.float32),
+                                 np.array([class_id_from_number(class_number)], dtype=np.int32), class_names)
+        self._index = 0
+
+    @classmethod
+    def view(cls, store: "LabelStore", index: int) -> "Label":
+        """Creates a label viewing the index-th row of the store, changes made to the label are written to the store
+        :returns: Instance of a Label class."""
+        label = cls.__new__(cls)
+        label._store = store
+        label._index = index
+        return label
+
+    def __copy__(self):
+        return Label(self.class_name, self.class_number, self.x_center, self.y_center, self.width, self.height)
+
+    def __repr__(self):
+        return (f"Label({self.class_name!r}, {self.class_number!r}, {self.x_center}, {self.y_center}, "
+                f"{self.width}, {self.height})")
+
+    @property
+    def class_number(self) -> str:
+        return number_from_class_id(self._store.class_ids[self._index])
+
+    @class_number.setter
+    def class_number(self, value):
+        self._store.class_ids[self._index] = class_id_from_number(value)
+
+    @property
+    def class_name(self) -> str:
+        return self._store.class_names.get(self.class_number, "")
+
+    @class_name.setter
+    def class_name(self, value: str):
+        if self.class_number != "" and self._store.class_names.get(self.class_number) != value:
+            self._store.class_names[self.class_number] = value
+
+    @property
+    def x_center(self) -> float:
+        return float(self._store.boxes[self._index, 0])
+
+    @x_center.setter
+    def x_center(self, value: float):
+        self._store.boxes[self._index, 0] = value
+
+    @property
+    def y_center(self) -> float:
+        return float(self._store.boxes[self._index, 1])
+
+    @y_center.setter
+    def y_center(self, value: float):
+        self._store.boxes[self._index, 1] = value
+
+    @property
+    def width(self) -> float:
+        return float(self._store.boxes[self._index, 2])
+
+    @width.setter
+    def width(self, value: float):
+        self._store.boxes[self._index, 2] = value
+
+    @property
+    def height(self) -> float:
+        return float(self._store.boxes[self._index, 3])
+
+    @height.setter
+    def height(self, value: float):
+        self._store.boxes[self._index, 3] = value
+
+
+class LabelStore:
+    """Columnar storage of all labels of a single image. Boxes are kept as a float32 (N, 4) array of normalized
+    [x_center, y_center, width, height], class numbers as an int32 array, nameless labels have class id -1"""
+
+    def __init__(self, boxes: np.ndarray = None, class_ids: np.ndarray = None, class_names: dict = None):
+        self.boxes = np.zeros((0, 4), dtype=np.float32) if boxes is None else np.asarray(boxes, dtype=np.float32)
+        self.class_ids = (np.zeros(0, dtype=np.int32) if class_ids is None
+                          else np.asarray(class_ids, dtype=np.int32))
+        # Shared with the caller on purpose, class names are the same for every image of the dataset
+        self.class_names = dict() if class_names is None else class_names
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    def __getitem__(self, index: int) -> Label:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("LabelStore index out of range")
+        return Label.view(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield Label.view(self, index)
+
+    def __copy__(self):
+        return LabelStore(self.boxes.copy(), self.class_ids.copy(), self.class_names)
+
+    def copy(self) -> "LabelStore":
+        return self.__copy__()
+
+    def append(self, label: Label):
+        """Appends a copy of the label to the store"""
+        self.extend(LabelStore.from_labels([label]))
+
+    def extend(self, labels: "LabelStore | Iterable[Label]"):
+        """Appends copies of the labels to the store"""
+        if not isinstance(labels, LabelStore):
+            labels = LabelStore.from_labels(labels)
+        for class_number, class_name in labels.class_names.items():
+            self.class_names.setdefault(class_number, class_name)
+        self.boxes = np.concatenate((self.boxes, labels.boxes))
+        self.class_ids = np.concatenate((self.class_ids, labels.class_ids))
+
+    def delete(self, indices: int | Iterable[int]):
+        """Removes the labels under the given indices, previously created views become invalid"""
+        self.boxes = np.delete(self.boxes, indices, axis=0)
+        self.class_ids = np.delete(self.class_ids, indices)
+
+    def labels(self) -> list[Label]:
+        """:returns: list of views over every row of the store"""
+        return list(self)
+
+    @classmethod
+    def from_labels(cls, labels: Iterable[Label], class_names: dict = None) -> "LabelStore":
+        """Creates a new store from the label objects, the labels are copied
+        :returns: Instance of a LabelStore class."""
+        labels = list(labels)
+        class_names = dict() if class_names is None else class_names
+        for label in labels:
+            if label.class_name != "":
+                class_names.setdefault(label.class_number, label.class_name)
+        boxes = np.array([[label.x_center, label.y_center, label.width, label.height] for label in labels],
+                         dtype=np.float32).reshape(-1, 4)
+        class_ids = np.array([class_id_from_number(label.class_number) for label in labels], dtype=np.int32)
+        return cls(boxes, class_ids, class_names)
+
+
+def remap_store_classes(store: LabelStore, class_numbers: dict[str, str]) -> LabelStore:
+    """Changes the class numbers of every label of the store according to the {old: new} class number dict,
+    class numbers missing from the dict are left unchanged
+    :returns: the same store"""
+    if len(store) == 0 or len(class_numbers) == 0:
+        return store
+    old_ids = np.array([class_id_from_number(number) for number in class_numbers.keys()], dtype=np.int32)
+    new_ids = np.array([class_id_from_number(number) for number in class_numbers.values()], dtype=np.int32)
+
+    lookup = np.arange(max(int(old_ids.max()), int(store.class_ids.max())) + 1, dtype=np.int32)
+    lookup[old_ids] = new_ids
+    store.class_ids = np.where(store.class_ids >= 0, lookup[np.maximum(store.class_ids, 0)], store.class_ids)
+    return store
+
+
+def class_id_from_number(class_number) -> int:
+    """Converts a class number (str or int) into a class id, nameless labels get -1
+    :returns: class id"""
+    if class_number == "" or class_number is None:
+        return -1
+    return int(float(class_number))
+
+
+def number_from_class_id(class_id: int) -> str:
+    """Converts a class id into a class number, -1 becomes an empty string
+    :returns: class number"""
+    return "" if class_id < 0 else str(int(class_id))
 
 
 def get_iou(label1: Label, label2: Label) -> float:
-    """Calculates the IOU of two labels
+    """Calculates the IOU of two labels, use iou_matrix for many pairs
     :returns: IOU"""
     bb1 = rectangle_from_label(label1)
     bb2 = rectangle_from_label(label2)
 
-    intersect_w = min(bb1[1][0], bb2[1][0]) - max(bb1[0][0], bb1[0][0])
+    intersect_w = min(bb1[1][0], bb2[1][0]) - max(bb1[0][0], bb2[0][0])
     intersect_h = min(bb1[1][1], bb2[1][1]) - max(bb1[0][1], bb2[0][1])
 
     if intersect_w <= 0 or intersect_h <= 0:
@@ -36,6 +202,54 @@ def get_iou(label1: Label, label2: Label) -> float:
     return intersect_a / union_area
 
 
+def iou_matrix(store1: LabelStore, store2: LabelStore) -> np.ndarray:
+    """Calculates the IOU of every pair of labels from two stores in a single pass
+    :returns: (N, M) float32 array, element [i, j] is the IOU of the i-th label of store1 and j-th label of store2"""
+    bb1 = rectangles_from_store(store1)[:, None, :]
+    bb2 = rectangles_from_store(store2)[None, :, :]
+
+    intersect_w = np.clip(np.minimum(bb1[..., 2], bb2[..., 2]) - np.maximum(bb1[..., 0], bb2[..., 0]), 0, None)
+    intersect_h = np.clip(np.minimum(bb1[..., 3], bb2[..., 3]) - np.maximum(bb1[..., 1], bb2[..., 1]), 0, None)
+    intersect_a = intersect_w * intersect_h
+
+    bb1_area = (bb1[..., 2] - bb1[..., 0]) * (bb1[..., 3] - bb1[..., 1])
+    bb2_area = (bb2[..., 2] - bb2[..., 0]) * (bb2[..., 3] - bb2[..., 1])
+    union_area = bb1_area + bb2_area - intersect_a
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union_area > 0, intersect_a / union_area, 0).astype(np.float32)
+
+
+def match_labels(store1: LabelStore, store2: LabelStore, iou_threshold: float = 0.5,
+                 same_class: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    """Greedily matches labels of two stores one-to-one, highest IOU first. Only pairs with IOU above the threshold
+    (and of the same class, if requested) can be matched
+    :returns: (indices in store1, indices in store2) of the matched pairs"""
+    ious = iou_matrix(store1, store2)
+    if same_class:
+        ious[store1.class_ids[:, None] != store2.class_ids[None, :]] = 0
+    return match_ious(ious, iou_threshold)
+
+
+def match_ious(ious: np.ndarray, iou_threshold: float) -> tuple[np.ndarray, np.ndarray]:
+    """Greedily matches the rows and columns of an IOU matrix one-to-one, highest IOU first, only pairs with IOU
+    above the threshold can be matched
+    :returns: (row indices, column indices) of the matched pairs"""
+    candidates_1, candidates_2 = np.nonzero(ious > iou_threshold)
+    order = np.argsort(-ious[candidates_1, candidates_2], kind="stable")
+
+    matched_1, matched_2 = [], []
+    used_1, used_2 = set(), set()
+    for ind_1, ind_2 in zip(candidates_1[order].tolist(), candidates_2[order].tolist()):
+        if ind_1 not in used_1 and ind_2 not in used_2:
+            used_1.add(ind_1)
+            used_2.add(ind_2)
+            matched_1.append(ind_1)
+            matched_2.append(ind_2)
+
+    return np.array(matched_1, dtype=np.intp), np.array(matched_2, dtype=np.intp)
+
+
 def rectangle_from_label(label: Label) -> tuple[list[float], list[float]]:
     """Converts a label into the rectangular bounding box
     :returns: ([x_min, y_min], [x_max, y_max])"""
@@ -44,6 +258,13 @@ def rectangle_from_label(label: Label) -> tuple[list[float], list[float]]:
     return lu_corner, br_corner
 
 
+def rectangles_from_store(store: LabelStore) -> np.ndarray:
+    """Converts all labels of the store into rectangular bounding boxes
+    :returns: (N, 4) array of [x_min, y_min, x_max, y_max]"""
+    half_sizes = store.boxes[:, 2:] / 2
+    return np.concatenate((store.boxes[:, :2] - half_sizes, store.boxes[:, :2] + half_sizes), axis=1)
+
+
 def average_label(label1: Label, label2: Label) -> Label:
     """Averages x_center, y_center, width and height of two labels
     :returns: averaged label"""
@@ -71,10 +292,33 @@ def label_from_yolo_v5(yolo_v5_label: str, class_name: str = "") -> Label:
     return Label(class_name, yolo_v5_label_class_number, *yolo_v5_label_coords)
 
 
+def store_from_yolo_v5(yolo_v5_labels: str | list[str], class_names: dict = None) -> LabelStore:
+    """Creates a new store from the contents of a yolo_v5 label file, parsed in one pass.
+    :returns: Instance of a LabelStore class."""
+    if isinstance(yolo_v5_labels, str):
+        yolo_v5_labels = yolo_v5_labels.splitlines()
+    lines = [line for line in yolo_v5_labels if line.strip() != ""]
+
+    values = np.array(" ".join(lines).split(), dtype=np.float64)
+    if values.size != 5 * len(lines):
+        raise ValueError("Every yolo_v5 label has to consist of exactly 5 values")
+    values = values.reshape(-1, 5)
+
+    return LabelStore(values[:, 1:], values[:, 0].astype(np.int32), class_names)
+
+
 def yolo_v5_from_label(label: Label) -> str:
     """Creates a yolo_v5 label from a label.
     :returns: yolo_v5 label."""
-    return f"{label.class_number} {label.x_center} {label.y_center} {label.width} {label.height}\n"
+    return (f"{label.class_number} {label.x_center:.6f} {label.y_center:.6f} {label.width:.6f} "
+            f"{label.height:.6f}\n")
+
+
+def yolo_v5_from_store(store: LabelStore) -> list[str]:
+    """Creates yolo_v5 labels from every label of the store.
+    :returns: list of yolo_v5 labels."""
+    return [f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n"
+            for class_id, (x_center, y_center, width, height) in zip(store.class_ids.tolist(), store.boxes.tolist())]
 
 
 def label_from_coords(lu_corner: list[int], rb_corner: list[int],
@@ -100,6 +344,23 @@ def label_from_coords(lu_corner: list[int], rb_corner: list[int],
     return Label("", "", x_center, y_center, width, height)
 
 
+def store_from_coords(corners: np.ndarray, image_size: list, class_ids: np.ndarray = None,
+                      class_names: dict = None) -> LabelStore:
+    """Creates a new store from an (N, 4) array of [x1, y1, x2, y2] pixel coordinates and image size,
+    labels are nameless if class_ids are not given
+    :returns: Instance of a LabelStore class."""
+    corners = np.asarray(corners, dtype=np.float64).reshape(-1, 4)
+    scale = np.array([image_size[0], image_size[1]], dtype=np.float64)
+
+    lu_corners = np.minimum(corners[:, :2], corners[:, 2:])
+    sizes = np.abs(corners[:, 2:] - corners[:, :2])
+    boxes = np.round(np.concatenate(((lu_corners + sizes / 2) / scale, sizes / scale), axis=1), 6)
+
+    if class_ids is None:
+        class_ids = np.full(len(boxes), -1, dtype=np.int32)
+    return LabelStore(boxes, class_ids, class_names)
+
+
 def coords_from_label(label: Label, image_size: list[int]) -> tuple[tuple[int, int], tuple[int, int]]:
     """Creates rectangular coordinates and from yolo_v5 label.
     :returns: Coordinates of the left upper corner and right bottom corner."""
@@ -108,3 +369,10 @@ def coords_from_label(label: Label, image_size: list[int]) -> tuple[tuple[int, i
     rb_corner = (int(image_size[0] * (label.x_center + label.width / 2)),
                  int(image_size[1] * (label.y_center + label.height / 2)))
     return lu_corner, rb_corner
+
+
+def coords_from_store(store: LabelStore, image_size: list[int]) -> np.ndarray:
+    """Creates rectangular pixel coordinates from every label of the store.
+    :returns: (N, 4) int32 array of [x_min, y_min, x_max, y_max]"""
+    scale = np.array([image_size[0], image_size[1], image_size[0], image_size[1]], dtype=np.float32)
+    return (rectangles_from_store(store) * scale).astype(np.int32)
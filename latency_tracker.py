@@ -0,0 +1,71 @@
+import csv
+import json
+import time
+
+from collections import deque
+from functools import wraps
+
+import numpy as np
+
+LATENCY_ENVIRONMENT_VARIABLE = "YOLO_MANAGER_LATENCY"
+
+
+class LatencyTracker:
+    """Opt-in recorder of the durations of named stages, only the last max_samples durations of every stage are
+    kept. While disabled, timed functions only check a flag"""
+
+    def __init__(self, enabled: bool = False, max_samples: int = 10000):
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self.samples = dict()  # {stage name: deque of durations in seconds}
+
+    def record(self, name: str, seconds: float):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.max_samples)
+        samples.append(seconds)
+
+    def clear(self):
+        self.samples.clear()
+
+    def summary(self) -> dict[str, dict]:
+        """:returns: {stage name: {count, p50_ms, p95_ms, max_ms}}"""
+        summary = dict()
+        for name, samples in self.samples.items():
+            milliseconds = np.array(samples) * 1000
+            p50, p95 = np.percentile(milliseconds, [50, 95]).tolist()
+            summary[name] = {"count": len(milliseconds), "p50_ms": p50, "p95_ms": p95,
+                             "max_ms": float(milliseconds.max())}
+        return summary
+
+    def dump(self, path: str):
+        """Writes the summary into a .csv file, or a .json file for any other extension"""
+        summary = self.summary()
+        with open(path, "w", newline="") as dump_writer:
+            if path.lower().endswith(".csv"):
+                writer = csv.writer(dump_writer)
+                writer.writerow(["stage", "count", "p50_ms", "p95_ms", "max_ms"])
+                for name, stats in summary.items():
+                    writer.writerow([name, stats["count"], f"{stats['p50_ms']:.3f}", f"{stats['p95_ms']:.3f}",
+                                     f"{stats['max_ms']:.3f}"])
+            else:
+                json.dump(summary, dump_writer, indent=2)
+
+
+latency_tracker = LatencyTracker()
+
+
+def timed(name: str):
+    """Decorator recording every call of the function as the named stage of the latency tracker"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not latency_tracker.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                latency_tracker.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -1,23 +1,30 @@
+import os
 import pathlib
 import sys
-import asyncio
 
 from UI.labeller_ui import LabellerUI
 from PyQt6.QtWidgets import QApplication
 
-from tests import Automate
+from latency_tracker import latency_tracker, LATENCY_ENVIRONMENT_VARIABLE
 
 
 def main():
     if sys.platform == 'win32':
         pathlib.PosixPath = pathlib.WindowsPath
 
+    # YOLO_MANAGER_LATENCY=latency.json (or .csv) turns on the latency tracking and dumps it at exit
+    latency_path = os.environ.get(LATENCY_ENVIRONMENT_VARIABLE)
+    latency_tracker.enabled = bool(latency_path)
+
     app = QApplication(sys.argv)
 
     window = LabellerUI()
     window.show()
     app.exec()
 
+    if latency_path:
+        latency_tracker.dump(latency_path)
+
 
 if __name__ == "__main__":
     main()
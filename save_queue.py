@@ -0,0 +1,103 @@
+import os
+import threading
+
+
+def write_atomically(path: str, contents: str):
+    """Writes the file through a temporary file replacing it at once, so the file is never left half written"""
+    with open(f"{path}.tmp", "w") as tmp_writer:
+        tmp_writer.write(contents)
+    os.replace(f"{path}.tmp", path)
+
+
+class SaveQueue:
+    """Write-behind queue of label files, the writes are done one at a time by a background thread. A file saved
+    again before its previous save was written is written only once, with the newest contents. Contents None
+    deletes the file. Finished and failed writes are kept until the owner collects them with take_finished, so
+    that the owner can update its own state on its own thread"""
+
+    def __init__(self):
+        self._failed = dict()  # {path: error message of the last failed write}
+        self._pending = dict()  # {path: contents}, insertion ordered
+        self._writing = None  # (path, contents) being written
+        self._finished = []
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._write_pending, name="save-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: str, contents: str | None):
+        """Queues the write of the file, replacing a queued write of the same file that wasn't started yet"""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The save queue is shut down")
+            self._pending.pop(path, None)
+            self._pending[path] = contents
+            self._condition.notify_all()
+
+    def lookup(self, path: str) -> tuple[bool, str | None]:
+        """:returns: (True, newest contents) if a write of the file is queued or running, (False, None) otherwise"""
+        with self._condition:
+            if path in self._pending:
+                return True, self._pending[path]
+            if self._writing is not None and self._writing[0] == path:
+                return True, self._writing[1]
+            return False, None
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._pending) + (self._writing is not None)
+
+    def failed_snapshot(self) -> dict[str, str]:
+        """:returns: copy of {path: error message} of the files whose last write failed"""
+        with self._condition:
+            return dict(self._failed)
+
+    def take_finished(self) -> list[str]:
+        """:returns: paths written or deleted since the previous call, failed writes excluded"""
+        with self._condition:
+            finished, self._finished = self._finished, []
+            return finished
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until every queued write is done
+        :returns: False if the timeout ran out first"""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and self._writing is None, timeout)
+
+    def shutdown(self, timeout: float = None) -> bool:
+        """Writes everything queued and stops the thread
+        :returns: False if the timeout ran out first"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _write_pending(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                path = next(iter(self._pending))
+                self._writing = (path, self._pending.pop(path))
+
+            contents = self._writing[1]
+            try:
+                if contents is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                else:
+                    write_atomically(path, contents)
+                error = None
+            except OSError as exception:
+                error = str(exception)
+
+            with self._condition:
+                if error is None:
+                    self._failed.pop(path, None)
+                    self._finished.append(path)
+                else:
+                    self._failed[path] = error
+                self._writing = None
+                self._condition.notify_all()
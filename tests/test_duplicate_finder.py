@@ -0,0 +1,28 @@
+import os
+
+import cv2
+import numpy as np
+
+from duplicate_finder import NO_HASH, compute_image_hashes, find_duplicates
+
+
+def write_dataset(dataset_path):
+    """Writes two copies of a gradient image with the highest hash bit set and one corrupt image"""
+    image = np.tile(np.linspace(255, 0, 64, dtype=np.uint8), (64, 1))
+    cv2.imwrite(os.path.join(dataset_path, "first.png"), image)
+    cv2.imwrite(os.path.join(dataset_path, "second.png"), image)
+    with open(os.path.join(dataset_path, "corrupt.jpg"), "wb") as image_writer:
+        image_writer.write(b"\xff\xd8not an image")
+
+
+def test_corrupt_image_gets_no_hash(tmp_path):
+    write_dataset(tmp_path)
+    hashes = compute_image_hashes(str(tmp_path), ["corrupt.jpg", "first.png"], use_cache=False)
+    assert hashes.dtype == np.int64
+    assert hashes[0] == NO_HASH
+    assert hashes[1] != NO_HASH
+
+
+def test_corrupt_image_isnt_a_duplicate(tmp_path):
+    write_dataset(tmp_path)
+    assert find_duplicates(str(tmp_path), use_cache=False) == [["first.png", "second.png"]]
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable
+
+import cv2
+from numpy import ndarray
+
+from image_cache import reduced_read_flag
+from tools import fit_image_size
+
+THUMBNAIL_CACHE_DIRECTORY = ".yolo_manager_thumbnails"
+
+
+def read_thumbnail_image(image_path: str, size: int) -> ndarray | None:
+    """Decodes the image at the smallest resolution the JPEG decoder allows without going below the thumbnail size
+    and shrinks it to fit inside size x size
+    :returns: cv2 image (numpy.ndarray) in BGR format, None if the image can't be decoded"""
+    image = cv2.imread(image_path, reduced_read_flag(image_path, (size, size)))
+    if image is None:
+        return None
+
+    image_height, image_width = image.shape[:2]
+    new_size = fit_image_size(image_width, image_height, size, size)
+    if new_size == (image_width, image_height):
+        return image
+    return cv2.resize(image, (max(new_size[0], 1), max(new_size[1], 1)), interpolation=cv2.INTER_AREA)
+
+
+class ThumbnailCache:
+    """Thumbnails of the dataset images, made on a background thread pool and kept as small JPEG files in the hidden
+    thumbnail directory of the dataset. A thumbnail is keyed by the name, size and mtime of its image, so modified
+    images get a new thumbnail. The last max_thumbnails thumbnails are also kept decoded in memory"""
+
+    def __init__(self, dataset_path: str, size: int = 128, max_thumbnails: int = 2048, workers: int = None):
+        self.dataset_path = dataset_path
+        self.size = size
+        self.max_thumbnails = max_thumbnails
+        self.cache_directory = os.path.join(dataset_path, THUMBNAIL_CACHE_DIRECTORY, str(size))
+        self._thumbnails = OrderedDict()
+        self._pending = dict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1),
+                                            thread_name_prefix="thumbnail-cache")
+
+    def thumbnail_path(self, image_file: str) -> str | None:
+        """:returns: path of the cached thumbnail of the image, None if the image doesn't exist"""
+        try:
+            stat = os.stat(os.path.join(self.dataset_path, image_file))
+        except OSError:
+            return None
+        key = hashlib.sha1(f"{image_file}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+        # Split into subdirectories, so that no directory holds all the thumbnails
+        return os.path.join(self.cache_directory, key[:2], f"{key}.jpg")
+
+    def cached(self, image_file: str) -> ndarray | None:
+        """:returns: the thumbnail if it is in memory, None otherwise"""
+        with self._lock:
+            thumbnail = self._thumbnails.get(image_file)
+            if thumbnail is not None:
+                self._thumbnails.move_to_end(image_file)
+            return thumbnail
+
+    def request(self, image_files: list[str], loaded_handler: Callable[[str, ndarray | None], None]):
+        """Loads the thumbnails that aren't in memory on the background threads, loaded_handler is called with
+        (image file, thumbnail or None) on a background thread once every thumbnail is loaded"""
+        for image_file in image_files:
+            with self._lock:
+                if image_file in self._thumbnails or image_file in self._pending:
+                    continue
+                future = self._executor.submit(self.load, image_file)
+                self._pending[image_file] = future
+            future.add_done_callback(lambda done_future, done_file=image_file:
+                                     self._loaded(done_file, done_future, loaded_handler))
+
+    def retain(self, image_files: set[str]):
+        """Drops the requests of the images that aren't in image_files (e.g. scrolled out of view), the queued ones
+        are cancelled"""
+        with self._lock:
+            dropped = [self._pending.pop(image_file) for image_file in list(self._pending)
+                       if image_file not in image_files]
+        # Cancelling runs the done callbacks, which take the lock. Loads already running finish, but their
+        # thumbnails are only written to the disk cache
+        for future in dropped:
+            future.cancel()
+
+    def load(self, image_file: str) -> ndarray | None:
+        """Reads the thumbnail from the disk cache, making it first if it isn't cached
+        :returns: the thumbnail, None if the image can't be decoded"""
+        thumbnail_path = self.thumbnail_path(image_file)
+        if thumbnail_path is None:
+            return None
+        if os.path.isfile(thumbnail_path):
+            thumbnail = cv2.imread(thumbnail_path)
+            if thumbnail is not None:
+                return thumbnail
+
+        thumbnail = read_thumbnail_image(os.path.join(self.dataset_path, image_file), self.size)
+        if thumbnail is None:
+            return None
+        encoded, thumbnail_bytes = cv2.imencode(".jpg", thumbnail, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if encoded:
+            try:
+                os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+                with open(f"{thumbnail_path}.tmp{threading.get_ident()}", "wb") as thumbnail_writer:
+                    thumbnail_writer.write(thumbnail_bytes.tobytes())
+                os.replace(f"{thumbnail_path}.tmp{threading.get_ident()}", thumbnail_path)
+            except OSError:
+                pass
+        return thumbnail
+
+    def shutdown(self):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._thumbnails.clear()
+        for future in pending:
+            future.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _loaded(self, image_file: str, future: Future, loaded_handler: Callable[[str, ndarray | None], None]):
+        with self._lock:
+            if self._pending.get(image_file) is not future:
+                return
+            del self._pending[image_file]
+            if future.cancelled():
+                return
+            thumbnail = future.result() if future.exception() is None else None
+            if thumbnail is not None:
+                self._thumbnails[image_file] = thumbnail
+                while len(self._thumbnails) > self.max_thumbnails:
+                    self._thumbnails.popitem(last=False)
+        loaded_handler(image_file, thumbnail)
@@ -1,18 +1,21 @@
 import os.path
 from colorsys import hsv_to_rgb
 
-from numpy import ndarray
-from PyQt6.QtGui import QPixmap, QImage
+from numpy import ndarray, array, uint8
 
 
-def q_pixmap_from_cv_img(cv_img: ndarray) -> QPixmap:
-    """Convert numpy.ndarray to QPixmap
-    :arg cv_img: cv2 image (numpy.ndarray) in BGR format
-    :returns: PyQt6 QPixmap"""
-    height, width, channel = cv_img.shape
-    bytes_per_line = 3 * width
-    q_image = QImage(cv_img.data, width, height, bytes_per_line, QImage.Format.Format_BGR888)
-    return QPixmap.fromImage(q_image)
+def fit_image_size(image_width: int, image_height: int, max_width: int, max_height: int) -> tuple[int, int]:
+    """Calculates the size of the image shrunk to fit inside max_width x max_height, keeping the aspect ratio
+    :returns: (width, height)"""
+    if image_height > max_height:
+        image_width = int(image_width / (image_height / max_height))
+        image_height = max_height
+
+    if image_width > max_width:
+        image_height = int(image_height / (image_width / max_width))
+        image_width = max_width
+
+    return image_width, image_height
 
 
 def notfound(string: str, not_val: str) -> int:
@@ -57,6 +60,14 @@ def rgb_from_scale(value: int, scale: int, s: float = 0.95, v: float = 1):
     return [int(col * 255) for col in rgb_normalized]
 
 
+def class_colour_table(class_numbers: list[str]) -> ndarray:
+    """Precomputes the colours of all classes, the same as rgb_from_scale gives for every class number
+    :returns: (max class number + 1, 3) uint8 array of BGR colours, indexed by class number"""
+    max_class_number = max_string(class_numbers)
+    return array([rgb_to_bgr(rgb_from_scale(class_number, max_class_number))
+                  for class_number in range(max_class_number + 1)], dtype=uint8)
+
+
 def directory_checkout(directory: str):
     """Checks if directory exists and empties it, if it doesn't, creates it"""
     if os.path.isdir(directory):
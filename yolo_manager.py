@@ -0,0 +1,328 @@
+"""Headless command-line interface of YOLO Manager, usable without a display:
+
+    python -m yolo_manager validate|split|remap|autolabel|stats|duplicates|disagreements DATASET ...
+
+Qt is never imported, torch/yolov5 only by the autolabel subcommand and by disagreements when it is given a MODEL."""
+import argparse
+import json
+import os
+import sys
+
+from class_remapper import remap_dataset, resume_remap, rollback_remap, read_remap_journal
+from dataset_index import DatasetIndex
+from dataset_scanner import label_name_for_image
+from disagreement import ModelPredictions, collect_predictions, rank_disagreements
+from duplicate_finder import find_duplicates, leaking_clusters
+from label_cache import load_label_cache
+from dataset_tools import dataset_checkout, get_available_classes_and_yaml, prepare_dataset_for_training, \
+    read_yaml_classes, remap_yaml_contents
+
+
+def print_progress(done: int, total: int):
+    """Keeps the progress in a single line of stderr"""
+    print(f"\r{done} / {total}", end="\n" if done == total else "", file=sys.stderr, flush=True)
+
+
+def read_dataset_classes(dataset_path: str, dataset_index: DatasetIndex = None) -> tuple[str | None, dict]:
+    """:returns: (yaml file name or None, {class number: class name})"""
+    yaml_path, available_classes = get_available_classes_and_yaml(dataset_path, dataset_index)
+    if yaml_path is not None:
+        available_classes = read_yaml_classes(os.path.join(dataset_path, yaml_path))
+    return yaml_path, available_classes
+
+
+def validate(args) -> int:
+    valid, findings = dataset_checkout(args.dataset, args.workers, progress_handler=print_progress,
+                                       use_cache=not args.no_cache)
+    if args.json:
+        print(json.dumps([finding._asdict() for finding in findings], indent=2))
+    else:
+        for finding in findings:
+            print(f"{finding.file}:{finding.line_number}: {finding.kind}")
+        print(f"{len(findings)} problems found" if findings else "The dataset is valid")
+    return 0 if valid else 1
+
+
+def split(args) -> int:
+    dataset_index = DatasetIndex(args.dataset)
+    try:
+        dataset_index.update()
+        yaml_path, _ = get_available_classes_and_yaml(args.dataset, dataset_index)
+        if yaml_path is None:
+            print("A .yaml file with the train: and val: paths is needed to split the dataset", file=sys.stderr)
+            return 1
+        try:
+            progress = prepare_dataset_for_training(
+                args.dataset, args.training_directory, yaml_path, args.train_prop, args.workers or 16,
+                link_files=not args.copy, dataset_index=dataset_index, seed=args.seed,
+                duplicate_distance=args.keep_duplicates,
+                progress_handler=lambda copy_progress: print_progress(copy_progress.files_done,
+                                                                      copy_progress.files_total))
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+    finally:
+        dataset_index.close()
+
+    print(f"{progress.files_done} files in {progress.elapsed:.1f} s ({progress.files_per_second:.0f} files/s)")
+    return 0
+
+
+def remap(args) -> int:
+    if args.resume or args.rollback:
+        if read_remap_journal(args.dataset) is None:
+            print("The dataset has no unfinished remap", file=sys.stderr)
+            return 1
+        if args.rollback:
+            rollback_remap(args.dataset)
+            print("The original labels are restored")
+            return 0
+        report = resume_remap(args.dataset, args.workers, progress_handler=print_progress)
+    else:
+        if not args.mapping:
+            print("No class mappings given", file=sys.stderr)
+            return 1
+        try:
+            class_numbers = dict(mapping.split("=", 1) for mapping in args.mapping)
+        except ValueError:
+            print("Class mappings have to be given as OLD=NEW", file=sys.stderr)
+            return 1
+
+        dataset_index = DatasetIndex(args.dataset)
+        try:
+            dataset_index.update()
+            label_files = list(dataset_index.label_files)
+            yaml_path, _ = get_available_classes_and_yaml(args.dataset, dataset_index)
+        finally:
+            dataset_index.close()
+
+        replaced_files = dict()
+        if yaml_path is not None:
+            with open(os.path.join(args.dataset, yaml_path), "r") as yaml_reader:
+                replaced_files[yaml_path] = remap_yaml_contents(yaml_reader.readlines(), class_numbers)
+        try:
+            report = remap_dataset(args.dataset, label_files, class_numbers, dry_run=args.dry_run,
+                                   replaced_files=replaced_files, workers=args.workers,
+                                   progress_handler=print_progress)
+        except (ValueError, RuntimeError) as error:
+            print(error, file=sys.stderr)
+            return 1
+
+    print(f"{report.changed_files} of {report.files} label files {'would change' if args.dry_run else 'changed'}")
+    for class_id, count in sorted(report.class_counts.items()):
+        print(f"class {class_id}: {count} labels")
+    for class_id, count in sorted(report.unmapped_counts.items()):
+        print(f"class {class_id} (not mapped, kept): {count} labels")
+    return 0
+
+
+def autolabel(args) -> int:
+    # Importing the model pulls in torch, which is only needed here
+    import cv2
+    from fine_tuner import FineTuner
+    from label_tools import store_from_yolo_v5, yolo_v5_from_store
+
+    dataset_index = DatasetIndex(args.dataset)
+    try:
+        dataset_index.update()
+        _, available_classes = read_dataset_classes(args.dataset, dataset_index)
+        image_files = list(dataset_index.image_files)
+        label_files = {image: dataset_index.label_for_image(image) for image in image_files}
+    finally:
+        dataset_index.close()
+
+    if args.average:
+        image_files = [image for image in image_files if label_files[image] is not None]
+    elif not args.overwrite:
+        image_files = [image for image in image_files if label_files[image] is None]
+
+    fine_tuner = FineTuner()
+    fine_tuner.set_model(args.model)
+
+    def read_images():
+        for image in image_files:
+            yield cv2.imread(os.path.join(args.dataset, image))
+
+    def read_images_and_labels():
+        for image in image_files:
+            with open(os.path.join(args.dataset, label_files[image]), "r") as label_reader:
+                labels = store_from_yolo_v5(label_reader.read(), available_classes)
+            yield cv2.imread(os.path.join(args.dataset, image)), labels
+
+    if args.average:
+        results = fine_tuner.average_detections_batch(read_images_and_labels(), args.score_threshold,
+                                                      args.iou_threshold, args.batch_size)
+    else:
+        results = fine_tuner.detect_batch(read_images(), available_classes, args.score_threshold, args.batch_size)
+
+    for done, (image, labels) in enumerate(zip(image_files, results), 1):
+        label_file = label_files[image] or label_name_for_image(image)
+        label_path = os.path.join(args.dataset, label_file)
+        os.makedirs(os.path.dirname(label_path), exist_ok=True)
+        with open(label_path, "w") as label_writer:
+            label_writer.writelines(yolo_v5_from_store(labels))
+        print_progress(done, len(image_files))
+
+    print(f"{len(image_files)} images labelled")
+    return 0
+
+
+def stats(args) -> int:
+    dataset_index = DatasetIndex(args.dataset)
+    try:
+        dataset_index.update()
+        _, available_classes = read_dataset_classes(args.dataset, dataset_index)
+        unlabelled_images = sum(dataset_index.label_for_image(image) is None for image in dataset_index.image_files)
+        dataset_stats = {
+            "images": len(dataset_index.image_files),
+            "label_files": len(dataset_index.label_files),
+            "unlabelled_images": unlabelled_images,
+            "classes": {available_classes.get(str(class_id), str(class_id)): count
+                        for class_id, count in sorted(dataset_index.class_counts().items())}
+        }
+    finally:
+        dataset_index.close()
+
+    if args.json:
+        print(json.dumps(dataset_stats, indent=2))
+    else:
+        print(f"Images: {dataset_stats['images']}")
+        print(f"Label files: {dataset_stats['label_files']}")
+        print(f"Images without labels: {dataset_stats['unlabelled_images']}")
+        for class_name, count in dataset_stats["classes"].items():
+            print(f"{class_name}: {count} labels")
+    return 0
+
+
+def duplicates(args) -> int:
+    clusters = find_duplicates(args.dataset, max_distance=args.distance, workers=args.workers,
+                               progress_handler=print_progress, use_cache=not args.no_cache)
+    leaks = leaking_clusters(clusters)
+    if args.json:
+        print(json.dumps({"clusters": clusters, "leaking_clusters": leaks}, indent=2))
+    else:
+        leak_set = {tuple(cluster) for cluster in leaks}
+        for cluster in clusters:
+            print(("[train/val leak] " if tuple(cluster) in leak_set else "") + ", ".join(cluster))
+        print(f"{len(clusters)} clusters of duplicates, {sum(len(cluster) for cluster in clusters)} images, "
+              f"{len(leaks)} clusters in more than one split")
+    return 1 if leaks else 0
+
+
+def disagreements(args) -> int:
+    dataset_index = DatasetIndex(args.dataset)
+    try:
+        dataset_index.update()
+        image_labels = {image: dataset_index.label_for_image(image) for image in dataset_index.image_files}
+    finally:
+        dataset_index.close()
+
+    if args.model is not None:
+        # Importing the model pulls in torch, which is only needed here
+        from fine_tuner import FineTuner
+
+        fine_tuner = FineTuner()
+        fine_tuner.set_model(args.model)
+        predictions = collect_predictions(fine_tuner, args.dataset, list(image_labels), batch_size=args.batch_size,
+                                          progress_handler=print_progress)
+    else:
+        predictions = ModelPredictions.load(args.dataset)
+        if predictions is None:
+            print("No saved predictions, give the model to run it over the dataset", file=sys.stderr)
+            return 1
+
+    ranking = rank_disagreements(predictions, load_label_cache(args.dataset), image_labels, args.score_threshold,
+                                 args.match_iou, args.good_iou)[:args.top]
+    if args.json:
+        print(json.dumps([disagreement._asdict() for disagreement in ranking], indent=2))
+    else:
+        for disagreement in ranking:
+            print(f"{disagreement.score:g} {disagreement.image}: {disagreement.missed} missed, "
+                  f"{disagreement.extra} extra, {disagreement.class_mismatches} class mismatches, "
+                  f"{disagreement.low_iou} low IOU (mean IOU {disagreement.mean_iou:.2f})")
+    return 0
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="yolo_manager", description="Manage YOLO datasets without the UI")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    validate_parser = subparsers.add_parser("validate", help="look for invalid label files")
+    validate_parser.add_argument("dataset")
+    validate_parser.add_argument("--workers", type=int, default=None)
+    validate_parser.add_argument("--no-cache", action="store_true", help="validate every file again")
+    validate_parser.add_argument("--json", action="store_true")
+    validate_parser.set_defaults(handler=validate)
+
+    split_parser = subparsers.add_parser("split", help="divide the dataset into train and val directories")
+    split_parser.add_argument("dataset")
+    split_parser.add_argument("training_directory")
+    split_parser.add_argument("--train-prop", type=float, default=0.8)
+    split_parser.add_argument("--workers", type=int, default=None)
+    split_parser.add_argument("--copy", action="store_true", help="copy the files instead of linking them")
+    split_parser.add_argument("--seed", type=int, default=0, help="the same seed gives the same split")
+    split_parser.add_argument("--keep-duplicates", type=int, nargs="?", const=4, default=None, metavar="DISTANCE",
+                              help="keep images whose hashes differ in at most DISTANCE bits (4) in the same split")
+    split_parser.set_defaults(handler=split)
+
+    remap_parser = subparsers.add_parser("remap", help="change class numbers in the labels and the .yaml file")
+    remap_parser.add_argument("dataset")
+    remap_parser.add_argument("mapping", nargs="*", help="OLD=NEW class numbers")
+    remap_parser.add_argument("--dry-run", action="store_true", help="only count the labels that would change")
+    remap_parser.add_argument("--resume", action="store_true", help="finish an interrupted remap")
+    remap_parser.add_argument("--rollback", action="store_true", help="undo an interrupted remap")
+    remap_parser.add_argument("--workers", type=int, default=None)
+    remap_parser.set_defaults(handler=remap)
+
+    autolabel_parser = subparsers.add_parser("autolabel", help="label the images with a YOLOv5 model")
+    autolabel_parser.add_argument("dataset")
+    autolabel_parser.add_argument("model", help="path of the YOLOv5 model")
+    autolabel_parser.add_argument("--overwrite", action="store_true", help="label the labelled images again")
+    autolabel_parser.add_argument("--average", action="store_true",
+                                  help="average the existing labels with the detections instead")
+    autolabel_parser.add_argument("--score-threshold", type=float, default=0.9)
+    autolabel_parser.add_argument("--iou-threshold", type=float, default=0.9)
+    autolabel_parser.add_argument("--batch-size", type=int, default=16)
+    autolabel_parser.set_defaults(handler=autolabel)
+
+    stats_parser = subparsers.add_parser("stats", help="count the images and the labels of every class")
+    stats_parser.add_argument("dataset")
+    stats_parser.add_argument("--json", action="store_true")
+    stats_parser.set_defaults(handler=stats)
+
+    duplicates_parser = subparsers.add_parser("duplicates", help="find near-duplicate images and train/val leaks")
+    duplicates_parser.add_argument("dataset")
+    duplicates_parser.add_argument("--distance", type=int, default=4,
+                                   help="most differing bits of the perceptual hashes of duplicates")
+    duplicates_parser.add_argument("--workers", type=int, default=None)
+    duplicates_parser.add_argument("--no-cache", action="store_true", help="hash every image again")
+    duplicates_parser.add_argument("--json", action="store_true")
+    duplicates_parser.set_defaults(handler=duplicates)
+
+    disagreements_parser = subparsers.add_parser("disagreements",
+                                                 help="rank the images by the disagreement of labels and model")
+    disagreements_parser.add_argument("dataset")
+    disagreements_parser.add_argument("model", nargs="?",
+                                      help="path of the YOLOv5 model, the saved predictions are ranked without it")
+    disagreements_parser.add_argument("--score-threshold", type=float, default=0.5)
+    disagreements_parser.add_argument("--match-iou", type=float, default=0.5,
+                                      help="lowest IOU of a label and a detection of the same object")
+    disagreements_parser.add_argument("--good-iou", type=float, default=0.75,
+                                      help="matches below this IOU count as disagreements")
+    disagreements_parser.add_argument("--top", type=int, default=50, help="number of images shown")
+    disagreements_parser.add_argument("--batch-size", type=int, default=16)
+    disagreements_parser.add_argument("--json", action="store_true")
+    disagreements_parser.set_defaults(handler=disagreements)
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    args = create_parser().parse_args(argv)
+    if not os.path.isdir(args.dataset):
+        print(f"{args.dataset} is not a directory", file=sys.stderr)
+        return 1
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())